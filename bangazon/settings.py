@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 from django.core.management.utils import get_random_secret_key
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -56,6 +57,8 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'bangazonapi.metrics.MetricsMiddleware',
+    'bangazonapi.profiling.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -103,9 +106,33 @@ DATABASES = {
 
     }
 }
+
+if os.getenv("DATABASE_URL"):
+    import dj_database_url
+
+    DATABASES['default'] = dj_database_url.parse(os.getenv("DATABASE_URL"))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 
+# Caches
+# `responses` holds rendered JSON for anonymous catalog reads, see bangazonapi/cache.py
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bangazon-responses',
+        'TIMEOUT': int(os.getenv("RESPONSE_CACHE_TTL", "300")),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000")),
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -137,3 +164,75 @@ APPEND_SLASH = False
 
 MEDIA_ROOT = 'media'
 MEDIA_URL = '/media/'
+PRODUCT_IMAGE_MAX_BYTES = int(os.getenv("PRODUCT_IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))
+# Processes resizing uploaded images, 0 leaves it to `manage.py generate_image_derivatives`
+IMAGE_DERIVATIVE_WORKERS = int(os.getenv("IMAGE_DERIVATIVE_WORKERS", "2"))
+# Products inserted per transaction by POST /products/bulk
+PRODUCT_BULK_BATCH_SIZE = 1000
+
+# Stock held for items in carts, see bangazonapi/models/reservation.py
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", str(15 * 60)))
+# Seconds between sweeps of expired holds in each web worker, 0 disables the sweeper
+RESERVATION_SWEEP_INTERVAL = int(os.getenv("RESERVATION_SWEEP_INTERVAL", "60"))
+RESERVATION_SWEEP_BATCH_SIZE = 500
+
+# Open orders idle this long are removed by `manage.py sweep_abandoned_carts`
+ABANDONED_CART_MAX_AGE_DAYS = int(os.getenv("ABANDONED_CART_MAX_AGE_DAYS", "30"))
+ABANDONED_CART_BATCH_SIZE = 200
+ABANDONED_CART_ARCHIVE = os.getenv("ABANDONED_CART_ARCHIVE", "0") == "1"
+# Seconds between sweeps in each web worker, 0 leaves sweeping to the command
+ABANDONED_CART_SWEEP_INTERVAL = int(os.getenv("ABANDONED_CART_SWEEP_INTERVAL", "0"))
+
+# Server-Timing header with auth, view, db, serializer and render times, see bangazonapi/profiling.py
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+# Share of requests run under cProfile, and the X-Profile header value that profiles one request
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+
+# Per-route latency, query count and response size histograms served at /metrics, see bangazonapi/metrics.py
+METRICS = os.getenv("METRICS", "0") == "1"
+# Each worker process writes its samples to a file here, and /metrics sums all of them. Must be host-local.
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "bangazon-metrics"))
+# /metrics answers staff users, and scrapers sending `Authorization: Bearer <token>` when this is set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Statements slower than this many ms are logged with their plan, see bangazonapi/slowqueries.py (0 turns it off)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# Seconds before the same slow statement fingerprint is explained again
+SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", os.path.join(BASE_DIR, "logs", "slow_queries.log"))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'bangazonapi.slowqueries.JSONFormatter'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'bangazonapi.slowqueries.LogFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'formatter': 'json',
+        },
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'bangazonapi.slowqueries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        # Full Server-Timing of streamed responses, logged once they are sent
+        'bangazonapi.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
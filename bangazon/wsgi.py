@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bangazon.settings')
 
 application = get_wsgi_application()
+
+# pylint: disable=wrong-import-position
+from bangazonapi import carts, reservations
+
+reservations.start_sweeper()
+carts.start_sweeper()
@@ -3,3 +3,12 @@ from django.apps import AppConfig
 
 class BangazonapiConfig(AppConfig):
     name = 'bangazonapi'
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel,unused-import
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+        from . import signals, slowqueries
+
+        post_migrate.connect(signals.install_search_index, sender=self)
+        connection_created.connect(slowqueries.install)
@@ -0,0 +1,458 @@
+"""HTTP load benchmark replaying the Postman collection
+
+Scenarios are weighted sequences of requests from
+`Bangazon Python API.postman_collection.json`, looked up by their
+Postman name. Requests the collection does not have yet (search, bulk
+cart updates, checkout) are listed in `EXTRA_REQUESTS` in the same
+shape. Ids in a request are swapped for ones from the database before
+it is sent:
+
+* a number in the path after `products`, `orders` or `lineitems`
+* a `product_id`, `payment_type` or `recipient` value in the body
+
+Each virtual user is a generated customer with a token and a payment
+type (see `generate_dataset`). It repeatedly picks a scenario by weight
+and runs its steps in order. Workers are threads driving one of two
+targets:
+
+* `InProcessTarget` calls the WSGI app through Django's test client
+  and counts the queries of every request.
+* `HTTPTarget` sends real requests to a running server. It has no
+  query counts, and the server must use the same database as the
+  runner so the tokens and ids are valid.
+
+Results are grouped by route, the path with ids replaced by `:id`.
+`summarize` reports p50/p95/p99 latency, requests per second and
+queries per request for each route. `compare` diffs a run against a
+saved baseline.
+"""
+
+import contextlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from dataclasses import dataclass, field
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from bangazonapi.models import Payment, Product
+
+COLLECTION = os.path.join(settings.BASE_DIR, "Bangazon Python API.postman_collection.json")
+
+PATH_IDS = {"products": "product", "orders": "order", "lineitems": "line_item"}
+BODY_IDS = {"product_id": "product", "payment_type": "payment", "recipient": "customer"}
+
+
+@dataclass
+class Call:
+    """One request template"""
+
+    method: str
+    path: str
+    query: dict = field(default_factory=dict)
+    body: object = None
+
+
+EXTRA_REQUESTS = {
+    "Search products": Call("GET", "/products", {"q": "kite"}),
+    "Set cart items": Call("POST", "/cart/items", body=[{"product_id": 1, "quantity": 2}]),
+    "Cart summary": Call("GET", "/cart/summary"),
+    "Checkout": Call("PUT", "/orders/1", body={"payment_type": 1}),
+}
+
+SEARCH_TERMS = ("kite", "lamp", "red", "steel", "camera", "portable", "tent", "watch")
+
+# name: (weight, steps). A step is a request name, or (request name,
+# {context key: response key}) to remember a value from the response.
+SCENARIOS = {
+    "browse": (40, (
+        "First 20 products sorted by price",
+        "Get product 50",
+        "Get product 50",
+    )),
+    "search": (20, ("Search products", "Get product 50")),
+    "add_to_cart": (20, ("Get product 50", "Add item to cart", "Cart summary")),
+    "checkout": (5, (
+        "Set cart items",
+        ("Shopping cart", {"order": "id"}),
+        "Checkout",
+    )),
+    "profile": (15, ("User profile", "Favorited sellers", "Get all payment types")),
+}
+
+
+def load_collection(path=COLLECTION):
+    """Request templates keyed by Postman name, plus EXTRA_REQUESTS
+
+    Returns:
+        dict -- Call keyed by request name
+    """
+    with open(path) as collection:
+        items = json.load(collection)["item"]
+
+    calls = {}
+    while items:
+        item = items.pop(0)
+        if "item" in item:
+            items.extend(item["item"])
+            continue
+        request = item["request"]
+        url = request["url"]
+        raw = request.get("body", {}).get("raw") or ""
+        try:
+            body = json.loads(raw) if raw.strip() else None
+        except ValueError:
+            body = None
+        calls[item["name"]] = Call(
+            method=request["method"],
+            path="/" + "/".join(url.get("path", [])),
+            query={
+                pair["key"]: pair["value"]
+                for pair in url.get("query", [])
+                if pair.get("key") and not pair.get("disabled")
+            },
+            body=body,
+        )
+    calls.update(EXTRA_REQUESTS)
+    return calls
+
+
+def route(path):
+    """Path with numeric segments replaced by :id, the key results are grouped by"""
+    return "/".join(":id" if segment.isdigit() else segment for segment in path.split("/"))
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    # Rounded first so float noise such as 7.000000000000001 does not skip a rank
+    rank = max(math.ceil(round(pct / 100 * len(ordered), 9)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class VirtualUser:
+    """One shopper's token, ids and scenario state"""
+
+    def __init__(self, token, customer_id, payment_id, products, rng):
+        self.token = token
+        self.random = rng
+        self.products = products
+        self.context = {"customer": customer_id, "payment": payment_id}
+
+    def fill(self, call):
+        """Copy of a Call with its ids swapped for this shopper's
+
+        Returns:
+            Call -- The request to send, None when an id it needs is unknown
+        """
+        self.context["product"] = self.random.choice(self.products)
+
+        segments = call.path.split("/")
+        for index, segment in enumerate(segments):
+            if index and segment.isdigit():
+                key = PATH_IDS.get(segments[index - 1])
+                if key not in self.context:
+                    # e.g. checkout after the shopper's cart could not be read
+                    return None
+                segments[index] = str(self.context[key])
+
+        query = dict(call.query)
+        if "q" in query:
+            query["q"] = self.random.choice(SEARCH_TERMS)
+
+        return Call(call.method, "/".join(segments), query, self._fill_body(call.body))
+
+    def _fill_body(self, body):
+        if isinstance(body, list):
+            return [self._fill_body(item) for item in body]
+        if isinstance(body, dict):
+            return {
+                key: self.context.get(BODY_IDS.get(key), value)
+                for key, value in body.items()
+            }
+        return body
+
+
+class InProcessTarget:
+    """Calls the WSGI app in this process and counts queries per request"""
+
+    name = "in-process"
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def session(self):
+        """Accept the test client's host name for the length of the run"""
+        return override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"])
+
+    def send(self, call, token):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = Client(raise_request_exception=False)
+
+        path = call.path
+        if call.query:
+            path += "?" + urllib.parse.urlencode(call.query)
+        headers = {"HTTP_AUTHORIZATION": f"Token {token}"}
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, call.method.lower())(
+                path,
+                data=json.dumps(call.body) if call.body is not None else None,
+                content_type="application/json",
+                **headers,
+            )
+        try:
+            data = json.loads(response.content) if response.content else None
+        except ValueError:
+            data = None
+        return response.status_code, data, len(queries)
+
+    def close(self):
+        connection.close()
+
+
+class HTTPTarget:
+    """Sends requests to a running server"""
+
+    def __init__(self, base_url, timeout=30):
+        self.name = base_url
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def session(self):
+        return contextlib.nullcontext()
+
+    def send(self, call, token):
+        url = self.base_url + call.path
+        if call.query:
+            url += "?" + urllib.parse.urlencode(call.query)
+        request = urllib.request.Request(
+            url,
+            method=call.method,
+            data=json.dumps(call.body).encode() if call.body is not None else None,
+            headers={
+                "Authorization": f"Token {token}",
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as ex:
+            status, content = ex.code, ex.read()
+        try:
+            data = json.loads(content) if content else None
+        except ValueError:
+            data = None
+        return status, data, None
+
+    def close(self):
+        connection.close()
+
+
+@dataclass
+class Sample:
+    route: str
+    method: str
+    status: int
+    elapsed: float
+    queries: int = None
+
+
+class Benchmark:
+    """Drive the scenarios from `concurrency` threads
+
+    Arguments:
+        target {InProcessTarget|HTTPTarget} -- Where requests go
+        duration {float} -- Seconds to run, unless `iterations` is given
+        iterations {int} -- Scenarios each worker runs, overrides duration
+    """
+
+    def __init__(self, target, concurrency=4, duration=30, iterations=None,
+                 scenarios=None, calls=None, seed=0, warmup=0):
+        self.target = target
+        self.concurrency = concurrency
+        self.duration = duration
+        self.iterations = iterations
+        self.scenarios = scenarios or SCENARIOS
+        self.calls = calls or load_collection()
+        self.random = random.Random(seed)
+        self.warmup = warmup
+        self.samples = []
+        self.lock = threading.Lock()
+
+        missing = {
+            step if isinstance(step, str) else step[0]
+            for _, steps in self.scenarios.values()
+            for step in steps
+        } - set(self.calls)
+        if missing:
+            raise ValueError(f"Unknown requests in scenarios: {', '.join(sorted(missing))}")
+
+    def shoppers(self):
+        """Virtual users built from customers that have a token and a payment type"""
+        shoppers = list(
+            Payment.objects.filter(customer__user__auth_token__isnull=False)
+            .order_by("customer_id")
+            .values_list("customer__user__auth_token__key", "customer_id", "id")
+            .distinct()[: self.concurrency * 50]
+        )
+        products = list(Product.objects.order_by("?").values_list("id", flat=True)[:10000])
+        if not shoppers or not products:
+            raise ValueError("No customers with tokens and payment types, or no products. "
+                             "Run generate_dataset first")
+        return shoppers, products
+
+    def run(self):
+        """Run every worker to completion
+
+        Returns:
+            dict -- summarize() of the measured samples
+        """
+        shoppers, products = self.shoppers()
+        names = list(self.scenarios)
+        weights = [self.scenarios[name][0] for name in names]
+        workers = [
+            threading.Thread(
+                target=self.worker,
+                args=(shoppers, products, names, weights, random.Random(self.random.random())),
+                daemon=True,
+            )
+            for _ in range(self.concurrency)
+        ]
+
+        self.started = time.monotonic()
+        self.measure_from = self.started + (self.warmup if self.iterations is None else 0)
+        self.deadline = self.measure_from + self.duration
+        with self.target.session():
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        elapsed = time.monotonic() - max(self.measure_from, self.started)
+
+        return summarize(self.samples, elapsed, {
+            "target": self.target.name,
+            "concurrency": self.concurrency,
+            "duration": round(elapsed, 3),
+            "scenarios": {name: weight for name, weight in zip(names, weights)},
+        })
+
+    def worker(self, shoppers, products, names, weights, rng):
+        samples = []
+        try:
+            iteration = 0
+            while True:
+                if self.iterations is not None:
+                    if iteration >= self.iterations:
+                        break
+                elif time.monotonic() >= self.deadline:
+                    break
+                iteration += 1
+
+                token, customer_id, payment_id = rng.choice(shoppers)
+                shopper = VirtualUser(token, customer_id, payment_id, products, rng)
+                scenario = rng.choices(names, weights)[0]
+                for step in self.scenarios[scenario][1]:
+                    name, remember = (step, {}) if isinstance(step, str) else step
+                    call = shopper.fill(self.calls[name])
+                    if call is None:
+                        continue
+
+                    started = time.monotonic()
+                    try:
+                        status, data, queries = self.target.send(call, token)
+                    except Exception:
+                        status, data, queries = 0, None, None
+                    finished = time.monotonic()
+
+                    if started >= self.measure_from:
+                        samples.append(Sample(route(call.path), call.method, status,
+                                              finished - started, queries))
+                    for key, field_name in remember.items():
+                        if isinstance(data, dict) and field_name in data:
+                            shopper.context[key] = data[field_name]
+        finally:
+            self.target.close()
+            with self.lock:
+                self.samples.extend(samples)
+
+
+def summarize(samples, elapsed, meta=None):
+    """Latency, throughput and query statistics per route
+
+    Returns:
+        dict -- {"meta", "total", "endpoints"}, latencies in milliseconds
+    """
+    grouped = defaultdict(list)
+    for sample in samples:
+        grouped[f"{sample.method} {sample.route}"].append(sample)
+
+    def stats(group):
+        latencies = sorted(sample.elapsed * 1000 for sample in group)
+        queries = [sample.queries for sample in group if sample.queries is not None]
+        statuses = defaultdict(int)
+        for sample in group:
+            statuses[str(sample.status)] += 1
+        return {
+            "requests": len(group),
+            "errors": sum(1 for sample in group if not 200 <= sample.status < 400),
+            "statuses": dict(sorted(statuses.items())),
+            "rps": round(len(group) / elapsed, 2) if elapsed else None,
+            "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "p50_ms": round(percentile(latencies, 50), 3) if latencies else None,
+            "p95_ms": round(percentile(latencies, 95), 3) if latencies else None,
+            "p99_ms": round(percentile(latencies, 99), 3) if latencies else None,
+            "queries_mean": round(sum(queries) / len(queries), 2) if queries else None,
+            "queries_max": max(queries) if queries else None,
+        }
+
+    return {
+        "meta": meta or {},
+        "total": stats(samples),
+        "endpoints": {key: stats(group) for key, group in sorted(grouped.items())},
+    }
+
+
+def compare(current, baseline, tolerance=0.1):
+    """Per route differences against a baseline run
+
+    A route regresses when its p95 latency grows, or its throughput drops,
+    by more than `tolerance`, or when it runs more queries at most.
+
+    Returns:
+        list -- {"endpoint", "metric", "baseline", "current", "change", "regression"} rows
+    """
+    rows = []
+    for endpoint, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if before is None:
+            continue
+        for metric, worse in (("p95_ms", 1), ("p99_ms", 1), ("rps", -1), ("queries_max", 1)):
+            old, new = before.get(metric), now.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0
+            if metric == "queries_max":
+                regression = new > old
+            else:
+                regression = change * worse > tolerance
+            rows.append({
+                "endpoint": endpoint,
+                "metric": metric,
+                "baseline": old,
+                "current": new,
+                "change": round(change, 4),
+                "regression": regression,
+            })
+    return rows
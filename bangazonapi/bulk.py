@@ -0,0 +1,156 @@
+"""Bulk product import for sellers loading whole catalogs
+
+Rows are validated with `ProductSerializer` and inserted with
+`bulk_create`, one transaction per batch, so an import costs a handful of
+queries per thousand products instead of several per product. A bad row
+is reported by its position and does not stop the rest of the import.
+
+`bulk_create` sends no model signals, so the search index and the
+product cache version are updated here for each batch.
+"""
+
+import json
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from bangazonapi import search
+from bangazonapi.models import ModelVersion, Product, ProductCategory
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+PRODUCT_FIELDS = ("name", "price", "description", "quantity", "location")
+
+
+def default_batch_size():
+    return getattr(settings, "PRODUCT_BULK_BATCH_SIZE", 1000)
+
+
+class NDJSONParser(BaseParser):
+    """Parse newline delimited JSON lazily, one value per line
+
+    `request.data` is a generator that reads the body as it is consumed.
+    A line that is not valid JSON is yielded as a ParseError so the
+    importer can report it against its row.
+    """
+
+    media_type = NDJSON_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        return self._lines(stream, encoding)
+
+    @staticmethod
+    def _lines(stream, encoding):
+        for line in stream:
+            line = line.decode(encoding).strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as ex:
+                yield ParseError(f"Invalid JSON: {ex}")
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ProductImporter:
+    """Validate and insert product rows for one seller
+
+    Arguments:
+        customer {Customer} -- Seller who owns every imported product
+        validator {Serializer} -- ProductSerializer instance used to validate each row
+    """
+
+    def __init__(self, customer, validator, batch_size=None):
+        self.customer = customer
+        self.validator = validator
+        self.batch_size = batch_size or default_batch_size()
+        self.categories = {}
+        self.created = []
+        self.errors = []
+
+    def run(self, rows):
+        """Import an iterable of row dicts
+
+        Returns:
+            ProductImporter -- self, with `created` ids and per-row `errors`
+        """
+        offset = 0
+        for batch in _batches(rows, self.batch_size):
+            self._import_batch(batch, offset)
+            offset += len(batch)
+        return self
+
+    def _resolve_categories(self, batch):
+        wanted = set()
+        for row in batch:
+            if isinstance(row, dict):
+                try:
+                    wanted.add(int(row.get("category_id")))
+                except (TypeError, ValueError):
+                    pass
+        missing = wanted.difference(self.categories)
+        if missing:
+            self.categories.update(ProductCategory.objects.in_bulk(missing))
+
+    def _validate(self, row):
+        if isinstance(row, ParseError):
+            raise serializers.ValidationError({"non_field_errors": [row.detail]})
+        if not isinstance(row, dict):
+            raise serializers.ValidationError(
+                {"non_field_errors": ["Expected a JSON object"]}
+            )
+
+        errors = {}
+        data = None
+        try:
+            data = self.validator.run_validation(
+                {field: row[field] for field in PRODUCT_FIELDS if field in row}
+            )
+        except serializers.ValidationError as ex:
+            errors.update(ex.detail)
+
+        category = None
+        try:
+            category = self.categories[int(row.get("category_id"))]
+        except (KeyError, TypeError, ValueError):
+            errors["category_id"] = ["Invalid category"]
+
+        if errors:
+            raise serializers.ValidationError(errors)
+        return data, category
+
+    def _import_batch(self, batch, offset):
+        self._resolve_categories(batch)
+
+        products = []
+        for index, row in enumerate(batch, start=offset):
+            try:
+                data, category = self._validate(row)
+            except serializers.ValidationError as ex:
+                self.errors.append({"row": index, "errors": ex.detail})
+                continue
+            products.append(
+                Product(customer=self.customer, category=category, **data)
+            )
+
+        if not products:
+            return
+
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            search.index_products(products)
+            ModelVersion.bump("product")
+
+        self.created.extend(product.pk for product in products)
@@ -0,0 +1,129 @@
+"""Versioned cache of rendered JSON for anonymous catalog reads
+
+Entries are stored in the `responses` cache alias (an LRU bounded LocMem
+cache with a TTL by default, see `CACHES` in settings). Every key embeds
+the current ModelVersion counters of the models the response depends on,
+so a save, soft-delete or restore makes old entries unreachable at once and
+the LRU bound evicts them later.
+"""
+
+import hashlib
+import threading
+from functools import wraps
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from bangazonapi import metrics
+from bangazonapi.models import ModelVersion
+
+CACHE_ALIAS = "responses"
+
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "stores": 0}
+_results = {"hits": "hit", "misses": "miss", "stores": "store"}
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+    metrics.CACHE.inc(result=_results[name])
+
+
+def stats():
+    """Hit and miss counters for this process
+
+    Returns:
+        dict -- hits, misses, stores and the hit ratio
+    """
+    with _lock:
+        counters = dict(_counters)
+    lookups = counters["hits"] + counters["misses"]
+    counters["hit_ratio"] = counters["hits"] / lookups if lookups else 0
+    return counters
+
+
+def reset_stats():
+    with _lock:
+        for name in _counters:
+            _counters[name] = 0
+
+
+def _request_snapshot(request, model_names):
+    memo = request.__dict__.setdefault("_model_versions", {})
+    if model_names not in memo:
+        memo[model_names] = ModelVersion.snapshot(*model_names)
+    return memo[model_names]
+
+
+def request_versions(request, *model_names):
+    """ModelVersion counters, looked up at most once per request
+
+    Returns:
+        tuple -- Versions in the same order as `model_names`
+    """
+    return _request_snapshot(request, model_names)[0]
+
+
+def request_changed_at(request, *model_names):
+    """Time of the latest ModelVersion bump, from the same lookup as request_versions
+
+    Returns:
+        datetime -- None when none of the models was ever bumped
+    """
+    return _request_snapshot(request, model_names)[1]
+
+
+def cache_key(request, versions, view_name, kwargs):
+    """Key for a request, independent of the order of its query params"""
+    params = sorted(
+        (key, sorted(values)) for key, values in request.query_params.lists()
+    )
+    raw = repr((view_name, sorted(kwargs.items()), params, versions))
+    return f"response:{view_name}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+
+def cached_response(*model_names):
+    """Cache the rendered JSON of a ViewSet GET handler for anonymous users
+
+    Arguments:
+        model_names {str} -- ModelVersion names the response depends on
+
+    Only 200 responses are stored. Authenticated requests always go to the
+    view because they may carry per-user data.
+    """
+
+    def decorator(method):
+        view_name = method.__qualname__
+
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != "GET" or request.auth is not None:
+                return method(self, request, *args, **kwargs)
+
+            cache = caches[CACHE_ALIAS]
+            versions = request_versions(request, *model_names)
+            key = cache_key(request, versions, view_name, kwargs)
+
+            content = cache.get(key)
+            if content is not None:
+                _count("hits")
+                response = HttpResponse(content, content_type="application/json")
+                response["X-Cache"] = "HIT"
+                return response
+
+            _count("misses")
+            response = method(self, request, *args, **kwargs)
+            if response.status_code != 200 or not hasattr(response, "data"):
+                return response
+
+            content = JSONRenderer().render(response.data)
+            cache.set(key, content)
+            _count("stores")
+
+            response = HttpResponse(content, content_type="application/json")
+            response["X-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,160 @@
+"""Removal of abandoned carts, open orders nobody has touched for a while
+
+Carts are removed in batches. Each batch runs in its own short
+transaction, so live cart traffic is only ever blocked for one batch.
+Before deleting, a batch re-checks that its orders are still open and
+idle, which drops a cart that was used again after it was selected.
+With `archive` the carts are copied to AbandonedCart first.
+
+`sweep_abandoned_carts` is both the body of the `sweep_abandoned_carts`
+management command and, when ABANDONED_CART_SWEEP_INTERVAL is set, of
+a periodic task started from `bangazon/wsgi.py`.
+"""
+
+import datetime
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from bangazonapi import scheduler
+from bangazonapi.models import AbandonedCart, Order, OrderProduct, Reservation
+
+
+class SweepReport:
+    """Counts and timing of one sweep"""
+
+    def __init__(self):
+        self.orders = 0
+        self.line_items = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    @property
+    def rows(self):
+        return self.orders + self.line_items
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f"Removed {self.orders} carts and {self.line_items} line items "
+            f"in {self.batches} batches, {self.seconds:.2f}s, "
+            f"{self.rows_per_second:.0f} rows/s"
+        )
+
+
+def idle_carts(max_age_days):
+    """Open orders without activity for `max_age_days`
+
+    Orders loaded from fixtures have no `updated_at`, their creation date
+    stands in for it.
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=max_age_days)
+    return Order.objects.filter(payment_type__isnull=True).filter(
+        Q(updated_at__lt=cutoff)
+        | Q(updated_at__isnull=True, created_date__lt=cutoff.date())
+    )
+
+
+def _archive(orders):
+    lines = {}
+    for order_id, product_id, quantity in OrderProduct.objects.filter(
+        order__in=[order.pk for order in orders]
+    ).values_list("order_id", "product_id", "quantity"):
+        lines.setdefault(order_id, []).append(
+            {"product_id": product_id, "quantity": quantity}
+        )
+
+    AbandonedCart.objects.bulk_create(
+        [
+            AbandonedCart(
+                order_id=order.pk,
+                customer_id=order.customer_id,
+                created_date=order.created_date,
+                last_activity=order.updated_at,
+                item_count=order.item_count,
+                subtotal=order.subtotal,
+                lines=lines.get(order.pk, []),
+            )
+            for order in orders
+        ]
+    )
+
+
+def _remove_batch(candidates, max_age_days, archive):
+    with transaction.atomic():
+        orders = idle_carts(max_age_days).filter(pk__in=candidates)
+        if connection.features.has_select_for_update_skip_locked:
+            # A cart being changed right now is left for the next sweep
+            orders = orders.select_for_update(skip_locked=True)
+        orders = list(orders)
+        if not orders:
+            return 0, 0
+
+        order_ids = [order.pk for order in orders]
+        if archive:
+            _archive(orders)
+        Reservation.objects.filter(order__in=order_ids).delete()
+        line_items = OrderProduct.objects.filter(order__in=order_ids).delete()[0]
+        Order.objects.filter(pk__in=order_ids).delete()
+        return len(order_ids), line_items
+
+
+def sweep_abandoned_carts(max_age_days=None, batch_size=None, archive=None, pause=0):
+    """Delete, or archive then delete, carts idle for more than `max_age_days`
+
+    Arguments:
+        max_age_days {int} -- Idle days before a cart is abandoned
+        batch_size {int} -- Carts per transaction
+        archive {boolean} -- Copy carts to AbandonedCart before deleting
+        pause {float} -- Seconds to sleep between batches
+
+    Returns:
+        SweepReport -- Rows removed and rows per second
+    """
+    if max_age_days is None:
+        max_age_days = getattr(settings, "ABANDONED_CART_MAX_AGE_DAYS", 30)
+    if batch_size is None:
+        batch_size = getattr(settings, "ABANDONED_CART_BATCH_SIZE", 200)
+    if archive is None:
+        archive = getattr(settings, "ABANDONED_CART_ARCHIVE", False)
+
+    report = SweepReport()
+    started = time.perf_counter()
+    last_id = 0
+
+    while True:
+        # Walk forward by primary key so carts skipped as busy are not picked again
+        candidates = list(
+            idle_carts(max_age_days)
+            .filter(pk__gt=last_id)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not candidates:
+            break
+        last_id = candidates[-1]
+
+        orders, line_items = _remove_batch(candidates, max_age_days, archive)
+        report.orders += orders
+        report.line_items += line_items
+        report.batches += 1
+
+        if pause:
+            time.sleep(pause)
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def start_sweeper():
+    """Start this process's cart sweeper when ABANDONED_CART_SWEEP_INTERVAL is set
+
+    Returns:
+        PeriodicTask -- The running sweeper, or None when disabled
+    """
+    interval = getattr(settings, "ABANDONED_CART_SWEEP_INTERVAL", 0)
+    return scheduler.schedule("abandoned-cart-sweeper", interval, sweep_abandoned_carts)
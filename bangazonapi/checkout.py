@@ -0,0 +1,73 @@
+"""Checkout: pay for an open order and take its units out of stock
+
+Stock is decremented for every line item with one conditional UPDATE,
+`quantity = quantity - n WHERE quantity >= n + held`, inside the
+transaction that attaches the payment. `held` is the units under active
+holds for other customers' carts, so a checkout never takes stock that
+someone else has in their cart. The database serializes writers on each
+product row only for the length of that statement, so concurrent
+checkouts of different products never wait on each other and two
+checkouts can never both take the last unit. If fewer rows change than
+there are line items, the decrement is undone, the transaction rolls
+back and every shortfall is reported. The number of queries does not
+depend on the number of line items.
+"""
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from bangazonapi.models import Order, OutOfStock, Product, ProductStats, Reservation
+
+
+class AlreadyPaid(Exception):
+    """Raised when the order was closed by an earlier checkout"""
+
+
+class _Shortfall(Exception):
+    """Rolls back the savepoint of a stock decrement that missed some line items"""
+
+
+def checkout(order, payment_id):
+    """Attach a payment to an open order and decrement stock for its line items
+
+    Arguments:
+        order {Order} -- Open order to close
+        payment_id {int} -- Payment type paying for it
+
+    Raises:
+        AlreadyPaid -- The order already has a payment type
+        OutOfStock -- At least one product has too few units left
+
+    Returns:
+        list -- (product_id, quantity) pairs that were taken out of stock
+    """
+    with transaction.atomic():
+        # The first write claims the order, a concurrent checkout of it matches no row
+        closed = Order.objects.filter(pk=order.pk, payment_type__isnull=True).update(
+            payment_type=payment_id
+        )
+        if not closed:
+            raise AlreadyPaid()
+
+        lines = list(
+            order.lineitems.order_by("product_id").values_list("product_id", "quantity")
+        )
+
+        product_ids = [product_id for product_id, _ in lines]
+        requested = order.lineitems.filter(product=OuterRef("pk")).values("quantity")[:1]
+        held = Reservation.held_subquery(exclude_order=order.pk)
+        try:
+            # A savepoint, so a partial decrement is undone before shortfalls are read
+            with transaction.atomic():
+                taken = Product.objects.filter(
+                    pk__in=product_ids, quantity__gte=Subquery(requested) + held
+                ).update(quantity=F("quantity") - Subquery(requested))
+                if taken != len(lines):
+                    raise _Shortfall()
+        except _Shortfall:
+            raise OutOfStock(Reservation.shortfalls(order.pk, dict(lines))) from None
+
+        ProductStats.record_sale(order)
+        # The units are gone from stock now, holding them too would count them twice
+        Reservation.release(order.pk)
+
+    return lines
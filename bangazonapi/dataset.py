@@ -0,0 +1,446 @@
+"""Seeded random data at production scale for load tests and benchmarks
+
+`DatasetGenerator` fills the database with users and their tokens,
+customers, payment types, categories, products, orders with line items,
+ratings, favorites and recommendations. The same seed and username
+prefix always produce the same rows.
+
+Users, tokens, customers and payment types go through `bulk_create`.
+Django spends about 80µs per row building model instances and compiling
+each value, which would make 10M line items take most of an hour. The
+catalog and order tables are therefore written with `copy_rows`: plain
+tuples and one prepared INSERT through `executemany`, with primary keys
+assigned here. That path is about six times faster. Each transaction
+holds `rows_per_transaction` rows, so the commit cost is amortized while
+the journal stays bounded.
+
+On SQLite, the connection skips fsync and keeps its journal in memory
+for the duration of the run. A crash mid-run can then leave a corrupt
+file, which is acceptable for a throwaway benchmark database. On
+PostgreSQL, each transaction turns off `synchronous_commit`, which risks
+only the last few commits.
+
+Product popularity follows a Zipf distribution: the product of rank r is
+picked with weight 1 / r ** skew. Ranks are shuffled so popularity does
+not follow the primary key. Line items, ratings and recommendations all
+draw from that distribution. A few products therefore carry most of the
+sales, as they do in a real catalog.
+
+Neither insert path sends model signals. After the rows are written,
+`generate` rebuilds the product counters, the search index and the
+order summaries with their management commands.
+"""
+
+import bisect
+import contextlib
+import datetime
+import io
+import itertools
+import random
+import time
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from bangazonapi.models import Customer, Favorite, Order, OrderProduct, Payment
+from bangazonapi.models import Product, ProductCategory, ProductRating, Recommendation
+
+ADJECTIVES = (
+    "Red", "Compact", "Vintage", "Wireless", "Rugged", "Deluxe", "Organic", "Smart",
+    "Classic", "Portable", "Heavy", "Silent", "Ultra", "Folding", "Bamboo", "Steel",
+)
+NOUNS = (
+    "Kite", "Lamp", "Kettle", "Backpack", "Speaker", "Chair", "Blender", "Bicycle",
+    "Tent", "Jacket", "Monitor", "Drill", "Guitar", "Watch", "Skillet", "Camera",
+)
+PHRASES = (
+    "built to last", "ships in two days", "gently used", "brand new in box",
+    "handmade locally", "comes with a warranty", "great for gifts", "limited stock",
+)
+CATEGORIES = (
+    "Sporting Goods", "Electronics", "Kitchen", "Outdoors", "Music", "Tools",
+    "Apparel", "Home", "Toys", "Automotive", "Garden", "Office",
+)
+CITIES = (
+    "Pittsburgh", "Nashville", "Portland", "Austin", "Denver", "Chicago",
+    "Boston", "Phoenix", "Atlanta", "Seattle", "Detroit", "Memphis",
+)
+MERCHANTS = ("Visa", "Mastercard", "Amex", "Discover")
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class DatasetGenerator:
+    """Write a synthetic dataset of the requested size
+
+    Arguments:
+        users {int} -- Users, each with a token, a customer and a payment type
+        products {int} -- Products, sold by the first `sellers` customers
+        orders {int} -- Orders, one open cart for every 20 and the rest paid
+        line_items {int} -- Line items spread over the orders, roughly
+        ratings {int} -- Product ratings
+        favorites {int} -- Favorite sellers
+        recommendations {int} -- Product recommendations
+    """
+
+    def __init__(
+        self,
+        users=1000,
+        products=10000,
+        orders=20000,
+        line_items=100000,
+        ratings=20000,
+        favorites=2000,
+        recommendations=2000,
+        sellers=None,
+        skew=0.9,
+        seed=0,
+        prefix="load",
+        password="bangazon",
+        batch_size=5000,
+        rows_per_transaction=100000,
+        log=None,
+    ):
+        self.counts = {
+            "users": users,
+            "products": products,
+            "orders": orders,
+            "line_items": line_items,
+            "ratings": ratings,
+            "favorites": favorites,
+            "recommendations": recommendations,
+        }
+        self.sellers = max(1, min(sellers or users // 10, users))
+        self.skew = skew
+        # Datasets appended under another prefix must not repeat token keys
+        self.random = random.Random(f"{seed}:{prefix}")
+        self.prefix = prefix
+        self.password = password
+        self.batch_size = batch_size
+        self.rows_per_transaction = rows_per_transaction
+        self.log = log or (lambda message: None)
+
+        self.now = connection.ops.adapt_datetimefield_value(timezone.now())
+        self.today = connection.ops.adapt_datefield_value(datetime.date.today())
+        self.customer_ids = []
+        self.payment_ids = []
+        self.category_ids = []
+        self.product_ids = []
+        self.order_ids = []
+        self.cumulative = []
+
+    def generate(self):
+        """Write every table, then rebuild the derived data
+
+        Returns:
+            dict -- Rows written keyed by kind
+        """
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise ValueError(f"{connection.vendor} does not return ids from bulk inserts")
+        if self.counts["users"] < 1 or self.counts["products"] < 1:
+            raise ValueError("A dataset needs at least one user and one product")
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise ValueError(f"Users named {self.prefix}* already exist, choose another prefix")
+
+        written = {}
+        with self.tuned_connection():
+            for kind, step in (
+                ("users", self.write_users),
+                ("categories", self.write_categories),
+                ("products", self.write_products),
+                ("orders", self.write_orders),
+                ("line_items", self.write_line_items),
+                ("ratings", self.write_ratings),
+                ("favorites", self.write_favorites),
+                ("recommendations", self.write_recommendations),
+            ):
+                started = time.monotonic()
+                written[kind] = step()
+                elapsed = time.monotonic() - started
+                self.log(f"{kind}: {written[kind]} rows in {elapsed:.1f}s "
+                         f"({written[kind] / max(elapsed, 1e-9):.0f} rows/s)")
+
+            started = time.monotonic()
+            call_command("rebuild_product_stats", stdout=io.StringIO())
+            call_command("rebuild_search_index", stdout=io.StringIO())
+            call_command("rebuild_cart_summaries", all=True, stdout=io.StringIO())
+            self.log(f"derived data rebuilt in {time.monotonic() - started:.1f}s")
+
+        return written
+
+    def tuned_connection(self):
+        """Context manager relaxing durability on SQLite for the whole run
+
+        SQLite refuses to change it inside a transaction, so a caller's
+        open transaction keeps the normal settings.
+        """
+        if connection.vendor == "sqlite" and not connection.in_atomic_block:
+            return _SQLiteBulkLoad()
+        return contextlib.nullcontext()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """One transaction of the load, without synchronous commit on PostgreSQL"""
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SET LOCAL synchronous_commit TO OFF")
+            yield cursor
+
+    def insert(self, model, rows):
+        """bulk_create model instances from an iterable
+
+        Returns:
+            list -- Primary keys of the inserted rows, in order
+        """
+        ids = []
+        for chunk in chunked(rows, self.rows_per_transaction):
+            with self.batch():
+                model.objects.bulk_create(chunk, batch_size=self.batch_size)
+            ids.extend(row.pk for row in chunk)
+        return ids
+
+    def copy_rows(self, model, fields, rows):
+        """INSERT tuples of database ready values with executemany
+
+        Primary keys continue from the current highest one, and PostgreSQL
+        sequences are moved past them afterwards.
+
+        Arguments:
+            fields {tuple} -- Field names matching the position of each value
+
+        Returns:
+            range -- Primary keys of the inserted rows, in order
+        """
+        quote = connection.ops.quote_name
+        columns = [model._meta.pk.column] + [model._meta.get_field(name).column for name in fields]
+        sql = (
+            f"INSERT INTO {quote(model._meta.db_table)} "
+            f"({', '.join(quote(column) for column in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+
+        first = (model._base_manager.aggregate(top=Max("pk"))["top"] or 0) + 1
+        next_id = first
+        for chunk in chunked(rows, self.rows_per_transaction):
+            with self.batch() as cursor:
+                cursor.executemany(
+                    sql, [(pk, *row) for pk, row in enumerate(chunk, start=next_id)]
+                )
+            next_id += len(chunk)
+
+        with connection.cursor() as cursor:
+            for statement in connection.ops.sequence_reset_sql(no_style(), [model]):
+                cursor.execute(statement)
+        return range(first, next_id)
+
+    def write_users(self):
+        # Hashing is deliberately slow, every user shares one hash
+        password = make_password(self.password)
+        joined = timezone.now()
+        users = self.counts["users"]
+
+        user_ids = self.insert(
+            User,
+            (
+                User(
+                    username=f"{self.prefix}{number}",
+                    password=password,
+                    first_name=self.random.choice(NOUNS),
+                    last_name=f"{self.prefix.title()}{number}",
+                    email=f"{self.prefix}{number}@example.com",
+                    date_joined=joined,
+                )
+                for number in range(users)
+            ),
+        )
+        self.insert(
+            Token,
+            (Token(key=f"{self.random.getrandbits(160):040x}", user_id=user_id) for user_id in user_ids),
+        )
+        self.customer_ids = self.insert(
+            Customer,
+            (
+                Customer(
+                    user_id=user_id,
+                    phone_number=f"555-{self.random.randrange(10000):04d}",
+                    address=f"{self.random.randrange(1, 9999)} {self.random.choice(NOUNS)} Way",
+                )
+                for user_id in user_ids
+            ),
+        )
+        today = datetime.date.today()
+        self.payment_ids = self.insert(
+            Payment,
+            (
+                Payment(
+                    merchant_name=self.random.choice(MERCHANTS),
+                    account_number=f"{self.random.getrandbits(48):015d}",
+                    customer_id=customer_id,
+                    expiration_date=today.replace(year=today.year + self.random.randint(1, 5)),
+                    create_date=today,
+                )
+                for customer_id in self.customer_ids
+            ),
+        )
+        return users
+
+    def write_categories(self):
+        self.category_ids = self.insert(
+            ProductCategory, (ProductCategory(name=name) for name in CATEGORIES)
+        )
+        return len(self.category_ids)
+
+    def product(self, number):
+        name = f"{self.random.choice(ADJECTIVES)} {self.random.choice(NOUNS)} {number}"
+        return (
+            name,
+            f"{name}, {self.random.choice(PHRASES)}",
+            round(min(max(self.random.lognormvariate(3.5, 1.2), 1), 17500), 2),
+            self.random.randint(0, 500),
+            self.random.choice(CITIES),
+            self.customer_ids[self.random.randrange(self.sellers)],
+            self.random.choice(self.category_ids),
+            False,
+            False,
+            self.today,
+        )
+
+    def write_products(self):
+        products = self.counts["products"]
+        self.product_ids = list(self.copy_rows(
+            Product,
+            ("name", "description", "price", "quantity", "location", "customer",
+             "category", "deleted_by_cascade", "image_variants_ready", "created_date"),
+            (self.product(number) for number in range(products)),
+        ))
+
+        self.random.shuffle(self.product_ids)
+        self.cumulative = list(
+            itertools.accumulate(1 / rank ** self.skew for rank in range(1, products + 1))
+        )
+        return products
+
+    def popular_product(self):
+        """A product id drawn from the Zipf popularity distribution"""
+        point = self.random.random() * self.cumulative[-1]
+        return self.product_ids[bisect.bisect(self.cumulative, point)]
+
+    def write_orders(self):
+        orders = self.counts["orders"]
+
+        # Every 20th order is an open cart, at most one per customer
+        open_carts = min(orders // 20, len(self.customer_ids))
+        cart_customers = self.random.sample(range(len(self.customer_ids)), open_carts)
+
+        def order(number):
+            if number < open_carts:
+                index = cart_customers[number]
+                payment_id = None
+            else:
+                index = self.random.randrange(len(self.customer_ids))
+                payment_id = self.payment_ids[index]
+            return (self.customer_ids[index], payment_id, self.today, self.now, 0, 0, 0)
+
+        self.order_ids = self.copy_rows(
+            Order,
+            ("customer", "payment_type", "created_date", "updated_at",
+             "item_count", "product_count", "subtotal"),
+            (order(number) for number in range(orders)),
+        )
+        return orders
+
+    def write_line_items(self):
+        if not self.order_ids:
+            return 0
+
+        # Line counts average line_items / orders, never more than the catalog
+        average = max(self.counts["line_items"] / len(self.order_ids), 1)
+        widest = min(max(int(2 * average) - 1, 1), len(self.product_ids))
+
+        def lines():
+            for order_id in self.order_ids:
+                wanted = self.random.randint(1, widest)
+                products = set()
+                for _ in range(wanted * 4):
+                    products.add(self.popular_product())
+                    if len(products) == wanted:
+                        break
+                for product_id in products:
+                    yield order_id, product_id, self.random.choices((1, 2, 3), weights=(8, 3, 1))[0]
+
+        return len(self.copy_rows(OrderProduct, ("order", "product", "quantity"), lines()))
+
+    def write_ratings(self):
+        return len(self.copy_rows(
+            ProductRating,
+            ("product", "customer", "rating"),
+            (
+                (
+                    self.popular_product(),
+                    self.random.choice(self.customer_ids),
+                    self.random.choices(range(1, 6), weights=(1, 1, 3, 6, 5))[0],
+                )
+                for _ in range(self.counts["ratings"])
+            ),
+        ))
+
+    def write_favorites(self):
+        return len(self.copy_rows(
+            Favorite,
+            ("customer", "seller"),
+            (
+                (
+                    self.random.choice(self.customer_ids),
+                    self.customer_ids[self.random.randrange(self.sellers)],
+                )
+                for _ in range(self.counts["favorites"])
+            ),
+        ))
+
+    def write_recommendations(self):
+        return len(self.copy_rows(
+            Recommendation,
+            ("customer", "product", "recommender"),
+            (
+                (
+                    self.random.choice(self.customer_ids),
+                    self.popular_product(),
+                    self.random.choice(self.customer_ids),
+                )
+                for _ in range(self.counts["recommendations"])
+            ),
+        ))
+
+
+class _SQLiteBulkLoad:
+    """Skip fsync and keep the rollback journal in memory until exit"""
+
+    PRAGMAS = ("synchronous", "journal_mode", "temp_store", "cache_size")
+
+    def __enter__(self):
+        with connection.cursor() as cursor:
+            self.saved = {}
+            for pragma in self.PRAGMAS:
+                cursor.execute(f"PRAGMA {pragma}")
+                self.saved[pragma] = cursor.fetchone()[0]
+            cursor.execute("PRAGMA synchronous = OFF")
+            cursor.execute("PRAGMA journal_mode = MEMORY")
+            cursor.execute("PRAGMA temp_store = MEMORY")
+            cursor.execute("PRAGMA cache_size = -262144")
+        return self
+
+    def __exit__(self, *exc):
+        with connection.cursor() as cursor:
+            for pragma, value in self.saved.items():
+                cursor.execute(f"PRAGMA {pragma} = {value}")
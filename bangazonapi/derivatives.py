@@ -0,0 +1,158 @@
+"""Background pipeline producing resized variants of product images
+
+After an upload the original is handed to a process pool which renders
+thumb, card and full sizes as WebP and JPEG (see `bangazonapi.imaging`).
+Request threads only submit work and never resize.
+
+Variants live under `derivatives/<aa>/<key>/` in MEDIA_ROOT, where the key
+is the source's SHA-256 for content-addressed uploads, so the derivative
+cache is shared by every product using the same image and survives
+restarts. A source's variants are advertised only once its `.complete`
+marker exists. That is recorded in `Product.image_variants_ready` when the
+marker is written, so serializing a product never touches storage.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from bangazonapi import imaging
+from bangazonapi.models import ModelVersion, Product
+
+DERIVATIVE_FOLDER = "derivatives"
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Keys whose complete variant set is known to be on disk
+_ready = set()
+
+
+def source_key(name):
+    """Derivative cache key for a stored image name
+
+    Content-addressed uploads are already named by their SHA-256. Older
+    images fall back to a hash of their storage name.
+    """
+    stem = os.path.splitext(os.path.basename(name))[0]
+    if len(stem) == 64 and all(char in "0123456789abcdef" for char in stem):
+        return stem
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+
+def derivative_folder(name):
+    key = source_key(name)
+    return f"{DERIVATIVE_FOLDER}/{key[:2]}/{key}"
+
+
+def is_ready(name):
+    """Whether every variant of an image has been rendered"""
+    key = source_key(name)
+    if key in _ready:
+        return True
+    if default_storage.exists(f"{derivative_folder(name)}/{imaging.COMPLETE_MARKER}"):
+        _ready.add(key)
+        return True
+    return False
+
+
+def variant_urls(name, request=None):
+    """URLs of the variants of an image whose product has image_variants_ready
+
+    Returns:
+        dict -- {variant: {format: url}}, or None when there is no image
+    """
+    if not name:
+        return None
+
+    folder = derivative_folder(name)
+    urls = {}
+    for variant in imaging.VARIANTS:
+        urls[variant] = {}
+        for fmt in imaging.FORMATS:
+            url = default_storage.url(f"{folder}/{imaging.variant_filename(variant, fmt)}")
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant][fmt] = url
+    return urls
+
+
+def mark_ready(names):
+    """Flag the products using these images once their variants are on disk
+
+    The product version is bumped, since cached product responses and
+    validators still say the variants are missing.
+
+    Returns:
+        int -- Number of products flagged
+    """
+    updated = Product.all_objects.filter(image_path__in=names, image_variants_ready=False).update(
+        image_variants_ready=True
+    )
+    if updated:
+        ModelVersion.bump("product")
+    return updated
+
+
+def workers():
+    return getattr(settings, "IMAGE_DERIVATIVE_WORKERS", 2)
+
+
+def executor(max_workers=None):
+    """Process pool shared by the whole worker process"""
+    global _executor  # pylint: disable=global-statement
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers or workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _finished(name):
+    def callback(future):
+        if future.exception() is not None:
+            logger.error(
+                "Rendering derivatives of %s failed", name, exc_info=future.exception()
+            )
+            return
+
+        _ready.add(source_key(name))
+        try:
+            mark_ready([name])
+        finally:
+            connection.close()
+
+    return callback
+
+
+def schedule(name):
+    """Queue rendering of an image's variants in the process pool
+
+    Returns:
+        Future -- None when there is nothing to do or the pool is disabled
+                  with IMAGE_DERIVATIVE_WORKERS = 0
+    """
+    if not name or workers() <= 0 or is_ready(name):
+        return None
+
+    future = executor().submit(
+        imaging.render_derivatives,
+        default_storage.path(name),
+        default_storage.path(derivative_folder(name)),
+    )
+    future.add_done_callback(_finished(name))
+    return future
+
+
+def schedule_on_commit(name):
+    """Queue rendering once the transaction storing the image commits"""
+    transaction.on_commit(lambda: schedule(name))
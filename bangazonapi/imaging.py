@@ -0,0 +1,88 @@
+"""Resized image variants rendered with Pillow
+
+This module only depends on Pillow and the standard library because its
+functions run in worker processes started by `bangazonapi.derivatives`.
+"""
+
+import os
+import tempfile
+from PIL import Image, ImageOps
+
+# Variant name -> longest edge in pixels
+VARIANTS = {
+    "thumb": 160,
+    "card": 480,
+    "full": 1200,
+}
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+COMPLETE_MARKER = ".complete"
+
+
+def variant_filename(variant, fmt):
+    extension = "jpg" if fmt == "jpeg" else fmt
+    return f"{variant}.{extension}"
+
+
+def _save_atomically(image, path, pillow_format, options):
+    folder = os.path.dirname(path)
+    handle, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as output:
+            image.save(output, pillow_format, **options)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def render_derivatives(source_path, target_folder):
+    """Write every variant of an image into `target_folder`
+
+    Variants already on disk are kept, so rerunning after a crash only
+    renders what is missing. A marker file is written last; its presence
+    means the whole set is ready.
+
+    Arguments:
+        source_path {str} -- Absolute path of the original image
+        target_folder {str} -- Absolute folder for this source's variants
+
+    Returns:
+        list -- File names that were rendered by this call
+    """
+    os.makedirs(target_folder, exist_ok=True)
+    rendered = []
+
+    with Image.open(source_path) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ("RGB", "RGBA"):
+            original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+
+        for variant, edge in VARIANTS.items():
+            resized = None
+            for fmt, (pillow_format, options) in FORMATS.items():
+                filename = variant_filename(variant, fmt)
+                path = os.path.join(target_folder, filename)
+                if os.path.exists(path):
+                    continue
+
+                if resized is None:
+                    resized = original.copy()
+                    resized.thumbnail((edge, edge), Image.LANCZOS)
+
+                image = resized
+                if pillow_format == "JPEG" and image.mode != "RGB":
+                    background = Image.new("RGB", image.size, (255, 255, 255))
+                    background.paste(image, mask=image.getchannel("A"))
+                    image = background
+
+                _save_atomically(image, path, pillow_format, options)
+                rendered.append(filename)
+
+    with open(os.path.join(target_folder, COMPLETE_MARKER), "w", encoding="utf-8"):
+        pass
+
+    return rendered
@@ -0,0 +1,91 @@
+"""Fill the database with seeded random data for load tests and benchmarks"""
+
+from django.core.management.base import BaseCommand, CommandError
+from bangazonapi.dataset import DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = "Generate users, products, orders, line items, ratings, favorites and recommendations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            type=float,
+            default=1,
+            help="Multiply every count below, --scale 100 gives 1M products and 10M line items",
+        )
+        for name, default, text in (
+            ("users", 1000, "Users, each with a token, a customer and a payment type"),
+            ("products", 10000, "Products"),
+            ("orders", 20000, "Orders, every 20th is an open cart"),
+            ("line-items", 100000, "Line items spread over the orders"),
+            ("ratings", 20000, "Product ratings"),
+            ("favorites", 2000, "Favorite sellers"),
+            ("recommendations", 2000, "Product recommendations"),
+        ):
+            parser.add_argument(f"--{name}", type=int, default=default, help=text)
+        parser.add_argument(
+            "--sellers",
+            type=int,
+            help="Customers selling the products, a tenth of the users by default",
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=0.9,
+            help="Zipf exponent of product popularity, 0 makes every product equally popular",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+        parser.add_argument(
+            "--prefix",
+            default="load",
+            help="Usernames are the prefix and a number, so datasets can be told apart",
+        )
+        parser.add_argument(
+            "--password",
+            default="bangazon",
+            help="Password of every generated user",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows per INSERT, the database backend may lower it",
+        )
+        parser.add_argument(
+            "--rows-per-transaction",
+            type=int,
+            default=100000,
+            help="Rows committed together",
+        )
+
+    def handle(self, *args, **options):
+        def scaled(name):
+            return int(options[name] * options["scale"])
+
+        generator = DatasetGenerator(
+            users=scaled("users"),
+            products=scaled("products"),
+            orders=scaled("orders"),
+            line_items=scaled("line_items"),
+            ratings=scaled("ratings"),
+            favorites=scaled("favorites"),
+            recommendations=scaled("recommendations"),
+            sellers=options["sellers"],
+            skew=options["skew"],
+            seed=options["seed"],
+            prefix=options["prefix"],
+            password=options["password"],
+            batch_size=options["batch_size"],
+            rows_per_transaction=options["rows_per_transaction"],
+            log=self.stdout.write,
+        )
+
+        try:
+            written = generator.generate()
+        except ValueError as ex:
+            raise CommandError(ex)
+
+        self.stdout.write(self.style.SUCCESS(
+            "Generated " + ", ".join(f"{count} {kind}" for kind, count in written.items())
+        ))
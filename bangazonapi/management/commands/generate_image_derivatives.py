@@ -0,0 +1,84 @@
+"""Render missing resized variants for every product image"""
+
+from concurrent.futures import Future, as_completed
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from bangazonapi import derivatives, imaging
+from bangazonapi.models import Product
+
+
+class Command(BaseCommand):
+    help = "Render thumb, card and full WebP/JPEG variants for product images that lack them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Processes to render with, defaults to IMAGE_DERIVATIVE_WORKERS (0 renders inline)",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"] if options["workers"] is not None else derivatives.workers()
+
+        names = set(
+            Product.all_objects.filter(image_variants_ready=False)
+            .exclude(image_path="")
+            .exclude(image_path__isnull=True)
+            .values_list("image_path", flat=True)
+        )
+        ready = []
+        pending = {}
+        for name in names:
+            if derivatives.is_ready(name):
+                ready.append(name)
+                continue
+            if not default_storage.exists(name):
+                continue
+            # Products sharing content-addressed images share one variant set
+            pending.setdefault(derivatives.source_key(name), name)
+
+        jobs = [
+            (
+                name,
+                default_storage.path(name),
+                default_storage.path(derivatives.derivative_folder(name)),
+            )
+            for name in pending.values()
+        ]
+
+        rendered = 0
+        failed = 0
+        if workers > 0:
+            pool = derivatives.executor(workers)
+            futures = {
+                pool.submit(imaging.render_derivatives, source, target): name
+                for name, source, target in jobs
+            }
+            results = ((futures[future], future) for future in as_completed(futures))
+        else:
+            results = ((name, _run_inline(source, target)) for name, source, target in jobs)
+
+        for name, future in results:
+            if future.exception() is not None:
+                failed += 1
+                self.stderr.write(f"{name}: {future.exception()}")
+            else:
+                rendered += 1
+                ready.append(name)
+
+        # Products sharing a content-addressed image were rendered once for all of them
+        ready_keys = {derivatives.source_key(name) for name in ready}
+        derivatives.mark_ready([name for name in names if derivatives.source_key(name) in ready_keys])
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered variants for {rendered} images, {failed} failed"))
+
+
+def _run_inline(source, target):
+    """Render in this process, wrapped like a pool result"""
+    future = Future()
+    try:
+        future.set_result(imaging.render_derivatives(source, target))
+    except Exception as ex:  # pylint: disable=broad-except
+        future.set_exception(ex)
+    return future
@@ -0,0 +1,23 @@
+"""Recompute the stored cart summaries of open orders"""
+
+from django.core.management.base import BaseCommand
+from bangazonapi.models import Order
+
+
+class Command(BaseCommand):
+    help = "Recompute item count, product count and subtotal stored on orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Include completed orders, not only open carts",
+        )
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if not options["all"]:
+            orders = orders.filter(payment_type__isnull=True)
+
+        updated = Order.refresh_summaries(orders)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt summaries for {updated} orders"))
@@ -0,0 +1,102 @@
+"""Recompute the ProductStats counters from orders and ratings"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from bangazonapi.models import OrderProduct, Product, ProductRating, ProductStats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product sales and rating counters and report any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drift, leave the counters untouched",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows per INSERT when writing the rebuilt counters",
+        )
+
+    def handle(self, *args, **options):
+        expected = self.expected_counters()
+        current = {
+            product_id: (sold, rating_sum, rating_count)
+            for product_id, sold, rating_sum, rating_count in ProductStats.objects.values_list(
+                "product_id", "sold_count", "rating_sum", "rating_count"
+            )
+        }
+
+        drifted = [
+            product_id
+            for product_id, counters in expected.items()
+            if current.get(product_id, (0, 0, 0)) != counters
+        ]
+        orphaned = set(current) - set(expected)
+
+        for product_id in drifted[:20]:
+            self.stdout.write(
+                f"product {product_id}: stored {current.get(product_id)} "
+                f"expected {expected[product_id]} (sold, rating_sum, rating_count)"
+            )
+        self.stdout.write(
+            f"{len(drifted)} of {len(expected)} products drifted, "
+            f"{len(orphaned)} orphaned counter rows"
+        )
+
+        if options["dry_run"]:
+            return
+
+        with transaction.atomic():
+            ProductStats.objects.all().delete()
+            ProductStats.objects.bulk_create(
+                (
+                    ProductStats(
+                        product_id=product_id,
+                        sold_count=sold,
+                        rating_sum=rating_sum,
+                        rating_count=rating_count,
+                    )
+                    for product_id, (sold, rating_sum, rating_count) in expected.items()
+                ),
+                batch_size=options["batch_size"],
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {len(expected)} products"))
+
+    def expected_counters(self):
+        """Counters computed from the source tables
+
+        Returns:
+            dict -- (sold_count, rating_sum, rating_count) keyed by product id
+        """
+        counters = {
+            product_id: [0, 0, 0]
+            for product_id in Product.all_objects.values_list("id", flat=True)
+        }
+
+        sold = (
+            OrderProduct.objects.filter(order__payment_type__isnull=False)
+            .values("product_id")
+            .annotate(total=Sum("quantity"))
+            .values_list("product_id", "total")
+        )
+        for product_id, total in sold:
+            if product_id in counters:
+                counters[product_id][0] = total
+
+        ratings = (
+            ProductRating.objects.values("product_id")
+            .annotate(total=Sum("rating"), count=Count("id"))
+            .values_list("product_id", "total", "count")
+        )
+        for product_id, total, count in ratings:
+            if product_id in counters:
+                counters[product_id][1] = total
+                counters[product_id][2] = count
+
+        return {product_id: tuple(counter) for product_id, counter in counters.items()}
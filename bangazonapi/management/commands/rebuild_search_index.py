@@ -0,0 +1,32 @@
+"""Recreate the product full-text search index"""
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from bangazonapi import search
+
+
+class Command(BaseCommand):
+    help = "Create the product search index if needed and repopulate it from the product table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database alias to index",
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"]
+
+        if not search.install(using=using):
+            self.stdout.write("No full-text support on this database, searches use icontains")
+            return
+
+        if connections[using].vendor != "sqlite":
+            self.stdout.write(self.style.SUCCESS("GIN indexes are in place, PostgreSQL maintains them"))
+            return
+
+        with transaction.atomic(using=using):
+            indexed = search.rebuild(using=using)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products"))
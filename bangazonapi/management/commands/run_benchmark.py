@@ -0,0 +1,103 @@
+"""Load test the API with the weighted scenarios in bangazonapi.benchmark"""
+
+import json
+from django.core.management.base import BaseCommand, CommandError
+from bangazonapi import benchmark
+
+
+class Command(BaseCommand):
+    help = "Replay weighted Postman scenarios concurrently and report latency, throughput and queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            help="Base URL of a running server, the in-process WSGI app when omitted",
+        )
+        parser.add_argument("--concurrency", type=int, default=4, help="Worker threads")
+        parser.add_argument("--duration", type=float, default=30, help="Seconds to measure")
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            help="Scenarios per worker, replaces --duration",
+        )
+        parser.add_argument(
+            "--warmup",
+            type=float,
+            default=0,
+            help="Seconds to run before measuring, with --duration only",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+        parser.add_argument("--baseline", help="Earlier --output file to compare against")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.1,
+            help="Fraction p95/p99 latency may grow, or throughput drop, before it counts as a regression",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error when the baseline comparison finds a regression",
+        )
+
+    def handle(self, *args, **options):
+        target = benchmark.HTTPTarget(options["url"]) if options["url"] else benchmark.InProcessTarget()
+        try:
+            runner = benchmark.Benchmark(
+                target,
+                concurrency=options["concurrency"],
+                duration=options["duration"],
+                iterations=options["iterations"],
+                seed=options["seed"],
+                warmup=options["warmup"],
+            )
+            results = runner.run()
+        except ValueError as ex:
+            raise CommandError(ex)
+
+        self.report(results)
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline:
+                baseline = json.load(baseline)
+            for setting in ("target", "concurrency"):
+                if baseline["meta"].get(setting) != results["meta"][setting]:
+                    self.stdout.write(self.style.WARNING(
+                        f"Baseline {setting} was {baseline['meta'].get(setting)}, "
+                        f"this run used {results['meta'][setting]}"
+                    ))
+            rows = benchmark.compare(results, baseline, options["tolerance"])
+            regressions = self.report_comparison(rows)
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{regressions} regressions against {options['baseline']}")
+
+    def report(self, results):
+        header = f"{'endpoint':<34}{'reqs':>7}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for endpoint, stats in list(results["endpoints"].items()) + [("total", results["total"])]:
+            queries = stats["queries_mean"]
+            self.stdout.write(
+                f"{endpoint:<34}{stats['requests']:>7}{stats['errors']:>5}{stats['rps'] or 0:>9.1f}"
+                f"{stats['p50_ms'] or 0:>9.1f}{stats['p95_ms'] or 0:>9.1f}{stats['p99_ms'] or 0:>9.1f}"
+                f"{'-' if queries is None else f'{queries:.1f}':>9}"
+            )
+        self.stdout.write("Latencies in milliseconds")
+
+    def report_comparison(self, rows):
+        regressions = 0
+        for row in rows:
+            if row["regression"]:
+                regressions += 1
+                line = (f"{row['endpoint']} {row['metric']}: {row['baseline']} -> {row['current']} "
+                        f"({row['change']:+.1%})")
+                self.stdout.write(self.style.ERROR(line))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f"No regressions in {len(rows)} comparisons"))
+        return regressions
@@ -0,0 +1,42 @@
+"""Report the slow query log grouped by SQL fingerprint"""
+
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from bangazonapi import slowqueries
+
+
+class Command(BaseCommand):
+    help = "Group slow query log entries by normalized SQL and show the slowest with their plans"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--log",
+            default=getattr(settings, "SLOW_QUERY_LOG", None),
+            help="Slow query log, its rotated backups are read too (default SLOW_QUERY_LOG)",
+        )
+        parser.add_argument("--top", type=int, default=10, help="Fingerprints to show")
+        parser.add_argument("--json", action="store_true", help="Print the groups as JSON")
+
+    def handle(self, *args, **options):
+        paths = slowqueries.log_files(options["log"]) if options["log"] else []
+        if not paths:
+            raise CommandError(f"No slow query log at {options['log']}")
+
+        groups = slowqueries.summarize(paths)[:options["top"]]
+        if options["json"]:
+            self.stdout.write(json.dumps(groups, indent=2))
+            return
+
+        for group in groups:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{group['fingerprint']}  {group['count']}x  total {group['total_ms']:.0f} ms  "
+                f"mean {group['mean_ms']:.1f} ms  max {group['max_ms']:.1f} ms"
+            ))
+            self.stdout.write(f"  {group['statement']}")
+            self.stdout.write(f"  params: {json.dumps(group['params'])}")
+            for caller in group["callers"]:
+                self.stdout.write(f"  from {caller}")
+            for line in group.get("plan", []):
+                self.stdout.write(f"    {line}")
+        self.stdout.write(f"{len(groups)} fingerprints from {len(paths)} log files")
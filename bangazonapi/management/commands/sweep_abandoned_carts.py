@@ -0,0 +1,54 @@
+"""Remove open orders that have been idle for too long"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from bangazonapi import carts
+
+
+class Command(BaseCommand):
+    help = "Delete, or archive and delete, carts idle past ABANDONED_CART_MAX_AGE_DAYS"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=getattr(settings, "ABANDONED_CART_MAX_AGE_DAYS", 30),
+            help="Idle days before a cart counts as abandoned",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=getattr(settings, "ABANDONED_CART_BATCH_SIZE", 200),
+            help="Carts removed per transaction",
+        )
+        parser.add_argument(
+            "--archive",
+            action="store_true",
+            default=getattr(settings, "ABANDONED_CART_ARCHIVE", False),
+            help="Copy carts to the AbandonedCart table before deleting them",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Seconds to sleep between batches",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the abandoned carts",
+        )
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            count = carts.idle_carts(options["days"]).count()
+            self.stdout.write(f"{count} carts idle for more than {options['days']} days")
+            return
+
+        report = carts.sweep_abandoned_carts(
+            max_age_days=options["days"],
+            batch_size=options["batch_size"],
+            archive=options["archive"],
+            pause=options["pause"],
+        )
+        self.stdout.write(self.style.SUCCESS(str(report)))
@@ -0,0 +1,491 @@
+"""Request metrics shared by all worker processes, served at /metrics
+
+`MetricsMiddleware` records these for every request, labelled with the
+route (the URL name, such as `product-list`) and the HTTP method:
+
+* `bangazon_http_requests_total` -- responses, also labelled by status
+* `bangazon_http_errors_total` -- 4xx and 5xx responses, by status class
+* `bangazon_http_request_duration_seconds` -- latency histogram
+* `bangazon_http_db_queries` -- histogram of SQL statements per request
+* `bangazon_http_response_size_bytes` -- histogram of response bodies
+
+Streamed responses are recorded once their body has been sent.
+
+`bangazonapi.cache` counts response cache hits, misses and stores in
+`bangazon_response_cache_total`, and the hit ratio of all workers is
+exported as `bangazon_response_cache_hit_ratio`.
+
+Gunicorn runs several worker processes, and a scrape reaches only one of
+them. So each process adds its samples to its own file in METRICS_DIR,
+`<pid>.db`, through a shared mmap. The file holds `(key, float64)` entries
+and only its process writes to it. The `/metrics` view reads every file
+in the directory and sums the samples, so the totals cover all workers,
+including ones that have exited.
+
+The file of a process that has exited is folded into `archive.db` and
+deleted, on the next scrape or when a new worker starts, the way
+prometheus_client's `mark_process_dead` is used. The directory holds one
+file per live worker plus the archive, however often workers are
+recycled. Liveness is checked by pid, so METRICS_DIR must be on a local
+disk that only this host's workers use. The archive outlives restarts and
+counters keep growing across them. Empty the directory to start from zero.
+"""
+
+import fcntl
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from bangazonapi.streaming import observe_stream
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METHODS = ("GET", "HEAD", "OPTIONS", "POST", "PUT", "PATCH", "DELETE")
+
+# Bytes of the file in use, then entries of key length, utf-8 key and a
+# float64 value aligned to 8 bytes
+_HEADER = struct.Struct("<I4x")
+_KEY_LENGTH = struct.Struct("<I")
+_VALUE = struct.Struct("<d")
+INITIAL_SIZE = 64 * 1024
+ARCHIVE = "archive.db"
+LOCK = ".lock"
+
+
+def _entries(data, used):
+    """(key, offset of the value) of each entry in a metrics file"""
+    offset = _HEADER.size
+    used = min(used, len(data))
+    while offset + _KEY_LENGTH.size <= used:
+        (length,) = _KEY_LENGTH.unpack_from(data, offset)
+        start = offset + _KEY_LENGTH.size
+        value_at = _align(start + length)
+        if value_at + _VALUE.size > used:
+            break
+        yield bytes(data[start:start + length]).decode("utf-8"), value_at
+        offset = value_at + _VALUE.size
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class MetricsFile:
+    """Samples of one process, in a memory mapped file only it writes to"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a+b")
+        size = os.fstat(self.file.fileno()).st_size
+        if size < INITIAL_SIZE:
+            self.file.truncate(INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+        # A reused pid continues the counters left by the earlier process
+        self.used = _HEADER.unpack_from(self.map, 0)[0] or _HEADER.size
+        self.positions = dict(_entries(self.map, self.used))
+
+    def add(self, samples):
+        """Add amounts to samples
+
+        Arguments:
+            samples {list} -- (key, amount) pairs
+        """
+        with self.lock:
+            for key, amount in samples:
+                position = self.positions.get(key)
+                if position is None:
+                    position = self._append(key)
+                (value,) = _VALUE.unpack_from(self.map, position)
+                _VALUE.pack_into(self.map, position, value + amount)
+
+    def _append(self, key):
+        encoded = key.encode("utf-8")
+        value_at = _align(self.used + _KEY_LENGTH.size + len(encoded))
+        end = value_at + _VALUE.size
+        if end > len(self.map):
+            self._grow(end)
+
+        _KEY_LENGTH.pack_into(self.map, self.used, len(encoded))
+        start = self.used + _KEY_LENGTH.size
+        self.map[start:start + len(encoded)] = encoded
+        _VALUE.pack_into(self.map, value_at, 0.0)
+        # Readers only see the entry once it is complete
+        _HEADER.pack_into(self.map, 0, end)
+        self.used = end
+        self.positions[key] = value_at
+        return value_at
+
+    def _grow(self, needed):
+        size = len(self.map)
+        while size < needed:
+            size *= 2
+        self.map.close()
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+_file = None
+_file_lock = threading.Lock()
+
+
+def metrics_dir():
+    return getattr(settings, "METRICS_DIR", "metrics")
+
+
+def enabled():
+    return getattr(settings, "METRICS", False)
+
+
+@contextmanager
+def _locked(directory, operation):
+    """Hold an flock on METRICS_DIR, shared to read the files and exclusive to remove them"""
+    with open(os.path.join(directory, LOCK), "a+b") as lock:
+        fcntl.flock(lock, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def process_file():
+    """This process's MetricsFile, opened again after a fork or a change of METRICS_DIR"""
+    global _file
+    directory = metrics_dir()
+    path = os.path.join(directory, f"{os.getpid()}.db")
+    current = _file
+    if current is not None and current.path == path:
+        return current
+    with _file_lock:
+        if _file is None or _file.path != path:
+            os.makedirs(directory, exist_ok=True)
+            merge_dead()
+            # Taken so a merge never deletes the file of a new process that reuses a dead pid
+            with _locked(directory, fcntl.LOCK_SH):
+                _file = MetricsFile(path)
+        return _file
+
+
+def _pid(name):
+    """Process id of a `<pid>.db` file name, None for the archive and other files"""
+    stem, extension = os.path.splitext(name)
+    return int(stem) if extension == ".db" and stem.isdigit() else None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # It exists, as another user
+        return True
+    return True
+
+
+def _read(path):
+    """(key, value) of every entry in a metrics file, None when it is gone"""
+    try:
+        with open(path, "rb") as source:
+            data = source.read()
+    except FileNotFoundError:
+        return None
+    if len(data) < _HEADER.size:
+        return []
+    (used,) = _HEADER.unpack_from(data, 0)
+    return [(key, _VALUE.unpack_from(data, position)[0]) for key, position in _entries(data, used)]
+
+
+def merge_dead():
+    """Add the samples of exited processes to the archive and delete their files
+
+    Returns:
+        int -- Number of files merged
+    """
+    directory = metrics_dir()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+
+    own = os.getpid()
+    dead = [name for name in names if _pid(name) not in (None, own) and not _alive(_pid(name))]
+    if not dead:
+        return 0
+
+    merged = 0
+    with _locked(directory, fcntl.LOCK_EX):
+        archive = MetricsFile(os.path.join(directory, ARCHIVE))
+        try:
+            for name in dead:
+                # Checked again now that no process can be opening its file
+                if _alive(_pid(name)):
+                    continue
+                path = os.path.join(directory, name)
+                samples = _read(path)
+                if samples is None:
+                    # Merged by another process first
+                    continue
+                archive.add(samples)
+                os.remove(path)
+                merged += 1
+        finally:
+            archive.close()
+    return merged
+
+
+def collect():
+    """Samples of every process's file in METRICS_DIR, summed
+
+    Returns:
+        dict -- (sample name, label pairs) to value
+    """
+    totals = defaultdict(float)
+    directory = metrics_dir()
+    if not os.path.isdir(directory):
+        return totals
+
+    merge_dead()
+    # Shared, so a merge cannot move samples into the archive halfway through
+    with _locked(directory, fcntl.LOCK_SH):
+        for name in os.listdir(directory):
+            if not name.endswith(".db"):
+                continue
+            for key, value in _read(os.path.join(directory, name)) or ():
+                sample, labels = json.loads(key)
+                totals[(sample, tuple(map(tuple, labels)))] += value
+    return totals
+
+
+REGISTRY = []
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        REGISTRY.append(self)
+
+    def key(self, sample, labels, **extra):
+        pairs = [[name, str(labels[name])] for name in self.labels]
+        pairs += [[name, value] for name, value in extra.items()]
+        return json.dumps([sample, pairs], separators=(",", ":"))
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self, samples):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if enabled():
+            process_file().add([(self.key(self.name, labels), amount)])
+
+    def render(self, samples):
+        lines = self.header()
+        for (sample, labels), value in sorted(samples.items()):
+            if sample == self.name:
+                lines.append(_line(sample, labels, value))
+        return lines
+
+
+class Histogram(Metric):
+    """Observations counted in buckets, which are made cumulative when rendered"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.bounds = tuple(_number(bound) for bound in self.buckets) + ("+Inf",)
+
+    def observe(self, value, **labels):
+        if not enabled():
+            return
+        process_file().add(self.samples(value, labels))
+
+    def samples(self, value, labels):
+        bound = next(
+            (self.bounds[i] for i, bucket in enumerate(self.buckets) if value <= bucket), "+Inf"
+        )
+        return [
+            (self.key(f"{self.name}_bucket", labels, le=bound), 1),
+            (self.key(f"{self.name}_sum", labels), value),
+            (self.key(f"{self.name}_count", labels), 1),
+        ]
+
+    def render(self, samples):
+        buckets = defaultdict(dict)
+        for (sample, labels), value in samples.items():
+            if sample == f"{self.name}_bucket":
+                buckets[labels[:-1]][labels[-1][1]] = value
+
+        lines = self.header()
+        for labels in sorted(buckets):
+            cumulative = 0
+            for bound in self.bounds:
+                cumulative += buckets[labels].get(bound, 0)
+                lines.append(_line(f"{self.name}_bucket", labels + (("le", bound),), cumulative))
+            for suffix in ("_sum", "_count"):
+                lines.append(_line(self.name + suffix, labels, samples.get((self.name + suffix, labels), 0)))
+        return lines
+
+
+class HitRatio(Metric):
+    """hit / (hit + miss) of a counter with a `result` label, over all processes"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, counter):
+        super().__init__(name, documentation)
+        self.counter = counter
+
+    def render(self, samples):
+        results = defaultdict(float)
+        for (sample, labels), value in samples.items():
+            if sample == self.counter.name:
+                results[dict(labels).get("result")] += value
+        lookups = results["hit"] + results["miss"]
+        return self.header() + [_line(self.name, (), results["hit"] / lookups if lookups else 0)]
+
+
+def _number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return repr(value)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _line(sample, labels, value):
+    if labels:
+        pairs = ",".join(f'{name}="{_escape(label)}"' for name, label in labels)
+        sample = f"{sample}{{{pairs}}}"
+    return f"{sample} {_number(float(value))}"
+
+
+def render():
+    """All registered metrics in the Prometheus text format"""
+    samples = collect()
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render(samples)
+    return "\n".join(lines) + "\n"
+
+
+ROUTE_LABELS = ("route", "method")
+
+REQUESTS = Counter(
+    "bangazon_http_requests_total", "Responses sent, by route, method and status.",
+    ROUTE_LABELS + ("status",))
+ERRORS = Counter(
+    "bangazon_http_errors_total", "4xx and 5xx responses, by route, method and status class.",
+    ROUTE_LABELS + ("status_class",))
+DURATION = Histogram(
+    "bangazon_http_request_duration_seconds",
+    "Time from the request reaching Django until its response, or the end of a streamed body.",
+    ROUTE_LABELS, buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 10))
+QUERIES = Histogram(
+    "bangazon_http_db_queries", "SQL statements run per request.",
+    ROUTE_LABELS, buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100))
+RESPONSE_SIZE = Histogram(
+    "bangazon_http_response_size_bytes", "Size of response bodies.",
+    ROUTE_LABELS, buckets=tuple(4 ** power for power in range(4, 12)))
+CACHE = Counter(
+    "bangazon_response_cache_total", "Response cache lookups and stores, see bangazonapi/cache.py.",
+    ("result",))
+CACHE_HIT_RATIO = HitRatio(
+    "bangazon_response_cache_hit_ratio", "Response cache hits over lookups, across all workers.", CACHE)
+
+
+def route(request):
+    """Label for the URL pattern a request matched, bounded to the patterns in urls.py"""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.url_name or match.route or match.view_name
+
+
+class MetricsMiddleware:
+    """Record latency, queries, size and status of every request
+
+    A streamed response is recorded when it closes, with the time, queries
+    and bytes of its whole body.
+    """
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        @contextmanager
+        def counted():
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(count))
+                yield
+
+        started = time.perf_counter()
+        with counted():
+            response = self.get_response(request)
+
+        def finish(sent):
+            self.record(request, response, time.perf_counter() - started, queries[0], sent)
+
+        if not observe_stream(response, counted, finish):
+            # Other streams are only sized when they declare a Content-Length
+            if not response.streaming:
+                size = len(response.content)
+            elif response.has_header("Content-Length"):
+                size = int(response["Content-Length"])
+            else:
+                size = None
+            self.record(request, response, time.perf_counter() - started, queries[0], size)
+        return response
+
+    def record(self, request, response, duration, queries, size):
+        labels = {
+            "route": route(request),
+            "method": request.method if request.method in METHODS else "other",
+        }
+        status = response.status_code
+        samples = [(REQUESTS.key(REQUESTS.name, dict(labels, status=status)), 1)]
+        if status >= 400:
+            samples.append((ERRORS.key(ERRORS.name, dict(labels, status_class=f"{status // 100}xx")), 1))
+        samples += DURATION.samples(duration, labels)
+        samples += QUERIES.samples(queries, labels)
+        if size is not None:
+            samples += RESPONSE_SIZE.samples(size, labels)
+
+        process_file().add(samples)
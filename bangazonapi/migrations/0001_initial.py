@@ -0,0 +1,159 @@
+# Generated by Django 5.0.4 on 2026-10-18 13:56
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=55, unique=True)),
+                ('version', models.PositiveBigIntegerField(default=1)),
+            ],
+            options={
+                'verbose_name': 'modelversion',
+                'verbose_name_plural': 'modelversions',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductCategory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=55)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'productcategory',
+                'verbose_name_plural': 'productcategories',
+            },
+        ),
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number', models.CharField(max_length=15)),
+                ('address', models.CharField(max_length=55)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Favorite',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.customer')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='favorited_seller', to='bangazonapi.customer')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.DateTimeField(db_index=True, editable=False, null=True)),
+                ('deleted_by_cascade', models.BooleanField(default=False, editable=False)),
+                ('merchant_name', models.CharField(max_length=25)),
+                ('account_number', models.CharField(max_length=25)),
+                ('expiration_date', models.DateField(default='0000-00-00')),
+                ('create_date', models.DateField(default='0000-00-00')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='payment_types', to='bangazonapi.customer')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.customer')),
+                ('payment_type', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.payment')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.DateTimeField(db_index=True, editable=False, null=True)),
+                ('deleted_by_cascade', models.BooleanField(default=False, editable=False)),
+                ('name', models.CharField(max_length=50)),
+                ('price', models.FloatField(validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(17500.0)])),
+                ('description', models.CharField(max_length=255)),
+                ('quantity', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)])),
+                ('created_date', models.DateField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True, null=True)),
+                ('location', models.CharField(max_length=50)),
+                ('image_path', models.ImageField(null=True, upload_to='products')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='products', to='bangazonapi.customer')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='products', to='bangazonapi.productcategory')),
+            ],
+            options={
+                'verbose_name': 'product',
+                'verbose_name_plural': 'products',
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderProduct',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='lineitems', to='bangazonapi.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='lineitems', to='bangazonapi.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductRating',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.IntegerField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(5)])),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bangazonapi.customer')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='bangazonapi.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sold_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='bangazonapi.product')),
+            ],
+            options={
+                'verbose_name': 'productstats',
+                'verbose_name_plural': 'productstats',
+            },
+        ),
+        migrations.CreateModel(
+            name='Rating',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(5)])),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.customer')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.product')),
+            ],
+            options={
+                'verbose_name': 'rating',
+                'verbose_name_plural': 'ratings',
+            },
+        ),
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='customer', to='bangazonapi.customer')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='bangazonapi.product')),
+                ('recommender', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='recommender', to='bangazonapi.customer')),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.4 on 2026-10-18 14:05
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Fold each order's repeated lines for a product into one line carrying the units"""
+    OrderProduct = apps.get_model("bangazonapi", "OrderProduct")
+    groups = list(
+        OrderProduct.objects.values("order_id", "product_id")
+        .annotate(lines=Count("id"), units=Sum("quantity"), keep=Min("id"))
+        .filter(lines__gt=1)
+    )
+    for group in groups:
+        lines = OrderProduct.objects.filter(order_id=group["order_id"], product_id=group["product_id"])
+        lines.filter(pk=group["keep"]).update(quantity=group["units"])
+        lines.exclude(pk=group["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bangazonapi', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderproduct',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='unique_order_product'),
+        ),
+    ]
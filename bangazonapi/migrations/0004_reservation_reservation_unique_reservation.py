@@ -0,0 +1,31 @@
+# Generated by Django 5.0.4 on 2026-10-18 14:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bangazonapi', '0003_order_item_count_order_product_count_order_subtotal_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='bangazonapi.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='bangazonapi.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'expires_at'], name='bangazonapi_product_1b3512_idx'), models.Index(fields=['expires_at'], name='bangazonapi_expires_1f1134_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='unique_reservation'),
+        ),
+    ]
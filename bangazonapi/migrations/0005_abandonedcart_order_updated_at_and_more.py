@@ -0,0 +1,45 @@
+# Generated by Django 5.0.4 on 2026-10-18 14:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bangazonapi', '0004_reservation_reservation_unique_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AbandonedCart',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.PositiveIntegerField()),
+                ('created_date', models.DateField()),
+                ('last_activity', models.DateTimeField(null=True)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('subtotal', models.FloatField(default=0)),
+                ('lines', models.JSONField(default=list)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'abandonedcart',
+                'verbose_name_plural': 'abandonedcarts',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('payment_type__isnull', True)), fields=['updated_at'], name='open_order_activity_idx'),
+        ),
+        migrations.AddField(
+            model_name='abandonedcart',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='abandoned_carts', to='bangazonapi.customer'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-18 14:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bangazonapi', '0005_abandonedcart_order_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelversion',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
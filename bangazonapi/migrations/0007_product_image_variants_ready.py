@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bangazonapi', '0006_modelversion_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_variants_ready',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.4 on 2026-10-18 15:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bangazonapi', '0007_product_image_variants_ready'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='product',
+            name='updated_at',
+        ),
+        migrations.RemoveField(
+            model_name='productcategory',
+            name='updated_at',
+        ),
+    ]
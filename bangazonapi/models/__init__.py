@@ -8,3 +8,7 @@ from .recommendation import Recommendation
 from .rating import Rating
 from .favorite import Favorite
 from .productrating import ProductRating
+from .productstats import ProductStats
+from .modelversion import ModelVersion
+from .reservation import OutOfStock, Reservation
+from .abandonedcart import AbandonedCart
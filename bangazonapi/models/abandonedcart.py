@@ -0,0 +1,27 @@
+"""Archived copies of carts removed by the abandoned cart sweeper"""
+
+from django.db import models
+from .customer import Customer
+
+
+class AbandonedCart(models.Model):
+    """Snapshot of an open order deleted after sitting idle
+
+    `lines` holds [{"product_id", "quantity"}] so the cart can be analysed
+    or restored with POST /cart/items without keeping the live rows.
+    """
+
+    order_id = models.PositiveIntegerField()
+    customer = models.ForeignKey(
+        Customer, on_delete=models.DO_NOTHING, related_name="abandoned_carts"
+    )
+    created_date = models.DateField()
+    last_activity = models.DateTimeField(null=True)
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.FloatField(default=0)
+    lines = models.JSONField(default=list)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "abandonedcart"
+        verbose_name_plural = "abandonedcarts"
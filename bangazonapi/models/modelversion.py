@@ -0,0 +1,60 @@
+"""Version counters used to invalidate cached responses"""
+
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+
+class ModelVersion(models.Model):
+    """Counter bumped whenever rows of the named model change
+
+    Cached data is keyed on the current version, so bumping the counter
+    invalidates it in every worker without having to find the stale keys.
+    `changed_at` is the time of the last bump, the Last-Modified of every
+    response validated by the counter.
+    """
+
+    name = models.CharField(max_length=55, unique=True)
+    version = models.PositiveBigIntegerField(default=1)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def bump(cls, *names):
+        """Increment the counters for the given model names"""
+        cls.objects.bulk_create(
+            [cls(name=name, version=0) for name in names], ignore_conflicts=True
+        )
+        cls.objects.filter(name__in=names).update(
+            version=F("version") + 1, changed_at=timezone.now()
+        )
+
+    @classmethod
+    def current(cls, *names):
+        """Current counters for the given model names in a single query
+
+        Returns:
+            tuple -- Versions in the same order as `names`, 0 if never bumped
+        """
+        return cls.snapshot(*names)[0]
+
+    @classmethod
+    def snapshot(cls, *names):
+        """Current counters and the time of the latest bump in a single query
+
+        Returns:
+            tuple -- (versions in the same order as `names`, datetime of the
+                     latest bump of any of them or None if never bumped)
+        """
+        rows = {
+            name: (version, changed_at)
+            for name, version, changed_at in cls.objects.filter(name__in=names).values_list(
+                "name", "version", "changed_at"
+            )
+        }
+        versions = tuple(rows.get(name, (0, None))[0] for name in names)
+        changed_at = max((changed_at for _, changed_at in rows.values()), default=None)
+        return versions, changed_at
+
+    class Meta:
+        verbose_name = ("modelversion")
+        verbose_name_plural = ("modelversions")
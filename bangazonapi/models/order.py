@@ -1,7 +1,10 @@
 """Customer order model"""
 
 from django.db import models
+from django.db.models import Count, F, FloatField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Now
 from .customer import Customer
+from .orderproduct import OrderProduct
 from .payment import Payment
 
 
@@ -12,3 +15,79 @@ class Order(models.Model):
     )
     payment_type = models.ForeignKey(Payment, on_delete=models.DO_NOTHING, null=True)
     created_date = models.DateField(auto_now_add=True)
+    # Last change to the order or its line items, used to find abandoned carts
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+    # Cart summary, changed in the same transaction as the line items
+    item_count = models.PositiveIntegerField(default=0)
+    product_count = models.PositiveIntegerField(default=0)
+    subtotal = models.FloatField(default=0)
+
+    @property
+    def size(self):
+        """Number of units on the order, summed in the database
+
+        Returns:
+            int -- Total quantity across all line items
+        """
+        return self.lineitems.aggregate(size=Coalesce(Sum("quantity"), 0))["size"]
+
+    @classmethod
+    def adjust_summary(cls, order_id, items=0, products=0, subtotal=0):
+        """Apply a change in line items to an order's stored summary
+
+        Arguments:
+            order_id {int} -- Order whose line items changed
+            items {int} -- Change in units
+            products {int} -- Change in distinct products
+            subtotal {float} -- Change in total price
+        """
+        cls.objects.filter(pk=order_id).update(
+            item_count=F("item_count") + items,
+            product_count=F("product_count") + products,
+            subtotal=F("subtotal") + subtotal,
+            updated_at=Now(),
+        )
+
+    @classmethod
+    def refresh_summaries(cls, orders, touch=False):
+        """Recompute stored summaries from the line items in one UPDATE
+
+        Arguments:
+            orders {QuerySet} -- Orders to recompute
+            touch {boolean} -- Also record the customer's activity on the orders
+
+        Returns:
+            int -- Number of orders updated
+        """
+        lines = (
+            OrderProduct.objects.filter(order=OuterRef("pk"))
+            .order_by()
+            .values("order")
+        )
+
+        def total(expression, output_field):
+            return Coalesce(
+                Subquery(lines.annotate(total=expression).values("total"), output_field=output_field),
+                0,
+                output_field=output_field,
+            )
+
+        changes = {
+            "item_count": total(Sum("quantity"), models.IntegerField()),
+            "product_count": total(Count("id"), models.IntegerField()),
+            "subtotal": total(Sum(F("quantity") * F("product__price")), FloatField()),
+        }
+        if touch:
+            changes["updated_at"] = Now()
+        return orders.update(**changes)
+
+    class Meta:
+        indexes = [
+            # Open cart lookup: customer with no payment type
+            models.Index(fields=["customer", "payment_type"]),
+            models.Index(
+                fields=["updated_at"],
+                condition=Q(payment_type__isnull=True),
+                name="open_order_activity_idx",
+            ),
+        ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from .reservation import OutOfStock, Reservation
 
 
 class OrderProduct(models.Model):
@@ -10,3 +12,85 @@ class OrderProduct(models.Model):
     product = models.ForeignKey("Product",
                                 on_delete=models.DO_NOTHING,
                                 related_name="lineitems")
+
+    quantity = models.PositiveIntegerField(default=1)
+
+    @classmethod
+    def add(cls, order, product, quantity=1):
+        """Add units of a product to an order
+
+        An order has one line per product. Adding a product that is already
+        on the order increments that line's quantity in the database, so
+        concurrent adds are never lost. The order's summary changes in the
+        same transaction, and the line's stock hold is renewed.
+
+        Raises:
+            OutOfStock -- The line would hold more units than other carts leave free,
+            nothing is changed
+
+        Returns:
+            OrderProduct -- The line holding the product
+        """
+        lines = cls.objects.filter(order=order, product=product)
+        order_model = cls._meta.get_field("order").related_model
+        with transaction.atomic():
+            line = None
+            if not lines.update(quantity=F("quantity") + quantity):
+                try:
+                    with transaction.atomic():
+                        line = cls.objects.create(
+                            order=order, product=product, quantity=quantity
+                        )
+                except IntegrityError:
+                    # Another request created the line first
+                    lines.update(quantity=F("quantity") + quantity)
+
+            order_model.adjust_summary(
+                order.pk,
+                items=quantity,
+                products=1 if line else 0,
+                subtotal=quantity * product.price,
+            )
+            line = line or lines.get()
+            short = Reservation.shortfalls(order.pk, {product.pk: line.quantity})
+            if short:
+                raise OutOfStock(short)
+            Reservation.hold(order.pk, {product.pk: line.quantity})
+        return line
+
+    @classmethod
+    def remove(cls, order, product, quantity=1):
+        """Take units of a product off an order, dropping the line at zero
+
+        Returns:
+            boolean -- False when the product was not on the order
+        """
+        lines = cls.objects.filter(order=order, product=product)
+        order_model = cls._meta.get_field("order").related_model
+        with transaction.atomic():
+            line = lines.select_for_update().select_related("product").first()
+            if line is None:
+                return False
+
+            if line.quantity > quantity:
+                lines.update(quantity=F("quantity") - quantity)
+                removed, products = quantity, 0
+            else:
+                line.delete()
+                removed, products = line.quantity, 1
+            Reservation.hold(order.pk, {line.product_id: line.quantity - removed})
+
+            order_model.adjust_summary(
+                order.pk,
+                items=-removed,
+                products=-products,
+                subtotal=-removed * line.product.price,
+            )
+        return True
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["order", "product"], name="unique_order_product"
+            )
+        ]
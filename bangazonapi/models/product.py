@@ -1,17 +1,109 @@
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import ExpressionWrapper, F, FloatField, IntegerField, Sum
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf
+from safedelete.managers import SafeDeleteManager
 from safedelete.models import SafeDeleteModel
 from safedelete.models import SOFT_DELETE
+from safedelete.queryset import SafeDeleteQueryset
+from bangazonapi import search
 from .customer import Customer
 from .productcategory import ProductCategory
 from .orderproduct import OrderProduct
-from .productrating import ProductRating
+from .productstats import ProductStats
+from .reservation import Reservation
 from django.core.exceptions import ValidationError
 
 
+class ProductQuerySet(SafeDeleteQueryset):
+    """Queryset for products with database-side calculated attributes"""
+
+    def with_stats(self):
+        """Annotate each product with its sales count and average rating
+
+        The values come from the ProductStats counters joined into the same
+        query, so listing any number of products costs a single query
+        instead of extra queries per row.
+
+        Returns:
+            QuerySet -- Products annotated with `sold_count` and `rating_avg`
+        """
+        return self.annotate(
+            sold_count=Coalesce(F("stats__sold_count"), 0),
+            rating_avg=ExpressionWrapper(
+                Cast("stats__rating_sum", FloatField())
+                / NullIf("stats__rating_count", 0),
+                output_field=FloatField(),
+            ),
+        )
+
+    def with_availability(self):
+        """Annotate each product with the units not held in carts
+
+        Uses an indexed subquery over active reservations. Availability
+        changes with every cart write, so it is kept out of the cached
+        and validated product bodies and served by GET /products/availability.
+
+        Returns:
+            QuerySet -- Products annotated with `available`
+        """
+        return self.annotate(
+            available=Greatest(F("quantity") - Reservation.held_subquery(), 0),
+        )
+
+    def filter_sold(self, min_sold=None, max_sold=None, since=None):
+        """Filter products by how many units have been sold
+
+        Arguments:
+            min_sold {int} -- Keep products that sold at least this many
+            max_sold {int} -- Keep products that sold at most this many
+            since {date} -- Only count sales on orders created on or after this date
+
+        Returns:
+            QuerySet -- Products matching the sales bounds
+        """
+        if min_sold is None and max_sold is None:
+            return self
+
+        if since is None and "sold_count" in self.query.annotations:
+            sold_field = "sold_count"
+            products = self
+        else:
+            sold = OrderProduct.objects.filter(
+                product=OuterRef("pk"), order__payment_type__isnull=False
+            )
+            if since is not None:
+                sold = sold.filter(order__created_date__gte=since)
+            sold = sold.values("product").annotate(total=Sum("quantity")).values("total")
+
+            sold_field = "sold_in_window"
+            products = self.annotate(
+                sold_in_window=Coalesce(Subquery(sold, output_field=IntegerField()), 0)
+            )
+
+        if min_sold is not None:
+            products = products.filter(**{f"{sold_field}__gte": min_sold})
+        if max_sold is not None:
+            products = products.filter(**{f"{sold_field}__lte": max_sold})
+
+        return products
+
+    def search(self, text, field="all"):
+        """Full-text search over product names and descriptions
+
+        See `bangazonapi.search` for the index behind each database backend.
+
+        Returns:
+            QuerySet -- Matching products annotated with `search_rank`
+        """
+        return search.search(self, text, field=field)
+
+
 class Product(SafeDeleteModel):
 
     _safedelete_policy = SOFT_DELETE
+    objects = SafeDeleteManager.from_queryset(ProductQuerySet)()
     name = models.CharField(
         max_length=50,
     )
@@ -41,6 +133,8 @@ class Product(SafeDeleteModel):
         max_length=None,
         null=True,
     )
+    # Set once every resized variant of image_path is on disk, see bangazonapi/derivatives.py
+    image_variants_ready = models.BooleanField(default=False)
 
     def clean(self):
         super().clean()
@@ -54,10 +148,10 @@ class Product(SafeDeleteModel):
         Returns:
             int -- Number items on completed orders
         """
-        sold = OrderProduct.objects.filter(
-            product=self, order__payment_type__isnull=False
-        )
-        return sold.count()
+        try:
+            return self.stats.sold_count
+        except ProductStats.DoesNotExist:
+            return 0
 
     @property
     def can_be_rated(self):
@@ -79,17 +173,10 @@ class Product(SafeDeleteModel):
         Returns:
             number -- The average rating for the product
         """
-        ratings = ProductRating.objects.filter(product=self)
-        total_rating = 0
-        for rating in ratings:
-            total_rating += rating.rating
-
         try:
-            avg = total_rating / len(ratings)
-            return avg
-        except ZeroDivisionError:
-            avg = 0
-            return avg
+            return self.stats.average_rating
+        except ProductStats.DoesNotExist:
+            return 0
 
     class Meta:
         verbose_name = "product"
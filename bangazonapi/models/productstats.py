@@ -0,0 +1,84 @@
+"""Denormalized sales and rating counters for products"""
+
+from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from .modelversion import ModelVersion
+
+
+class ProductStats(models.Model):
+    """Running totals kept in step with completed orders and ratings
+
+    Rows are only ever changed with F() expressions so concurrent writers
+    never overwrite each other. `rebuild_product_stats` recomputes the
+    table from OrderProduct and ProductRating if it ever drifts.
+    """
+
+    product = models.OneToOneField(
+        "Product", on_delete=models.CASCADE, related_name="stats"
+    )
+    sold_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+
+    @property
+    def average_rating(self):
+        """Average rating from the running totals
+
+        Returns:
+            number -- The average rating, 0 when the product is unrated
+        """
+        if self.rating_count == 0:
+            return 0
+        return self.rating_sum / self.rating_count
+
+    @classmethod
+    def ensure(cls, product_ids):
+        """Create missing counter rows for the given products"""
+        cls.objects.bulk_create(
+            [cls(product_id=product_id) for product_id in product_ids],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def record_sale(cls, order):
+        """Add the line items of a newly paid order to the sold counters
+
+        Arguments:
+            order {Order} -- Order that just received a payment type
+        """
+        product_ids = list(order.lineitems.values_list("product_id", flat=True).distinct())
+        cls.ensure(product_ids)
+
+        # One UPDATE for the whole order, whatever its number of line items
+        sold = (
+            order.lineitems.filter(product=OuterRef("product_id"))
+            .values("product_id")
+            .annotate(total=Sum("quantity"))
+            .values("total")
+        )
+        cls.objects.filter(product_id__in=product_ids).update(
+            sold_count=F("sold_count") + Subquery(sold)
+        )
+        ModelVersion.bump("product")
+
+    @classmethod
+    def record_rating(cls, product_id, delta, count_delta):
+        """Apply a change in rating score and number of ratings
+
+        Arguments:
+            product_id {int} -- Rated product
+            delta {int} -- Change to the sum of all ratings
+            count_delta {int} -- Change to the number of ratings
+        """
+        if count_delta > 0:
+            # Removals never create a row, the product may be getting deleted
+            cls.ensure([product_id])
+        cls.objects.filter(product_id=product_id).update(
+            rating_sum=F("rating_sum") + delta,
+            rating_count=F("rating_count") + count_delta,
+        )
+        ModelVersion.bump("product")
+
+    class Meta:
+        verbose_name = "productstats"
+        verbose_name_plural = "productstats"
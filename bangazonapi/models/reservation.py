@@ -0,0 +1,157 @@
+"""Time limited holds on stock for products sitting in carts"""
+
+import datetime
+from django.conf import settings
+from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def hold_ttl():
+    return datetime.timedelta(
+        seconds=getattr(settings, "RESERVATION_TTL_SECONDS", 15 * 60)
+    )
+
+
+class OutOfStock(Exception):
+    """Raised when line items ask for more units than are in stock
+
+    `shortfalls` lists {"product_id", "requested", "available"} for every
+    line item that could not be filled.
+    """
+
+    def __init__(self, shortfalls):
+        super().__init__("Not enough stock for some products")
+        self.shortfalls = shortfalls
+
+
+class Reservation(models.Model):
+    """Units of a product held for an open order until `expires_at`
+
+    There is one hold per cart line, always matching the line's quantity.
+    Adding to the line renews the hold. A cart write is refused when a line
+    would need more units than are in stock and not held for other carts,
+    see `shortfalls`. The check and the hold are two statements, so
+    concurrent adds can briefly hold more than the stock; checkout's
+    conditional stock decrement, which also leaves other carts' holds
+    alone, stays the final word on what can be sold. Expired holds stop
+    counting at once and are deleted later by the sweeper in
+    `bangazonapi.reservations`.
+
+    Holds change on every cart write, so they never bump the product
+    ModelVersion. Cached product bodies leave availability out, see
+    `ProductQuerySet.with_availability`.
+    """
+
+    order = models.ForeignKey(
+        "Order", on_delete=models.CASCADE, related_name="reservations"
+    )
+    product = models.ForeignKey(
+        "Product", on_delete=models.CASCADE, related_name="reservations"
+    )
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    @classmethod
+    def active(cls):
+        return cls.objects.filter(expires_at__gt=timezone.now())
+
+    @classmethod
+    def held_subquery(cls, product_ref=None, exclude_order=None):
+        """Units under active holds for a product, as a subquery expression
+
+        The (product, expires_at) index turns this into a range scan of the
+        product's unexpired holds.
+
+        Arguments:
+            exclude_order {int} -- Leave out this order's own holds
+        """
+        held = cls.active().filter(
+            product=product_ref if product_ref is not None else OuterRef("pk")
+        )
+        if exclude_order is not None:
+            held = held.exclude(order_id=exclude_order)
+        held = (
+            held.order_by()
+            .values("product")
+            .annotate(total=Sum("quantity"))
+            .values("total")
+        )
+        return Coalesce(Subquery(held, output_field=models.IntegerField()), 0)
+
+    @classmethod
+    def held(cls, product_id):
+        """Units under active holds for one product"""
+        return cls.active().filter(product_id=product_id).aggregate(
+            total=Coalesce(Sum("quantity"), 0)
+        )["total"]
+
+    @classmethod
+    def shortfalls(cls, order_id, quantities):
+        """Lines of an order asking for more units than other carts leave free
+
+        Arguments:
+            order_id {int} -- Order the lines belong to, its own holds do not count
+            quantities {dict} -- Line quantity keyed by product id
+
+        Returns:
+            list -- {"product_id", "requested", "available"} per line that does not fit
+        """
+        wanted = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+        if not wanted:
+            return []
+        product_model = cls._meta.get_field("product").related_model
+        available = dict(
+            product_model.objects.filter(pk__in=wanted)
+            .annotate(available=F("quantity") - cls.held_subquery(exclude_order=order_id))
+            .values_list("id", "available")
+        )
+        return [
+            {
+                "product_id": product_id,
+                "requested": quantity,
+                "available": max(available.get(product_id, 0), 0),
+            }
+            for product_id, quantity in wanted.items()
+            if available.get(product_id, 0) < quantity
+        ]
+
+    @classmethod
+    def hold(cls, order_id, quantities):
+        """Create or renew the holds of an order's lines
+
+        Arguments:
+            order_id {int} -- Open order holding the stock
+            quantities {dict} -- Line quantity keyed by product id, 0 releases the hold
+        """
+        expires_at = timezone.now() + hold_ttl()
+        cls.objects.bulk_create(
+            [
+                cls(order_id=order_id, product_id=product_id, quantity=quantity, expires_at=expires_at)
+                for product_id, quantity in quantities.items()
+                if quantity > 0
+            ],
+            update_conflicts=True,
+            unique_fields=["order", "product"],
+            update_fields=["quantity", "expires_at"],
+        )
+        released = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+        if released:
+            cls.objects.filter(order_id=order_id, product_id__in=released).delete()
+
+    @classmethod
+    def release(cls, order_id):
+        """Drop every hold of an order, after checkout or when the cart is emptied"""
+        cls.objects.filter(order_id=order_id).delete()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["order", "product"], name="unique_reservation"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["product", "expires_at"]),
+            models.Index(fields=["expires_at"]),
+        ]
@@ -0,0 +1,182 @@
+"""Keyset pagination for the hand-written ViewSet list methods"""
+
+import base64
+import binascii
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination keyed on the ordering columns plus the primary key
+
+    Each page is fetched with a `WHERE (column, id) > (last_column, last_id)`
+    style condition instead of an OFFSET, so page 500 costs the same as page 1.
+    The ordering comes from the queryset's `order_by()` when one is active,
+    otherwise from the view's `pagination_ordering` attribute.
+
+    Pagination is opt-in: a request is only paginated when it sends a
+    `page_size` or `cursor` query param, so existing clients keep getting
+    plain arrays.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = 10
+    max_page_size = 100
+    default_ordering = ("created_date", "id")
+    invalid_cursor_message = "Invalid cursor"
+
+    def is_requested(self, request):
+        """Whether the client asked for a paginated response
+
+        Returns:
+            boolean -- True if a cursor or page size query param was sent
+        """
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset, view)
+
+        position, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self._flip(field) for field in ordering]
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._keyset_filter(ordering, position))
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_previous = has_more
+            self.has_next = position is not None
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_page_size(self, request):
+        """Page size requested by the client, capped at `max_page_size`"""
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, queryset, view):
+        """Ordering columns for the keyset, always ending with the primary key
+
+        Returns:
+            list -- Field names, prefixed with `-` for descending columns
+        """
+        ordering = list(queryset.query.order_by)
+        if not ordering:
+            ordering = list(getattr(view, "pagination_ordering", self.default_ordering))
+
+        if ordering[-1].lstrip("-") not in ("id", "pk"):
+            tie_breaker = "-id" if ordering[0].startswith("-") else "id"
+            ordering.append(tie_breaker)
+
+        return ordering
+
+    def decode_cursor(self, request):
+        """Decode the opaque cursor query param
+
+        Returns:
+            tuple -- Key values of the row the page starts after, and whether
+                     the page is fetched backwards
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            position = cursor["p"]
+            reverse = bool(cursor.get("r", False))
+        except (binascii.Error, ValueError, TypeError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def encode_cursor(self, instance, reverse):
+        """Build the page URL that continues from `instance`"""
+        position = [self._key_value(instance, field) for field in self.ordering]
+        cursor = json.dumps({"p": position, "r": reverse}, cls=DjangoJSONEncoder)
+        encoded = base64.urlsafe_b64encode(cursor.encode("utf-8")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    @staticmethod
+    def _key_value(instance, field):
+        value = getattr(instance, field.lstrip("-"))
+        if isinstance(value, models.Model):
+            return value.pk
+        if isinstance(value, models.fields.files.FieldFile):
+            return value.name
+        return value
+
+    @staticmethod
+    def _keyset_filter(ordering, position):
+        """Rows strictly after `position` in the given ordering
+
+        (a, b) > (x, y) is expanded to `a > x OR (a = x AND b > y)` so that
+        mixed ascending and descending columns are handled.
+        """
+        condition = Q()
+        equal_so_far = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal_so_far & Q(**{f"{name}__{lookup}": value})
+            equal_so_far &= Q(**{name: value})
+        return condition
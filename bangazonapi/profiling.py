@@ -0,0 +1,268 @@
+"""Per-request timing in a Server-Timing header, and sampled cProfile dumps
+
+`ServerTimingMiddleware` times these phases of each request:
+
+* `auth` -- DRF authentication, usually the token lookup
+* `view` -- the view, from its call until it returns a response
+* `serialize` -- `serializer.data` of the view's outermost serializers
+* `render` -- turning the DRF response into JSON
+* `db` -- every SQL statement, with the statement count
+* `total` -- the whole request through the rest of the middleware
+
+The phases overlap: a query run while serializing counts towards both
+`serialize` and `db`. With SERVER_TIMING on, the times are sent in a
+`Server-Timing` header that browser dev tools display per request:
+
+    Server-Timing: auth;dur=0.9, db;dur=4.2;desc="5 queries", serialize;dur=2.8, ...
+
+Profiling is independent of the header. A share of requests set by
+PROFILE_SAMPLE_RATE, and every request whose `X-Profile` header equals
+PROFILE_TOKEN, is run under cProfile. The stats are written to
+PROFILE_DIR and named in the header's `profile` entry. Open them with
+`python -m pstats` or snakeviz.
+
+A streamed response sends its headers before the body is produced, so its
+Server-Timing header only covers the request up to the view's return.
+The chunks are still timed and profiled as they are sent, and when the
+response closes the full timings are logged to `bangazonapi.profiling`
+and the profile is written under the name the header announced.
+
+Only one cProfile profiler can run in a process at a time, and Python
+3.12 raises when a second one is enabled. A request chosen for profiling
+while another is profiled, in a threaded server, is timed but not
+profiled.
+
+When SERVER_TIMING is off, the sample rate is 0 and no token is set,
+the middleware raises MiddlewareNotUsed. Django then leaves it out of
+the chain, so disabled profiling costs nothing. While it is enabled,
+`BaseSerializer.data` and `APIView.perform_authentication` are wrapped,
+so that all views are covered without changes to each of them. Loading
+the middleware with profiling turned off puts the originals back.
+"""
+
+import contextlib
+import contextvars
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+from rest_framework.views import APIView
+from bangazonapi.streaming import observe_stream
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PHASES = ("auth", "view", "db", "serialize", "render", "total")
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("request_timer", default=None)
+# Held by the request being profiled
+_profiler_lock = threading.Lock()
+# Wrapped attributes and their originals, while instrumented
+_originals = {}
+
+
+class RequestTimer:
+    """Accumulated seconds per phase for one request"""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.queries = 0
+        self.active = set()
+        self.started = {}
+        self.profile = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # A phase entered again from inside itself is only counted once
+        if name in self.active:
+            yield
+            return
+        self.active.add(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] += time.perf_counter() - started
+            self.active.discard(name)
+
+    def start(self, name):
+        self.started[name] = time.perf_counter()
+
+    def stop(self, name):
+        started = self.started.pop(name, None)
+        if started is not None:
+            self.durations[name] += time.perf_counter() - started
+
+    def execute(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook timing every statement"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations["db"] += time.perf_counter() - started
+            self.queries += 1
+
+    def header(self):
+        entries = []
+        for name in PHASES:
+            if name not in self.durations:
+                continue
+            entry = f"{name};dur={self.durations[name] * 1000:.2f}"
+            if name == "db":
+                entry += f';desc="{self.queries} queries"'
+            entries.append(entry)
+        if self.profile:
+            entries.append(f'profile;desc="{os.path.basename(self.profile)}"')
+        return ", ".join(entries)
+
+
+def phase(name):
+    """Time a block as `name` for the current request, a no-op when it is not timed"""
+    timer = _current.get()
+    return timer.phase(name) if timer is not None else contextlib.nullcontext()
+
+
+def _instrument():
+    """Time DRF authentication and serializer.data, until `_uninstrument()`"""
+    if _originals:
+        return
+
+    data = BaseSerializer.data
+
+    def timed_data(self):
+        with phase("serialize"):
+            return data.fget(self)
+
+    perform_authentication = APIView.perform_authentication
+
+    def timed_authentication(self, request):
+        with phase("auth"):
+            return perform_authentication(self, request)
+
+    _originals[(BaseSerializer, "data")] = data
+    _originals[(APIView, "perform_authentication")] = perform_authentication
+    BaseSerializer.data = property(timed_data, doc=data.__doc__)
+    APIView.perform_authentication = timed_authentication
+
+
+def _uninstrument():
+    """Put back the attributes `_instrument()` wrapped"""
+    while _originals:
+        (owner, name), original = _originals.popitem()
+        setattr(owner, name, original)
+
+
+class ServerTimingMiddleware:
+    """Add Server-Timing to responses and profile sampled requests"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.timing = getattr(settings, "SERVER_TIMING", False)
+        self.sample_rate = getattr(settings, "PROFILE_SAMPLE_RATE", 0)
+        self.token = getattr(settings, "PROFILE_TOKEN", "")
+        self.profile_dir = getattr(settings, "PROFILE_DIR", "profiles")
+
+        if not (self.timing or self.sample_rate > 0 or self.token):
+            _uninstrument()
+            raise MiddlewareNotUsed()
+        _instrument()
+
+    def should_profile(self, request):
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return True
+        sent = request.META.get(PROFILE_HEADER)
+        return bool(self.token and sent and hmac.compare_digest(sent, self.token))
+
+    def __call__(self, request):
+        profile = self.should_profile(request)
+        if profile and not _profiler_lock.acquire(blocking=False):
+            logger.info("Not profiling %s %s, another request is profiled", request.method, request.path)
+            profile = False
+        if not (self.timing or profile):
+            return self.get_response(request)
+
+        timer = RequestTimer()
+        profiler = cProfile.Profile() if profile else None
+        streamed = False
+        try:
+            with self.observe(timer, profiler):
+                response = self.get_response(request)
+            timer.stop("view")
+            if profiler:
+                timer.profile = self.profile_path(request)
+
+            streamed = observe_stream(
+                response,
+                lambda: self.observe(timer, profiler),
+                lambda sent: self.finish_stream(request, timer, profiler),
+            )
+            if profiler and not streamed:
+                profiler.dump_stats(timer.profile)
+        finally:
+            # A stream keeps profiling while it is sent, finish_stream releases it
+            if profiler and not streamed:
+                _profiler_lock.release()
+        response["Server-Timing"] = timer.header()
+        return response
+
+    @contextlib.contextmanager
+    def observe(self, timer, profiler):
+        """Count a block towards the request: its SQL, the `total` phase and the profile"""
+        reset = _current.set(timer)
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer.execute))
+                with timer.phase("total"):
+                    if profiler:
+                        profiler.enable()
+                    try:
+                        yield
+                    finally:
+                        if profiler:
+                            profiler.disable()
+        finally:
+            _current.reset(reset)
+
+    def finish_stream(self, request, timer, profiler):
+        """Write the profile and log the timings of a streamed response once it is sent"""
+        if profiler:
+            try:
+                profiler.dump_stats(timer.profile)
+            finally:
+                _profiler_lock.release()
+        logger.info("Server-Timing of streamed %s %s: %s", request.method, request.path, timer.header())
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = _current.get()
+        if timer is not None:
+            timer.start("view")
+
+    def process_template_response(self, request, response):
+        """DRF responses render after this, time it until the last render callback"""
+        timer = _current.get()
+        if timer is not None:
+            timer.stop("view")
+            timer.start("render")
+            response.add_post_render_callback(lambda rendered: timer.stop("render"))
+        return response
+
+    def profile_path(self, request):
+        """Path in PROFILE_DIR for the request's cProfile stats
+
+        Returns:
+            str -- Path of the .prof file
+        """
+        os.makedirs(self.profile_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", request.path).strip("-") or "root"
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{time.time_ns() % 10**9:09d}-{request.method}-{slug}.prof"
+        return os.path.join(self.profile_dir, name)
@@ -0,0 +1,49 @@
+"""In-process sweeper deleting expired stock reservations
+
+Expired holds already stop counting against availability, because every
+read filters on `expires_at`. The sweeper only keeps the reservation table
+and its indexes small, so deleting them changes no response. It deletes
+in batches of primary keys so no single statement holds the table for
+long during a flash sale.
+
+`start_sweeper()` is called from `bangazon/wsgi.py`, so each web worker
+process runs one sweeper thread (see `bangazonapi.scheduler`).
+"""
+
+from django.conf import settings
+from django.utils import timezone
+from bangazonapi import scheduler
+from bangazonapi.models import Reservation
+
+
+def sweep(batch_size=None):
+    """Delete expired reservations in batches
+
+    Returns:
+        int -- Number of reservations deleted
+    """
+    batch_size = batch_size or getattr(settings, "RESERVATION_SWEEP_BATCH_SIZE", 500)
+    now = timezone.now()
+    deleted = 0
+
+    while True:
+        expired = list(
+            Reservation.objects.filter(expires_at__lte=now)
+            .order_by("expires_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not expired:
+            break
+        deleted += Reservation.objects.filter(id__in=expired).delete()[0]
+
+    return deleted
+
+
+def start_sweeper():
+    """Start this process's sweeper unless RESERVATION_SWEEP_INTERVAL is 0
+
+    Returns:
+        PeriodicTask -- The running sweeper, or None when disabled
+    """
+    interval = getattr(settings, "RESERVATION_SWEEP_INTERVAL", 60)
+    return scheduler.schedule("reservation-sweeper", interval, sweep)
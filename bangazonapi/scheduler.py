@@ -0,0 +1,55 @@
+"""Periodic maintenance threads running inside web worker processes
+
+`bangazon/wsgi.py` starts the tasks when a worker boots, so they never
+run under management commands or tests. Each task is a daemon thread
+that closes its database connection after every run.
+"""
+
+import logging
+import threading
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+_tasks_lock = threading.Lock()
+
+
+class PeriodicTask(threading.Thread):
+    """Daemon thread calling `func()` every `interval` seconds"""
+
+    def __init__(self, name, interval, func):
+        super().__init__(name=name, daemon=True)
+        self.interval = interval
+        self.func = func
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.func()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Periodic task %s failed", self.name)
+            finally:
+                connection.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def schedule(name, interval, func):
+    """Start a named task in this process unless it is running or `interval` is 0
+
+    Returns:
+        PeriodicTask -- The running task, or None when disabled
+    """
+    if interval <= 0:
+        return None
+
+    with _tasks_lock:
+        task = _tasks.get(name)
+        if task is None or not task.is_alive():
+            task = PeriodicTask(name, interval, func)
+            task.start()
+            _tasks[name] = task
+        return task
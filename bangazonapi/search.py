@@ -0,0 +1,199 @@
+"""Full-text search index over product names and descriptions
+
+SQLite uses an FTS5 virtual table that mirrors the live (not soft-deleted)
+products and is kept in sync by the signal handlers in `signals.py`.
+PostgreSQL uses GIN expression indexes over `to_tsvector()`, which the
+database maintains itself. Any other backend falls back to `icontains`.
+
+Search terms are matched as prefixes, so `?q=kit fl` finds "Kite" that
+"flies high", and results are ordered by relevance.
+"""
+
+import re
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "bangazonapi_product_fts"
+PRODUCT_TABLE = "bangazonapi_product"
+TS_CONFIG = "english"
+TS_DOCUMENTS = {
+    "name": "coalesce({table}name, '')",
+    "all": "coalesce({table}name, '') || ' ' || coalesce({table}description, '')",
+}
+TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Aliases whose database is known to have the FTS5 table
+_fts_installed = set()
+
+
+def _terms(text):
+    return TERM_PATTERN.findall(text or "")
+
+
+def install(using="default"):
+    """Create the search index structures for a database if they are missing
+
+    Called after every migrate. Returns False when the backend has no
+    full-text support, in which case searches use `icontains`.
+    """
+    conn = connections[using]
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                    "USING fts5(name, description, tokenize='unicode61')"
+                )
+            except Exception:  # pylint: disable=broad-except
+                # SQLite compiled without FTS5
+                return False
+            _fts_installed.add(using)
+            return True
+
+        if conn.vendor == "postgresql":
+            for key, document in TS_DOCUMENTS.items():
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {PRODUCT_TABLE}_search_{key} "
+                    f"ON {PRODUCT_TABLE} USING GIN "
+                    f"(to_tsvector('{TS_CONFIG}', {document.format(table='')}))"
+                )
+            return True
+
+    return False
+
+
+def _fts_available(conn):
+    if conn.vendor != "sqlite":
+        return False
+    if conn.alias in _fts_installed:
+        return True
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+        )
+        if cursor.fetchone() is None:
+            return False
+    _fts_installed.add(conn.alias)
+    return True
+
+
+def index_products(products, using="default"):
+    """Add, refresh or remove products in the SQLite FTS table
+
+    Soft-deleted products are removed so they never match a search.
+
+    Arguments:
+        products {iterable} -- Product instances to synchronize
+    """
+    conn = connections[using]
+    if not _fts_available(conn):
+        return
+
+    products = list(products)
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+            [(product.pk,) for product in products],
+        )
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)",
+            [
+                (product.pk, product.name, product.description)
+                for product in products
+                if product.deleted is None
+            ],
+        )
+
+
+def unindex_products(product_ids, using="default"):
+    """Remove products from the SQLite FTS table"""
+    conn = connections[using]
+    if not _fts_available(conn):
+        return
+
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+            [(product_id,) for product_id in product_ids],
+        )
+
+
+def rebuild(using="default"):
+    """Repopulate the SQLite FTS table from the product table
+
+    Returns:
+        int -- Number of products indexed
+    """
+    conn = connections[using]
+    if not _fts_available(conn):
+        return 0
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+            f"SELECT id, name, description FROM {PRODUCT_TABLE} WHERE deleted IS NULL"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def search(queryset, text, field="all"):
+    """Restrict a product queryset to matches for `text`
+
+    Arguments:
+        queryset {QuerySet} -- Products to search within
+        text {str} -- User supplied search terms
+        field {str} -- "name" to only search names, "all" for name and description
+
+    Returns:
+        QuerySet -- Matching products annotated with `search_rank`, where a
+                    lower rank is a better match
+    """
+    terms = _terms(text)
+    if not terms:
+        return queryset.none()
+
+    conn = connections[queryset.db]
+
+    if _fts_available(conn):
+        match = " ".join(f'"{term}"*' for term in terms)
+        if field == "name":
+            match = f"name : ({match})"
+        matching = RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,)
+        )
+        rank = RawSQL(
+            f"SELECT rank FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = {PRODUCT_TABLE}.id",
+            (match,),
+        )
+        return queryset.filter(id__in=matching).annotate(search_rank=rank)
+
+    if conn.vendor == "postgresql":
+        template = f"to_tsvector('{TS_CONFIG}', {TS_DOCUMENTS[field]})"
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        matching = RawSQL(
+            f"SELECT id FROM {PRODUCT_TABLE} "
+            f"WHERE {template.format(table='')} @@ to_tsquery('{TS_CONFIG}', %s)",
+            (tsquery,),
+        )
+        rank = RawSQL(
+            f"-ts_rank({template.format(table=PRODUCT_TABLE + '.')}, "
+            f"to_tsquery('{TS_CONFIG}', %s))",
+            (tsquery,),
+        )
+        return queryset.filter(id__in=matching).annotate(search_rank=rank)
+
+    columns = ["name"] if field == "name" else ["name", "description"]
+    condition = Q()
+    for term in terms:
+        term_condition = Q()
+        for column in columns:
+            term_condition |= Q(**{f"{column}__icontains": term})
+        condition &= term_condition
+    return queryset.filter(condition).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    )
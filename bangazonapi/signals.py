@@ -0,0 +1,91 @@
+"""Signal handlers that keep denormalized product data in sync"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from bangazonapi import search
+from bangazonapi.models import ModelVersion, Order, Product, ProductCategory
+from bangazonapi.models import ProductRating, ProductStats
+
+
+@receiver(post_init, sender=ProductRating)
+def remember_rating(sender, instance, **kwargs):
+    """Keep the loaded score so an edit can be applied as a delta"""
+    instance._stored_rating = instance.rating if instance.pk else None
+
+
+@receiver(post_save, sender=ProductRating)
+def count_rating(sender, instance, created, raw=False, **kwargs):
+    """Add a new or edited rating to the product's running totals"""
+    if raw:
+        # Fixtures are counted by the rebuild_product_stats command
+        return
+
+    with transaction.atomic():
+        if created or instance._stored_rating is None:
+            ProductStats.record_rating(instance.product_id, instance.rating, 1)
+        elif instance.rating != instance._stored_rating:
+            ProductStats.record_rating(
+                instance.product_id, instance.rating - instance._stored_rating, 0
+            )
+    instance._stored_rating = instance.rating
+
+
+@receiver(post_delete, sender=ProductRating)
+def uncount_rating(sender, instance, **kwargs):
+    """Remove a deleted rating from the product's running totals"""
+    rating = instance._stored_rating
+    if rating is None:
+        rating = instance.rating
+    ProductStats.record_rating(instance.product_id, -rating, -1)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, using="default", **kwargs):
+    """Refresh the search index, soft-deleted products are dropped from it"""
+    search.index_products([instance], using=using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using="default", **kwargs):
+    """Remove a hard-deleted product from the search index"""
+    search.unindex_products([instance.pk], using=using)
+
+
+@receiver(post_init, sender=Product)
+def remember_price(sender, instance, **kwargs):
+    """Keep the loaded price so a change can be pushed to open carts"""
+    instance._stored_price = instance.price if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+def reprice_open_carts(sender, instance, created, raw=False, **kwargs):
+    """Recompute the subtotal of open carts holding a repriced product"""
+    if raw or created or instance.price == instance._stored_price:
+        return
+
+    Order.refresh_summaries(
+        Order.objects.filter(
+            payment_type__isnull=True, lineitems__product=instance
+        )
+    )
+    instance._stored_price = instance.price
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_product_version(sender, **kwargs):
+    """Invalidate cached product responses, soft-delete and restore are saves"""
+    ModelVersion.bump("product")
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def bump_category_version(sender, **kwargs):
+    """Invalidate cached category responses"""
+    ModelVersion.bump("productcategory")
+
+
+def install_search_index(sender, using="default", **kwargs):
+    """Create the full-text index structures once the tables exist"""
+    search.install(using=using)
@@ -0,0 +1,307 @@
+"""Log of slow SQL statements with their query plans
+
+Every database connection gets an execute wrapper when it is created (see
+`BangazonapiConfig.ready`). A statement that takes longer than
+SLOW_QUERY_MS is written to the `bangazonapi.slowqueries` logger as one
+JSON object per line. The settings send that logger to a rotating file,
+SLOW_QUERY_LOG. Each entry has:
+
+* `sql`, `params` -- the statement as Django ran it, with its bound params
+* `fingerprint`, `statement` -- a hash of the SQL with literals, params and
+  `IN (...)` lists normalized, and that normalized SQL
+* `caller` -- the innermost function of this project on the stack, and
+  `stack` -- the project's functions from there out, such as the
+  serializer, then `Products.list` in bangazonapi/views/product.py
+* `plan` -- `EXPLAIN QUERY PLAN` on SQLite, `EXPLAIN (ANALYZE, BUFFERS)` on
+  PostgreSQL
+
+The plan is captured for the first slow run of a fingerprint, and again at
+most once per SLOW_QUERY_EXPLAIN_INTERVAL seconds, so a statement that is
+slow on every request is not run twice on every request. PostgreSQL only
+analyzes SELECT statements, because EXPLAIN ANALYZE executes the statement.
+The EXPLAIN runs on the backend's cursor, outside the execute wrappers, so
+the metrics and profiling middleware do not count it as one of the
+request's queries.
+
+The log is off unless SLOW_QUERY_MS is set.
+
+`python manage.py slow_queries` groups the log by fingerprint.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from logging.handlers import RotatingFileHandler
+from django.conf import settings
+from django.db import DatabaseError, NotSupportedError
+
+logger = logging.getLogger(__name__)
+
+MAX_SQL_LENGTH = 10000
+MAX_PARAMS = 50
+MAX_FINGERPRINTS = 10000
+MAX_FRAMES = 8
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?(?![\w\"])")
+_PARAM = re.compile(r"%s|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+_READ = re.compile(r"\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+_state = threading.local()
+_lock = threading.Lock()
+_explained = {}
+
+_THIS_FILE = os.path.abspath(__file__)
+_PACKAGE_DIRS = ("site-packages", "dist-packages")
+_WRAPPER_ARGS = {"execute", "sql", "params", "many", "context"}
+
+
+def normalize(sql):
+    """SQL with literals and params replaced by ?, and lists of them collapsed"""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PARAM.sub("?", sql)
+    sql = _IN_LIST.sub("(...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def fingerprint(statement):
+    return hashlib.sha1(statement.encode("utf-8")).hexdigest()[:16]
+
+
+def _is_execute_wrapper(frame):
+    # Other execute wrappers, such as the metrics query counter, are not callers
+    return _WRAPPER_ARGS.issubset(frame.f_code.co_varnames[:frame.f_code.co_argcount])
+
+
+def project_frames(limit=MAX_FRAMES):
+    """This project's frames on the stack, innermost first, outside this module
+
+    Returns:
+        list -- dicts of function, file relative to BASE_DIR and line
+    """
+    base_dir = str(settings.BASE_DIR) + os.sep
+    frames = []
+    frame = sys._getframe(1)  # pylint: disable=protected-access
+    while frame is not None and len(frames) < limit:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(base_dir) and filename != _THIS_FILE
+                and not any(packages in filename for packages in _PACKAGE_DIRS)
+                and not _is_execute_wrapper(frame)):
+            code = frame.f_code
+            name = getattr(code, "co_qualname", code.co_name)
+            instance = frame.f_locals.get("self")
+            if instance is not None and "." not in name:
+                name = f"{type(instance).__name__}.{name}"
+            frames.append({
+                "function": name,
+                "file": os.path.relpath(filename, base_dir),
+                "line": frame.f_lineno,
+            })
+        frame = frame.f_back
+    return frames
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value[:MAX_PARAMS]]
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in list(value.items())[:MAX_PARAMS]}
+    if isinstance(value, (bytes, memoryview)):
+        return f"<{len(value)} bytes>"
+    return str(value)
+
+
+def _should_explain(key, interval):
+    now = time.monotonic()
+    with _lock:
+        last = _explained.get(key)
+        if last is not None and now - last < interval:
+            return False
+        if len(_explained) >= MAX_FINGERPRINTS:
+            _explained.clear()
+        _explained[key] = now
+        return True
+
+
+def explain(connection, sql, params):
+    """The plan of a statement, as lines of text
+
+    Raises:
+        DatabaseError -- The backend could not explain the statement
+    """
+    options = {}
+    if connection.vendor == "postgresql" and _READ.match(sql):
+        options = {"analyze": True, "buffers": True}
+    prefix = connection.ops.explain_query_prefix(**options)
+
+    # connection.cursor() would run the EXPLAIN through every execute wrapper
+    connection.ensure_connection()
+    savepoint = "slow_query_explain" if connection.in_atomic_block else None
+    with connection.wrap_database_errors:
+        cursor = connection.create_cursor()
+        try:
+            if savepoint:
+                # A failed EXPLAIN must not break the caller's transaction
+                cursor.execute(connection.ops.savepoint_create_sql(savepoint))
+            try:
+                cursor.execute(f"{prefix} {sql}", params)
+                rows = cursor.fetchall()
+            except Exception:
+                if savepoint:
+                    cursor.execute(connection.ops.savepoint_rollback_sql(savepoint))
+                raise
+            finally:
+                if savepoint:
+                    cursor.execute(connection.ops.savepoint_commit_sql(savepoint))
+        finally:
+            cursor.close()
+    # SQLite has (id, parent, notused, detail) rows, the others one line per row
+    return [str(row[-1]) for row in rows]
+
+
+class SlowQueryLogger:
+    """connection.execute_wrapper hook logging statements slower than SLOW_QUERY_MS"""
+
+    def __call__(self, execute, sql, params, many, context):
+        threshold = getattr(settings, "SLOW_QUERY_MS", 0)
+        if threshold <= 0 or getattr(_state, "active", False):
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - started) * 1000
+        if duration >= threshold:
+            _state.active = True
+            try:
+                self.record(context["connection"], sql, params, many, duration)
+            finally:
+                _state.active = False
+        return result
+
+    def record(self, connection, sql, params, many, duration):
+        statement = normalize(sql)
+        key = fingerprint(statement)
+        entry = {
+            "fingerprint": key,
+            "duration_ms": round(duration, 3),
+            "database": connection.alias,
+            "vendor": connection.vendor,
+            "sql": sql[:MAX_SQL_LENGTH],
+            "statement": statement[:MAX_SQL_LENGTH],
+            "params": _jsonable(params[0] if many and params else params),
+        }
+        stack = project_frames()
+        entry["caller"] = stack[0] if stack else None
+        entry["stack"] = [f"{frame['function']} ({frame['file']}:{frame['line']})" for frame in stack]
+        if many:
+            entry["param_sets"] = len(params) if hasattr(params, "__len__") else None
+
+        interval = getattr(settings, "SLOW_QUERY_EXPLAIN_INTERVAL", 300)
+        if not many and _should_explain(key, interval):
+            try:
+                entry["plan"] = explain(connection, sql, params)
+            except (DatabaseError, NotSupportedError, ValueError) as ex:
+                entry["explain_error"] = str(ex)
+
+        logger.warning("Slow query %s took %.1f ms", key, duration, extra={"slow_query": entry})
+
+
+_wrapper = SlowQueryLogger()
+
+
+def install(sender, connection, **kwargs):
+    """connection_created receiver adding the wrapper once per connection object"""
+    if _wrapper not in connection.execute_wrappers:
+        # connection.execute_wrapper() pops the last wrapper when its block ends.
+        # A connection opened inside such a block, during a request timed by
+        # the metrics or profiling middleware, must not put this wrapper last,
+        # or that pop would remove it and leave the middleware's wrapper behind.
+        connection.execute_wrappers.insert(0, _wrapper)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with the slow query entry at the top level"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "pid": record.process,
+        }
+        entry.update(getattr(record, "slow_query", {"message": record.getMessage()}))
+        return json.dumps(entry, default=str)
+
+
+class LogFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that creates the log's folder"""
+
+    def __init__(self, filename, *args, **kwargs):
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        super().__init__(filename, *args, **kwargs)
+
+
+def log_files(path):
+    """A log and its rotated backups, oldest first"""
+    backups = []
+    directory = os.path.dirname(os.path.abspath(path))
+    prefix = os.path.basename(path) + "."
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            suffix = name[len(prefix):]
+            if name.startswith(prefix) and suffix.isdigit():
+                backups.append((int(suffix), os.path.join(directory, name)))
+    files = [name for _, name in sorted(backups, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def summarize(paths):
+    """Slow query log entries grouped by fingerprint
+
+    Returns:
+        list -- One dict per fingerprint with count, total, mean and max ms,
+        the callers, the latest SQL and params and the latest plan, slowest
+        total first
+    """
+    groups = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "callers": set()})
+    for path in paths:
+        with open(path, encoding="utf-8") as log:
+            for line in log:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "fingerprint" not in entry:
+                    continue
+                group = groups[entry["fingerprint"]]
+                group["count"] += 1
+                group["total_ms"] += entry["duration_ms"]
+                group["max_ms"] = max(group["max_ms"], entry["duration_ms"])
+                group["statement"] = entry["statement"]
+                group["sql"], group["params"] = entry["sql"], entry["params"]
+                group["last_seen"] = entry.get("time")
+                where = entry.get("caller")
+                if where:
+                    group["callers"].add(f"{where['function']} ({where['file']}:{where['line']})")
+                if "plan" in entry:
+                    group["plan"] = entry["plan"]
+
+    summary = []
+    for key, group in groups.items():
+        group["fingerprint"] = key
+        group["mean_ms"] = group["total_ms"] / group["count"]
+        group["callers"] = sorted(group["callers"])
+        summary.append(group)
+    return sorted(summary, key=lambda group: group["total_ms"], reverse=True)
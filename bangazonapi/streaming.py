@@ -0,0 +1,155 @@
+"""Streaming JSON array responses for large list endpoints
+
+A list view streams when the client sends `?stream=1` or
+`Accept: application/stream+json`. The queryset is walked with
+`.iterator(chunk_size=...)` and each chunk is serialized, encoded and sent
+before the next one is read, so worker memory stays flat no matter how
+many rows are returned. The body is the same JSON array the buffered
+response would contain.
+
+A streamed body is produced after the view and the middleware have
+returned, while the server sends it. Middleware that times or counts a
+request wraps `streaming_content` in an `ObservedStream` to keep doing so
+until the response is closed.
+"""
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+STREAM_MEDIA_TYPE = "application/stream+json"
+DEFAULT_CHUNK_SIZE = 500
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """Lets `Accept: application/stream+json` pass content negotiation
+
+    Views check for it with `wants_stream()` and return a streaming
+    response themselves. A plain Response rendered with it is ordinary JSON.
+    """
+
+    media_type = STREAM_MEDIA_TYPE
+    format = "stream"
+
+
+def wants_stream(request):
+    """Whether the client asked for a streamed list
+
+    Returns:
+        boolean -- True for ?stream=1 or the streaming media type
+    """
+    if request.query_params.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    renderer = getattr(request, "accepted_renderer", None)
+    return renderer is not None and renderer.media_type == STREAM_MEDIA_TYPE
+
+
+def iter_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Walk a queryset in lists of at most `chunk_size` rows"""
+    chunk = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def serialized_chunks(queryset, serializer_class, context=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Serialize a queryset one chunk at a time
+
+    Yields:
+        list -- Representations of up to `chunk_size` instances
+    """
+    for chunk in iter_chunks(queryset, chunk_size):
+        yield serializer_class(chunk, many=True, context=context or {}).data
+
+
+def _encode_array(chunks):
+    encoder = JSONEncoder(ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+    yield b"["
+    first = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        body = ",".join(encoder.encode(item) for item in chunk)
+        body = body.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
+        if not first:
+            body = "," + body
+        first = False
+        yield body.encode("utf-8")
+    yield b"]"
+
+
+class ObservedStream:
+    """Iterator over a streamed body that runs each chunk inside `step()`
+
+    `finish(sent)` is called once with the number of bytes produced, when the
+    body is exhausted, raises, or is closed early because the client went
+    away. The server closes every response, so it always runs.
+
+    Arguments:
+        content {iterable} -- The response's streaming_content
+        step {callable} -- Returns a context manager entered around each chunk
+        finish {callable} -- Called with the bytes sent when the body ends
+    """
+
+    def __init__(self, content, step, finish):
+        self.content = iter(content)
+        self.step = step
+        self.finish = finish
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        try:
+            with self.step():
+                chunk = next(self.content)
+        except BaseException:
+            self.close()
+            raise
+        self.sent += len(chunk)
+        return chunk
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            close = getattr(self.content, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self.finish(self.sent)
+
+
+def observe_stream(response, step, finish):
+    """Wrap a streaming response's body in an ObservedStream
+
+    Returns:
+        boolean -- False when the response is not a synchronous stream
+    """
+    if not response.streaming or getattr(response, "is_async", False):
+        return False
+    response.streaming_content = ObservedStream(response.streaming_content, step, finish)
+    return True
+
+
+def stream_json(chunks, status=200):
+    """Stream lists of representations as one JSON array
+
+    Arguments:
+        chunks {iterable} -- Lists of JSON serializable items
+
+    Returns:
+        StreamingHttpResponse -- application/json body written chunk by chunk
+    """
+    return StreamingHttpResponse(
+        _encode_array(chunks), status=status, content_type="application/json"
+    )
@@ -0,0 +1,170 @@
+"""Streaming, content-addressed storage for product images
+
+`ContentAddressedUploadHandler` replaces Django's default upload handlers
+for image uploads. Each multipart chunk is written straight to a temporary
+file while it is hashed, counted and, for the first bytes, sniffed for an
+image signature, so an oversized or non-image upload is rejected while it
+is still arriving and nothing is held in memory.
+
+Stored files are named after the SHA-256 of their content, so the same
+image uploaded for many products is kept on disk once.
+"""
+
+import base64
+import binascii
+import hashlib
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import (
+    SkipFile,
+    StopUpload,
+    TemporaryFileUploadHandler,
+)
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+SIGNATURE_LENGTH = 12
+
+
+def max_image_bytes():
+    return getattr(settings, "PRODUCT_IMAGE_MAX_BYTES", 5 * 1024 * 1024)
+
+
+def sniff_image_type(header):
+    """File extension for the image format in `header`, or None
+
+    Arguments:
+        header {bytes} -- At least the first 12 bytes of the file
+    """
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+class ImageRejected(Exception):
+    """An image that cannot be stored, with the HTTP status to answer with"""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def decode_inline_image(value, max_bytes=None):
+    """Decode and validate a base64 data URI such as `data:image/png;base64,...`
+
+    Applies the same limits as `ContentAddressedUploadHandler`.
+
+    Returns:
+        tuple -- Decoded bytes and their file extension
+
+    Raises:
+        ImageRejected -- Not a base64 data URI (400), larger than
+            `max_bytes` (413) or not a supported image (415)
+    """
+    max_bytes = max_bytes if max_bytes is not None else max_image_bytes()
+    header, separator, encoded = str(value).partition(";base64,")
+    if not separator:
+        raise ImageRejected("image_path must be a base64 data URI", 400)
+    try:
+        content = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        raise ImageRejected("image_path is not valid base64", 400) from None
+
+    if len(content) > max_bytes:
+        raise ImageRejected(f"Image is larger than {max_bytes} bytes", 413)
+    extension = sniff_image_type(content[:SIGNATURE_LENGTH])
+    if extension is None:
+        raise ImageRejected("File is not a PNG, JPEG, GIF or WebP image", 415)
+    return content, extension
+
+
+def content_path(digest, extension, folder="products"):
+    """Storage name for content with the given SHA-256 hex digest"""
+    return f"{folder}/{digest[:2]}/{digest}.{extension}"
+
+
+def store(file, digest, extension, folder="products"):
+    """Save a file under its content hash unless that content is already stored
+
+    Returns:
+        str -- Storage name to assign to an ImageField
+    """
+    name = content_path(digest, extension, folder)
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, file)
+        if saved != name:
+            # Another request stored the same content first
+            default_storage.delete(saved)
+    return name
+
+
+class ContentAddressedUploadHandler(TemporaryFileUploadHandler):
+    """Upload handler that validates and hashes images as they stream in
+
+    After parsing, `error` holds a message and `status` an HTTP status when
+    the upload was rejected. Accepted files carry `sha256` and `extension`
+    attributes.
+    """
+
+    def __init__(self, request=None, max_bytes=None):
+        super().__init__(request)
+        self.max_bytes = max_bytes if max_bytes is not None else max_image_bytes()
+        self.error = None
+        self.status = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.header = b""
+        self.extension = None
+        self.received = 0
+
+        if self.content_type and not (
+            self.content_type.startswith("image/")
+            or self.content_type == "application/octet-stream"
+        ):
+            self.reject(f"Unsupported content type {self.content_type}", 415)
+            raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self.reject(f"Image is larger than {self.max_bytes} bytes", 413)
+            raise StopUpload(connection_reset=True)
+
+        if self.extension is None:
+            self.header += raw_data[:SIGNATURE_LENGTH]
+            if len(self.header) >= SIGNATURE_LENGTH:
+                self.extension = sniff_image_type(self.header)
+                if self.extension is None:
+                    self.reject("File is not a PNG, JPEG, GIF or WebP image", 415)
+                    raise SkipFile()
+
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.extension is None:
+            # Shorter than any image signature
+            self.extension = sniff_image_type(self.header)
+            if self.extension is None:
+                self.reject("File is not a PNG, JPEG, GIF or WebP image", 415)
+                self.file.close()
+                return None
+
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.hasher.hexdigest()
+        uploaded.extension = self.extension
+        return uploaded
+
+    def reject(self, message, status):
+        if self.error is None:
+            self.error = message
+            self.status = status
@@ -9,3 +9,5 @@ from .productcategory import ProductCategories
 from .lineitem import LineItems
 from .customer import Customers
 from .user import Users
+from .cachestats import cache_stats
+from .metrics import metrics_view
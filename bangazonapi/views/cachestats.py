@@ -0,0 +1,33 @@
+"""View module for reporting response cache effectiveness"""
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from bangazonapi import cache
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """
+    @api {GET} /cachestats GET response cache counters
+    @apiName GetCacheStats
+    @apiGroup Admin
+
+    @apiHeader {String} Authorization Auth token of a staff user
+    @apiHeaderExample {String} Authorization
+        Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+    @apiSuccess (200) {Number} hits Requests served from the cache by this worker
+    @apiSuccess (200) {Number} misses Anonymous requests that had to run the view
+    @apiSuccess (200) {Number} stores Responses written to the cache
+    @apiSuccess (200) {Number} hit_ratio hits / (hits + misses)
+    @apiSuccessExample {json} Success
+        {
+            "hits": 940,
+            "misses": 60,
+            "stores": 58,
+            "hit_ratio": 0.94
+        }
+    """
+    return Response(cache.stats())
@@ -1,12 +1,27 @@
 """View module for handling requests about customer shopping cart"""
 
 import datetime
+from django.db import transaction
+from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
-from bangazonapi.models import Order, Customer, Product, OrderProduct
+from bangazonapi.models import Order, Customer, Product, OrderProduct, OutOfStock, Reservation
 from .product import ProductSerializer
-from .order import OrderSerializer
+from .order import OrderSerializer, eager_orders
+
+
+def line_item_quantity(data, minimum=1):
+    """Units requested for a line item, 1 when not given
+
+    Returns:
+        int -- The quantity, or None when it is not a whole number of at least `minimum`
+    """
+    try:
+        quantity = int(data.get("quantity", 1))
+    except (TypeError, ValueError):
+        return None
+    return quantity if quantity >= minimum else None
 
 
 class Cart(ViewSet):
@@ -21,7 +36,20 @@ class Cart(ViewSet):
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
         @apiParam {Number} product_id Id of product to add
+        @apiParam {Number} [quantity=1] How many units to add
+        @apiError (409) {String} message Not enough stock, nothing was added
+        @apiError (409) {Object[]} shortfalls Line items that do not fit
+        @apiError (409) {Number} shortfalls.product_id Product short of stock
+        @apiError (409) {Number} shortfalls.requested Units the line would hold
+        @apiError (409) {Number} shortfalls.available Units in stock not held in other carts
         """
+        quantity = line_item_quantity(request.data)
+        if quantity is None:
+            return Response(
+                {"message": "quantity must be a whole number of at least 1"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         current_user = Customer.objects.get(user=request.auth.user)
 
         try:
@@ -33,13 +61,17 @@ class Cart(ViewSet):
             open_order.customer = current_user
             open_order.save()
 
-        line_item = OrderProduct()
         try:
-            line_item.product = Product.objects.get(pk=request.data["product_id"])
+            product = Product.objects.get(pk=request.data["product_id"])
         except Product.DoesNotExist as ex:
             return Response({"message": ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
-        line_item.order = open_order
-        line_item.save()
+        try:
+            OrderProduct.add(open_order, product, quantity)
+        except OutOfStock as ex:
+            return Response(
+                {"message": ex.args[0], "shortfalls": ex.shortfalls},
+                status=status.HTTP_409_CONFLICT,
+            )
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -49,15 +81,14 @@ class Cart(ViewSet):
         @apiName RemoveLineItem
         @apiGroup ShoppingCart
 
-        @apiParam {id} id Product Id to remove from cart
+        @apiParam {id} id Product Id to remove one unit of from cart
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
         """
         current_user = Customer.objects.get(user=request.auth.user)
         open_order = Order.objects.get(customer=current_user, payment_type=None)
 
-        line_item = OrderProduct.objects.filter(product__id=pk, order=open_order)[0]
-        line_item.delete()
+        OrderProduct.remove(open_order, pk)
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -75,6 +106,7 @@ class Cart(ViewSet):
         @apiSuccess (200) {Number} size Number of items in cart
         @apiSuccess (200) {Object[]} line_items Line items in cart
         @apiSuccess (200) {Number} line_items.id Line item id
+        @apiSuccess (200) {Number} line_items.quantity Units of the product in cart
         @apiSuccess (200) {Object} line_items.product Product in cart
         @apiSuccessExample {json} Success
             {
@@ -86,6 +118,7 @@ class Cart(ViewSet):
                 "lineitems": [
                     {
                         "id": 1,
+                        "quantity": 1,
                         "product": {
                             "id": 52,
                             "url": "http://localhost:8000/products/52",
@@ -110,18 +143,163 @@ class Cart(ViewSet):
         """
         current_user = Customer.objects.get(user=request.auth.user)
         try:
-            open_order = Order.objects.get(customer=current_user, payment_type=None)
-
-            products_on_order = Product.objects.filter(lineitems__order=open_order)
+            open_order = eager_orders(Order.objects).get(
+                customer=current_user, payment_type=None
+            )
 
             serialized_order = OrderSerializer(
                 open_order, many=False, context={"request": request}
             )
 
             final = {"order": serialized_order.data}
-            final["order"]["size"] = len(products_on_order)
+            final["order"]["size"] = open_order.size
 
         except Order.DoesNotExist as ex:
             return Response({"message": ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
 
         return Response(final["order"])
+
+    @action(methods=["post"], detail=False)
+    def items(self, request):
+        """
+        @api {POST} /cart/items POST many line items to cart
+        @apiName SetLineItems
+        @apiGroup ShoppingCart
+
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiDescription Sets the quantity of every listed product in the cart
+        in one transaction, creating the cart if needed. A quantity of 0
+        removes the product. Products listed more than once have their
+        quantities added together. Nothing is written unless every item is valid.
+
+        @apiParam {Object[]} items Products to put in the cart
+        @apiParam {Number} items.product_id Id of product
+        @apiParam {Number} items.quantity Units of the product the cart should hold
+        @apiParamExample {json} Input
+            [
+                {"product_id": 52, "quantity": 2},
+                {"product_id": 7, "quantity": 1}
+            ]
+
+        @apiSuccess (200) {Object} order Cart after the change, as from GET /cart
+        @apiError (400) {Object[]} errors Rejected items by zero based position
+        @apiError (409) {String} message Not enough stock, nothing was changed
+        @apiError (409) {Object[]} shortfalls Line items that do not fit
+        @apiError (409) {Number} shortfalls.product_id Product short of stock
+        @apiError (409) {Number} shortfalls.requested Units the line would hold
+        @apiError (409) {Number} shortfalls.available Units in stock not held in other carts
+        """
+        if not isinstance(request.data, list):
+            return Response(
+                {"message": "Send a list of {product_id, quantity} objects"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        errors = []
+        wanted = {}
+        positions = {}
+        for index, item in enumerate(request.data):
+            if not isinstance(item, dict):
+                errors.append({"row": index, "errors": {"non_field_errors": ["Expected an object"]}})
+                continue
+
+            item_errors = {}
+            quantity = line_item_quantity(item, minimum=0)
+            if quantity is None:
+                item_errors["quantity"] = ["Must be a whole number of at least 0"]
+            try:
+                product_id = int(item.get("product_id"))
+            except (TypeError, ValueError):
+                item_errors["product_id"] = ["Must be a product id"]
+
+            if item_errors:
+                errors.append({"row": index, "errors": item_errors})
+                continue
+            wanted[product_id] = wanted.get(product_id, 0) + quantity
+            positions.setdefault(product_id, index)
+
+        products = Product.objects.in_bulk(wanted)
+        for product_id in wanted.keys() - products.keys():
+            errors.append(
+                {"row": positions[product_id], "errors": {"product_id": ["Product not found"]}}
+            )
+
+        if errors:
+            errors.sort(key=lambda error: error["row"])
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        current_user = Customer.objects.get(user=request.auth.user)
+
+        with transaction.atomic():
+            open_order, _ = Order.objects.get_or_create(
+                customer=current_user, payment_type__isnull=True
+            )
+            short = Reservation.shortfalls(open_order.pk, wanted)
+            if short:
+                return Response(
+                    {"message": "Not enough stock for some products", "shortfalls": short},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            OrderProduct.objects.bulk_create(
+                [
+                    OrderProduct(order=open_order, product_id=product_id, quantity=quantity)
+                    for product_id, quantity in wanted.items()
+                    if quantity > 0
+                ],
+                update_conflicts=True,
+                unique_fields=["order", "product"],
+                update_fields=["quantity"],
+            )
+            removed = [product_id for product_id, quantity in wanted.items() if quantity == 0]
+            if removed:
+                open_order.lineitems.filter(product_id__in=removed).delete()
+            Order.refresh_summaries(Order.objects.filter(pk=open_order.pk), touch=True)
+            Reservation.hold(open_order.pk, wanted)
+
+        open_order = eager_orders(Order.objects).get(pk=open_order.pk)
+        cart = OrderSerializer(open_order, many=False, context={"request": request}).data
+        cart["size"] = open_order.size
+
+        return Response(cart)
+
+    @action(methods=["get"], detail=False)
+    def summary(self, request):
+        """
+        @api {GET} /cart/summary GET cart totals
+        @apiName GetCartSummary
+        @apiGroup ShoppingCart
+
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiDescription Totals stored on the open order, kept current by every
+        cart change. Use it for badges instead of GET /cart.
+
+        @apiSuccess (200) {Number} id Open order id, null without a cart
+        @apiSuccess (200) {Number} item_count Units in cart
+        @apiSuccess (200) {Number} product_count Distinct products in cart
+        @apiSuccess (200) {Number} subtotal Total price of the cart
+        @apiSuccessExample {json} Success
+            {
+                "id": 2,
+                "item_count": 3,
+                "product_count": 2,
+                "subtotal": 2608.95
+            }
+        """
+        summary = (
+            Order.objects.filter(
+                customer__user=request.auth.user, payment_type__isnull=True
+            )
+            .values("id", "item_count", "product_count", "subtotal")
+            .first()
+        )
+        if summary is None:
+            summary = {"id": None, "item_count": 0, "product_count": 0, "subtotal": 0}
+        summary["subtotal"] = round(summary["subtotal"], 2)
+
+        return Response(summary)
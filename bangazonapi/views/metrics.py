@@ -0,0 +1,47 @@
+"""View module for exporting request metrics to Prometheus"""
+
+import hmac
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import BasePermission, IsAdminUser
+from bangazonapi import metrics
+
+
+class HasMetricsToken(BasePermission):
+    """The request sends `Authorization: Bearer <METRICS_TOKEN>`, never true while it is empty"""
+
+    def has_permission(self, request, view):
+        token = getattr(settings, "METRICS_TOKEN", "")
+        sent = request.META.get("HTTP_AUTHORIZATION", "")
+        return bool(token) and hmac.compare_digest(sent, f"Bearer {token}")
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser | HasMetricsToken])
+def metrics_view(request):
+    """
+    @api {GET} /metrics GET request metrics of all workers
+    @apiName GetMetrics
+    @apiGroup Admin
+
+    @apiHeader {String} Authorization Bearer METRICS_TOKEN, or the auth token of a staff user
+    @apiHeaderExample {String} Authorization
+        Bearer 3f1d0c9a7b
+
+    @apiSuccess (200) {String} body Prometheus text exposition format, summed over every worker
+    @apiSuccessExample {text} Success
+        # HELP bangazon_http_requests_total Responses sent, by route, method and status.
+        # TYPE bangazon_http_requests_total counter
+        bangazon_http_requests_total{route="product-list",method="GET",status="200"} 1042
+        # HELP bangazon_http_request_duration_seconds Time from the request reaching Django until its response, or the end of a streamed body.
+        # TYPE bangazon_http_request_duration_seconds histogram
+        bangazon_http_request_duration_seconds_bucket{route="product-list",method="GET",le="0.005"} 310
+        ...
+        # HELP bangazon_response_cache_hit_ratio Response cache hits over lookups, across all workers.
+        # TYPE bangazon_response_cache_hit_ratio gauge
+        bangazon_response_cache_hit_ratio 0.94
+    @apiError (401) {String} detail Neither a staff token nor the metrics token was sent
+    @apiError (403) {String} detail The token belongs to a user who is not staff
+    """
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
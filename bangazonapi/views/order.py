@@ -1,13 +1,19 @@
 """View module for handling requests about customer order"""
 
 import datetime
+from django.db.models import Prefetch
 from django.http import HttpResponseServerError
 from rest_framework.viewsets import ViewSet
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from rest_framework.decorators import action
 from bangazonapi.models import Order, Payment, Customer, Product, OrderProduct
+from bangazonapi.checkout import AlreadyPaid, OutOfStock, checkout
+from bangazonapi.pagination import KeysetPagination
+from bangazonapi.streaming import StreamingJSONRenderer, serialized_chunks
+from bangazonapi.streaming import stream_json, wants_stream
 from bangazonapi.views.paymenttype import PaymentSerializer
 from .product import ProductSerializer
 
@@ -22,7 +28,7 @@ class OrderLineItemSerializer(serializers.HyperlinkedModelSerializer):
         url = serializers.HyperlinkedIdentityField(
             view_name="lineitem", lookup_field="id"
         )
-        fields = ("id", "product")
+        fields = ("id", "quantity", "product")
         depth = 1
 
 
@@ -45,9 +51,29 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
         )
 
 
+def eager_orders(orders):
+    """Load everything OrderSerializer reads in a fixed number of queries
+
+    Payments are joined in, and line items and their products are fetched
+    with one query each for the whole page of orders. Products carry the
+    `with_stats()` annotations, so no per-product counter queries run.
+    Products deleted since the order was placed are still loaded.
+
+    Returns:
+        QuerySet -- `orders` with the joins and prefetches applied
+    """
+    products = Product.objects.all_with_deleted().with_stats()
+    return orders.select_related("payment_type").prefetch_related(
+        Prefetch("lineitems", queryset=OrderProduct.objects.order_by("id")),
+        Prefetch("lineitems__product", queryset=products),
+    )
+
+
 class Orders(ViewSet):
     """View for interacting with customer orders"""
 
+    renderer_classes = (JSONRenderer, StreamingJSONRenderer)
+
     def retrieve(self, request, pk=None):
         """
         @api {GET} /cart/:id GET single order
@@ -77,7 +103,7 @@ class Orders(ViewSet):
         """
         try:
             customer = Customer.objects.get(user=request.auth.user)
-            order = Order.objects.get(pk=pk, customer=customer)
+            order = eager_orders(Order.objects.filter(customer=customer)).get(pk=pk)
             serializer = OrderSerializer(order, context={"request": request})
             return Response(serializer.data)
 
@@ -111,13 +137,28 @@ class Orders(ViewSet):
 
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
+        @apiError (409) {String} message Not enough stock, nothing was charged
+        @apiError (409) {Object[]} shortfalls Line items that could not be filled
+        @apiError (409) {Number} shortfalls.product_id Product short of stock
+        @apiError (409) {Number} shortfalls.requested Units on the order
+        @apiError (409) {Number} shortfalls.available Units in stock not held in other carts
         """
         customer = Customer.objects.get(user=request.auth.user)
         order = Order.objects.get(pk=pk, customer=customer)
         payment_id = request.data["payment_type"]
-        payment_instance = Payment(pk=payment_id)
-        order.payment_type = payment_instance
-        order.save()
+
+        try:
+            checkout(order, payment_id)
+        except OutOfStock as ex:
+            return Response(
+                {"message": ex.args[0], "shortfalls": ex.shortfalls},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except AlreadyPaid:
+            # Changing the payment of a paid order leaves stock alone
+            payment_instance = Payment(pk=payment_id)
+            order.payment_type = payment_instance
+            order.save()
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -132,6 +173,9 @@ class Orders(ViewSet):
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
         @apiParam {id} payment_id Query param to filter by payment used
+        @apiParam {Number} page_size Query param to paginate, returns next/previous cursors
+        @apiParam {String} cursor Query param with the opaque cursor of the page to fetch
+        @apiParam {Number} stream Query param, 1 streams the array (same as Accept: application/stream+json)
 
         @apiSuccess (200) {Object[]} orders Array of order objects
         @apiSuccess (200) {id} orders.id Order id
@@ -152,11 +196,22 @@ class Orders(ViewSet):
             ]
         """
         customer = Customer.objects.get(user=request.auth.user)
-        orders = Order.objects.filter(customer=customer)
+        orders = eager_orders(Order.objects.filter(customer=customer))
 
         payment = self.request.query_params.get("payment_id", None)
         if payment is not None:
-            orders = orders.filter(payment__id=payment)
+            orders = orders.filter(payment_type__id=payment)
+
+        if wants_stream(request):
+            return stream_json(
+                serialized_chunks(orders, OrderSerializer, context={"request": request})
+            )
+
+        paginator = KeysetPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(orders, request, view=self)
+            json_orders = OrderSerializer(page, many=True, context={"request": request})
+            return paginator.get_paginated_response(json_orders.data)
 
         json_orders = OrderSerializer(orders, many=True, context={"request": request})
 
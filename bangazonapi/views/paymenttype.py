@@ -5,6 +5,7 @@ from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from bangazonapi.models import Payment, Customer
+from bangazonapi.pagination import KeysetPagination
 
 
 class PaymentSerializer(serializers.HyperlinkedModelSerializer):
@@ -25,6 +26,8 @@ class PaymentSerializer(serializers.HyperlinkedModelSerializer):
 
 class Payments(ViewSet):
 
+    pagination_ordering = ("create_date", "id")
+
     def create(self, request):
         """Handle POST operations
 
@@ -86,6 +89,13 @@ class Payments(ViewSet):
         if customer_id is not None:
             payment_types = payment_types.filter(customer__id=customer_id)
 
+        paginator = KeysetPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(payment_types, request, view=self)
+            serializer = PaymentSerializer(
+                page, many=True, context={'request': request})
+            return paginator.get_paginated_response(serializer.data)
+
         serializer = PaymentSerializer(
             payment_types, many=True, context={'request': request})
         return Response(serializer.data)
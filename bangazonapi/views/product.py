@@ -2,21 +2,57 @@
 
 from rest_framework.decorators import action
 from bangazonapi.models.recommendation import Recommendation
-import base64
+import hashlib
 from django.core.files.base import ContentFile
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Case, CharField, F, Value, When
 from django.http import HttpResponseServerError
+from django.utils.dateparse import parse_date
 from rest_framework.viewsets import ViewSet
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
+from bangazonapi.cache import cached_response
+from bangazonapi.conditional import conditional_get, version_etag, version_last_modified
 from bangazonapi.models import Product, Customer, ProductCategory
+from bangazonapi.pagination import KeysetPagination
+from bangazonapi.streaming import DEFAULT_CHUNK_SIZE, StreamingJSONRenderer
+from bangazonapi.streaming import iter_chunks, stream_json, wants_stream
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from bangazonapi import bulk, derivatives, profiling, uploads
+from bangazonapi.bulk import NDJSONParser
+
+AVAILABILITY_MAX_IDS = 100
 
 
 class ProductSerializer(serializers.ModelSerializer):
     """JSON serializer for products"""
 
+    number_sold = serializers.SerializerMethodField()
+    average_rating = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+
+    def get_number_sold(self, obj):
+        """Use the `with_stats()` annotation when the queryset provides it"""
+        if hasattr(obj, "sold_count"):
+            return obj.sold_count
+        return obj.number_sold
+
+    def get_average_rating(self, obj):
+        """Use the `with_stats()` annotation when the queryset provides it"""
+        if hasattr(obj, "rating_avg"):
+            return obj.rating_avg if obj.rating_avg is not None else 0
+        return obj.average_rating
+
+    def get_image_variants(self, obj):
+        """Resized WebP/JPEG variant URLs, null until they are rendered"""
+        if not obj.image_variants_ready:
+            return None
+        request = self.context.get("request", None)
+        return derivatives.variant_urls(obj.image_path.name, request)
+
     class Meta:
         model = Product
         fields = (
@@ -29,6 +65,7 @@ class ProductSerializer(serializers.ModelSerializer):
             "created_date",
             "location",
             "image_path",
+            "image_variants",
             "average_rating",
             "can_be_rated",
             "category_id",
@@ -36,10 +73,129 @@ class ProductSerializer(serializers.ModelSerializer):
         depth = 1
 
 
+# image_path once its variants are rendered, otherwise null
+READY_IMAGE = Case(
+    When(image_variants_ready=True, then=F("image_path")),
+    default=Value(None),
+    output_field=CharField(),
+)
+
+
+class ProductRowSerializer:
+    """Read-only fast path with the same output as ProductSerializer
+
+    Instead of building model instances and walking DRF fields for every
+    row, the field plan below is compiled once from ProductSerializer's
+    field list and applied to `values_list()` tuples of a
+    `Product.objects.with_stats()` queryset.
+
+    `can_be_rated` is only present when a view sets it per user, which
+    list reads never do, so it is left out just as ProductSerializer
+    leaves it out.
+    """
+
+    # Serializer field -> (queryset column or expression, converter or None)
+    columns = {
+        "id": ("id", None),
+        "name": ("name", None),
+        "price": ("price", float),
+        "number_sold": ("sold_count", None),
+        "description": ("description", None),
+        "quantity": ("quantity", None),
+        "created_date": ("created_date", lambda value: value.isoformat()),
+        "location": ("location", None),
+        "image_path": ("image_path", "url"),
+        "image_variants": (READY_IMAGE, "variants"),
+        "average_rating": ("rating_avg", lambda value: 0 if value is None else value),
+        "category_id": ("category_id", None),
+    }
+    skipped_fields = ("can_be_rated",)
+
+    def __init__(self, queryset, context=None):
+        self.queryset = queryset
+        self.context = context or {}
+
+    @classmethod
+    def compile(cls):
+        """Field plan in ProductSerializer's field order
+
+        Returns:
+            tuple -- (output key, queryset column, converter) per field
+        """
+        plan = []
+        for field in ProductSerializer.Meta.fields:
+            if field in cls.skipped_fields:
+                continue
+            if field not in cls.columns:
+                raise ImproperlyConfigured(
+                    f"ProductRowSerializer has no column for ProductSerializer field '{field}'"
+                )
+            plan.append((field,) + cls.columns[field])
+        return tuple(plan)
+
+    def _url_converter(self):
+        storage = Product._meta.get_field("image_path").storage
+        request = self.context.get("request", None)
+
+        def to_url(name):
+            if not name:
+                return None
+            url = storage.url(name)
+            if request is not None:
+                return request.build_absolute_uri(url)
+            return url
+
+        return to_url
+
+    def _rows(self):
+        plan = self.compile()
+        to_url = self._url_converter()
+        request = self.context.get("request", None)
+        converters = {
+            "url": to_url,
+            "variants": lambda name: derivatives.variant_urls(name, request),
+        }
+        fields = [
+            (key, converters.get(convert, convert)) for key, _, convert in plan
+        ]
+        rows = self.queryset.values_list(*(column for _, column, _ in plan))
+        return fields, rows
+
+    @property
+    def data(self):
+        """List of product dicts, equal to ProductSerializer(many=True).data"""
+        with profiling.phase("serialize"):
+            fields, rows = self._rows()
+
+            return [
+                {
+                    key: value if convert is None else convert(value)
+                    for (key, convert), value in zip(fields, row)
+                }
+                for row in rows
+            ]
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Product dicts in lists of `chunk_size`, read with a server-side iterator"""
+        fields, rows = self._rows()
+
+        for chunk in iter_chunks(rows, chunk_size):
+            with profiling.phase("serialize"):
+                data = [
+                    {
+                        key: value if convert is None else convert(value)
+                        for (key, convert), value in zip(fields, row)
+                    }
+                    for row in chunk
+                ]
+            yield data
+
+
 class Products(ViewSet):
     """Request handlers for Products in the Bangazon Platform"""
 
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    renderer_classes = (JSONRenderer, StreamingJSONRenderer)
 
     def create(self, request):
         """
@@ -57,6 +213,7 @@ class Products(ViewSet):
         @apiParam {Number} quantity Number of items to sell
         @apiParam {String} location City where product is located
         @apiParam {Number} category_id Category of product
+        @apiParam {String} [image_path] Image as a base64 data URI, prefer POST /products/:id/image
         @apiParamExample {json} Input
             {
                 "name": "Kite",
@@ -76,6 +233,7 @@ class Products(ViewSet):
         @apiSuccess (200) {Date} product.created_date City where product is located
         @apiSuccess (200) {String} product.location City where product is located
         @apiSuccess (200) {String} product.image_path Path to product image
+        @apiSuccess (200) {Object} product.image_variants Resized image URLs by size and format, null until rendered
         @apiSuccess (200) {Number} product.average_rating Average customer rating of product
         @apiSuccess (200) {Number} product.number_sold How many items have been purchased
         @apiSuccess (200) {Object} product.category Category of product
@@ -91,12 +249,16 @@ class Products(ViewSet):
                 "created_date": "2019-10-23",
                 "location": "Pittsburgh",
                 "image_path": null,
+                "image_variants": null,
                 "average_rating": 0,
                 "category": {
                     "url": "http://localhost:8000/productcategories/6",
                     "name": "Games/Toys"
                 }
             }
+        @apiError (400) {String} message image_path is not a base64 data URI
+        @apiError (413) {String} message Image is larger than PRODUCT_IMAGE_MAX_BYTES
+        @apiError (415) {String} message image_path is not a supported image
         """
         try:
             product_category = ProductCategory.objects.get(
@@ -121,6 +283,14 @@ class Products(ViewSet):
 
         if serializer.is_valid():
 
+            image = None
+            if "image_path" in request.data:
+                # Legacy inline upload, POST /products/:id/image streams instead
+                try:
+                    image = uploads.decode_inline_image(request.data["image_path"])
+                except uploads.ImageRejected as ex:
+                    return Response({"message": ex.args[0]}, status=ex.status)
+
             new_product = Product(
                 name=serializer.validated_data["name"],
                 price=serializer.validated_data["price"],
@@ -138,13 +308,14 @@ class Products(ViewSet):
 
             new_product.save()
 
-            if "image_path" in request.data:
-                format, imgstr = request.data["image_path"].split(";base64,")
-                ext = format.split("/")[-1]
-                data = ContentFile(
-                    base64.b64decode(imgstr),
-                    name=f'{new_product.id}-{request.data["name"]}.{ext}',
+            if image is not None:
+                content, extension = image
+                new_product.image_path = uploads.store(
+                    ContentFile(content), hashlib.sha256(content).hexdigest(), extension
                 )
+                new_product.image_variants_ready = derivatives.is_ready(new_product.image_path.name)
+                new_product.save()
+                derivatives.schedule_on_commit(new_product.image_path.name)
 
             serializer = ProductSerializer(new_product, context={"request": request})
 
@@ -152,6 +323,117 @@ class Products(ViewSet):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=["post"], detail=False, parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        @api {POST} /products/bulk POST many products
+        @apiName BulkCreateProducts
+        @apiGroup Product
+
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiDescription Send a JSON array of products, or one product per line
+        as application/x-ndjson for very large imports. Each product takes the
+        same fields as POST /products. Valid rows are created even when
+        others fail; images are uploaded afterwards with POST /products/:id/image.
+
+        @apiParamExample {json} Input
+            [
+                {
+                    "name": "Kite",
+                    "price": 14.99,
+                    "description": "It flies high",
+                    "quantity": 60,
+                    "location": "Pittsburgh",
+                    "category_id": 4
+                }
+            ]
+
+        @apiSuccess (201) {Number} created How many products were created
+        @apiSuccess (201) {Number[]} ids Ids of the created products, in input order
+        @apiSuccess (201) {Object[]} errors Rejected rows by zero based position
+        @apiSuccessExample {json} Success
+            {
+                "created": 1,
+                "ids": [101],
+                "errors": [
+                    {
+                        "row": 1,
+                        "errors": {"price": ["Ensure this value is less than or equal to 17500.0."]}
+                    }
+                ]
+            }
+        @apiError (400) {Object[]} errors No row could be created
+        """
+        rows = request.data
+        if isinstance(rows, dict):
+            rows = [rows]
+
+        customer = Customer.objects.get(user=request.auth.user)
+        validator = ProductSerializer(context={"request": request})
+        importer = bulk.ProductImporter(customer, validator).run(rows)
+
+        body = {
+            "created": len(importer.created),
+            "ids": importer.created,
+            "errors": importer.errors,
+        }
+        if not importer.created and importer.errors:
+            return Response(body, status=status.HTTP_400_BAD_REQUEST)
+        return Response(body, status=status.HTTP_201_CREATED)
+
+    @action(methods=["get"], detail=False)
+    def availability(self, request):
+        """
+        @api {GET} /products/availability GET units not held in carts
+        @apiName GetProductAvailability
+        @apiGroup Product
+
+        @apiDescription Availability changes with every cart write, so it is
+        not part of the cached product bodies. It is read live from the
+        stock and the unexpired cart holds, in one query for all ids.
+
+        @apiParam {String} ids Query param with up to 100 comma separated product ids
+
+        @apiSuccess (200) {Object[]} products Availability of the products that exist
+        @apiSuccess (200) {id} products.id Product Id
+        @apiSuccess (200) {Number} products.available_quantity Items to sell that are not held in carts
+        @apiSuccessExample {json} Success
+            [
+                {
+                    "id": 101,
+                    "available_quantity": 51
+                }
+            ]
+        @apiError (400) {String} message ids is missing, not numeric or too long
+        """
+        ids = request.query_params.get("ids", "")
+        try:
+            ids = [int(product_id) for product_id in ids.split(",") if product_id.strip()]
+        except ValueError:
+            ids = None
+        if not ids or len(ids) > AVAILABILITY_MAX_IDS:
+            return Response(
+                {"message": f"ids must be 1 to {AVAILABILITY_MAX_IDS} comma separated product ids"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        rows = (
+            Product.objects.filter(pk__in=ids)
+            .with_availability()
+            .order_by("id")
+            .values_list("id", "available")
+        )
+        response = Response(
+            [{"id": product_id, "available_quantity": available} for product_id, available in rows]
+        )
+        response["Cache-Control"] = "no-cache"
+        return response
+
+    @conditional_get(version_etag("product"), version_last_modified("product"))
+    @cached_response("product")
     def retrieve(self, request, pk=None):
         """
         @api {GET} /products/:id GET product
@@ -169,6 +451,7 @@ class Products(ViewSet):
         @apiSuccess (200) {Date} product.created_date City where product is located
         @apiSuccess (200) {String} product.location City where product is located
         @apiSuccess (200) {String} product.image_path Path to product image
+        @apiSuccess (200) {Object} product.image_variants Resized image URLs by size and format, null until rendered
         @apiSuccess (200) {Number} product.average_rating Average customer rating of product
         @apiSuccess (200) {Number} product.number_sold How many items have been purchased
         @apiSuccess (200) {Object} product.category Category of product
@@ -184,6 +467,7 @@ class Products(ViewSet):
                 "created_date": "2019-10-23",
                 "location": "Pittsburgh",
                 "image_path": null,
+                "image_variants": null,
                 "average_rating": 0,
                 "category": {
                     "url": "http://localhost:8000/productcategories/6",
@@ -192,7 +476,7 @@ class Products(ViewSet):
             }
         """
         try:
-            product = Product.objects.get(pk=pk)
+            product = Product.objects.with_stats().get(pk=pk)
             serializer = ProductSerializer(product, context={"request": request})
             return Response(serializer.data)
         except Exception as ex:
@@ -257,12 +541,25 @@ class Products(ViewSet):
                 {"message": ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @conditional_get(version_etag("product"), version_last_modified("product"))
+    @cached_response("product")
     def list(self, request):
         """
         @api {GET} /products GET all products
         @apiName ListProducts
         @apiGroup Product
 
+        @apiParam {id} category Query param to filter by category
+        @apiParam {Number} number_sold Query param for products sold at least this many times
+        @apiParam {Number} max_sold Query param for products sold at most this many times
+        @apiParam {Date} sold_since Query param to only count sales on orders since this date
+        @apiParam {Number} min_price Query param for products at or above this price
+        @apiParam {String} name Query param to filter by words starting product name words
+        @apiParam {String} q Query param for ranked prefix search over name and description
+        @apiParam {Number} page_size Query param to paginate, returns next/previous cursors
+        @apiParam {String} cursor Query param with the opaque cursor of the page to fetch
+        @apiParam {Number} stream Query param, 1 streams the array (same as Accept: application/stream+json)
+
         @apiSuccess (200) {Object[]} products Array of products
         @apiSuccessExample {json} Success
             [
@@ -277,6 +574,7 @@ class Products(ViewSet):
                     "created_date": "2019-10-23",
                     "location": "Pittsburgh",
                     "image_path": null,
+                    "image_variants": null,
                     "average_rating": 0,
                     "category": {
                         "url": "http://localhost:8000/productcategories/6",
@@ -285,7 +583,7 @@ class Products(ViewSet):
                 }
             ]
         """
-        products = Product.objects.all()
+        products = Product.objects.with_stats()
 
         # Support filtering by category and/or quantity
         category = self.request.query_params.get("category", None)
@@ -293,8 +591,29 @@ class Products(ViewSet):
         order = self.request.query_params.get("order_by", None)
         direction = self.request.query_params.get("direction", None)
         number_sold = self.request.query_params.get("number_sold", None)
+        max_sold = self.request.query_params.get("max_sold", None)
+        sold_since = self.request.query_params.get("sold_since", None)
         min_price = self.request.query_params.get("min_price", None)
         name = self.request.query_params.get("name", None)
+        search_text = self.request.query_params.get("q", None)
+
+        try:
+            number_sold = int(number_sold) if number_sold is not None else None
+            max_sold = int(max_sold) if max_sold is not None else None
+            quantity = int(quantity) if quantity is not None else None
+        except ValueError as ex:
+            return Response({"message": ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        if sold_since is not None:
+            try:
+                sold_since = parse_date(sold_since)
+            except ValueError:
+                sold_since = None
+            if sold_since is None:
+                return Response(
+                    {"message": "sold_since must be a date formatted as YYYY-MM-DD"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
 
         if order is not None:
             order_filter = order
@@ -308,27 +627,94 @@ class Products(ViewSet):
         if category is not None:
             products = products.filter(category__id=category)
 
+        # Sales bounds are applied as annotation filters so they compose
+        # with the other query params instead of loading every product
+        products = products.filter_sold(
+            min_sold=number_sold, max_sold=max_sold, since=sold_since
+        )
+
+        if min_price is not None:
+            products = products.filter(price__gte=min_price)
+
+        if name is not None:
+            products = products.search(name, field="name")
+
+        if search_text is not None:
+            products = products.search(search_text)
+            if order is None:
+                products = products.order_by("search_rank", "id")
+
+        # Slice last, a sliced queryset can no longer be filtered
         if quantity is not None:
-            products = products.order_by("-created_date")[: int(quantity)]
+            products = products.order_by("-created_date")[:quantity]
 
-        if number_sold is not None:
+        serializer = ProductRowSerializer(products, context={"request": request})
+        if wants_stream(request):
+            return stream_json(serializer.iter_chunks())
 
-            def sold_filter(product):
-                if product.number_sold >= int(number_sold):
-                    return True
-                return False
+        paginator = KeysetPagination()
+        if quantity is None and paginator.is_requested(request):
+            page = paginator.paginate_queryset(products, request, view=self)
+            serializer = ProductSerializer(page, many=True, context={"request": request})
+            return paginator.get_paginated_response(serializer.data)
 
-            products = filter(sold_filter, products)
+        return Response(serializer.data)
 
-        if min_price is not None:
-            products = products.filter(price__gte=min_price)
+    @action(methods=["post", "put"], detail=True, parser_classes=[MultiPartParser])
+    def image(self, request, pk=None):
+        """
+        @api {POST} /products/:id/image POST product image
+        @apiName UploadProductImage
+        @apiGroup Product
 
-        if name is not None: 
-            products = products.filter(name__icontains=name)
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
-        serializer = ProductSerializer(
-            products, many=True, context={"request": request}
-        )
+        @apiParam {id} id Product Id
+        @apiParam {File} image_path PNG, JPEG, GIF or WebP image sent as multipart/form-data
+
+        @apiSuccess (200) {Object} product Product with its new image_path
+        @apiError (400) {String} message No image in the request
+        @apiError (403) {String} message Product belongs to another seller
+        @apiError (413) {String} message Image is larger than PRODUCT_IMAGE_MAX_BYTES
+        @apiError (415) {String} message File is not a supported image
+        """
+        try:
+            product = Product.objects.get(pk=pk)
+        except Product.DoesNotExist as ex:
+            return Response({"message": ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+
+        if product.customer.user_id != request.auth.user.id:
+            return Response(
+                {"message": "Only the seller can change a product image"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        # Must be in place before request.data is parsed
+        handler = uploads.ContentAddressedUploadHandler(request)
+        request.upload_handlers = [handler]
+
+        image = request.FILES.get("image_path", None)
+        if handler.error is not None:
+            return Response({"message": handler.error}, status=handler.status)
+        if image is None:
+            return Response(
+                {"message": "Send the image as the image_path multipart field"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            product.image_path = uploads.store(image, image.sha256, image.extension)
+        finally:
+            image.close()
+        # Content-addressed images may already have their variants
+        product.image_variants_ready = derivatives.is_ready(product.image_path.name)
+        product.save()
+        derivatives.schedule_on_commit(product.image_path.name)
+
+        product = Product.objects.with_stats().get(pk=pk)
+        serializer = ProductSerializer(product, context={"request": request})
         return Response(serializer.data)
 
     @action(methods=["post"], detail=True)
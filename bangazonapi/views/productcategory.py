@@ -12,6 +12,8 @@ from rest_framework import serializers
 from rest_framework import status
 from bangazonapi.models import ProductCategory
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from bangazonapi.cache import cached_response
+from bangazonapi.conditional import conditional_get, version_etag, version_last_modified
 
 
 class ProductCategorySerializer(serializers.HyperlinkedModelSerializer):
@@ -43,6 +45,8 @@ class ProductCategories(ViewSet):
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @conditional_get(version_etag("productcategory"), version_last_modified("productcategory"))
+    @cached_response("productcategory")
     def retrieve(self, request, pk=None):
         """Handle GET requests for single category"""
         try:
@@ -52,6 +56,8 @@ class ProductCategories(ViewSet):
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @conditional_get(version_etag("productcategory"), version_last_modified("productcategory"))
+    @cached_response("productcategory")
     def list(self, request):
         """Handle GET requests to ProductCategory resource"""
         product_category = ProductCategory.objects.all()
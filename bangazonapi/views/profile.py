@@ -10,9 +10,10 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet
 from bangazonapi.models import Order, Customer, Product
 from bangazonapi.models import OrderProduct, Favorite
-from bangazonapi.models import Recommendation
+from bangazonapi.models import OutOfStock, Recommendation, Reservation
+from .cart import line_item_quantity
 from .product import ProductSerializer
-from .order import OrderSerializer
+from .order import OrderSerializer, eager_orders
 
 
 class Profile(ViewSet):
@@ -83,10 +84,10 @@ class Profile(ViewSet):
             }
         """
         try:
-            current_user = Customer.objects.get(user=request.user)
+            current_user = Customer.objects.select_related("user").get(user=request.user)
             current_user.recommends = Recommendation.objects.filter(
                 recommender=current_user
-            )
+            ).select_related("customer__user", "product")
 
             serializer = ProfileSerializer(
                 current_user, many=False, context={"request": request}
@@ -118,6 +119,7 @@ class Profile(ViewSet):
             """
             try:
                 open_order = Order.objects.get(customer=current_user, payment_type=None)
+                Reservation.release(open_order.pk)
                 line_items = OrderProduct.objects.filter(order=open_order)
                 line_items.delete()
                 open_order.delete()
@@ -146,6 +148,7 @@ class Profile(ViewSet):
             @apiSuccess (200) {Number} size Number of items in cart
             @apiSuccess (200) {Object[]} line_items Line items in cart
             @apiSuccess (200) {Number} line_items.id Line item id
+            @apiSuccess (200) {Number} line_items.quantity Units of the product in cart
             @apiSuccess (200) {Object} line_items.product Product in cart
             @apiSuccessExample {json} Success
                 {
@@ -157,6 +160,7 @@ class Profile(ViewSet):
                     "line_items": [
                         {
                             "id": 4,
+                            "quantity": 1,
                             "product": {
                                 "id": 52,
                                 "url": "http://localhost:8000/products/52",
@@ -181,17 +185,15 @@ class Profile(ViewSet):
             @apiError (404) {String} message  Not found message
             """
             try:
-                open_order = Order.objects.get(customer=current_user, payment_type=None)
-                line_items = OrderProduct.objects.filter(order=open_order)
-                line_items = LineItemSerializer(
-                    line_items, many=True, context={"request": request}
+                open_order = eager_orders(Order.objects).get(
+                    customer=current_user, payment_type=None
                 )
 
                 cart = {}
                 cart["order"] = OrderSerializer(
                     open_order, many=False, context={"request": request}
                 ).data
-                cart["order"]["size"] = len(line_items.data)
+                cart["order"]["size"] = open_order.size
 
             except Order.DoesNotExist as ex:
                 return Response(
@@ -206,17 +208,22 @@ class Profile(ViewSet):
             @apiName AddToCart
             @apiGroup UserProfile
 
+            @apiParam {Number} product_id Id of product to add
+            @apiParam {Number} [quantity=1] How many units to add
+
             @apiHeader {String} Authorization Auth token
             @apiHeaderExample {String} Authorization
                 Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
             @apiSuccess (200) {Object} line_item Line items in cart
             @apiSuccess (200) {Number} line_item.id Line item id
+            @apiSuccess (200) {Number} line_item.quantity Units of the product in cart
             @apiSuccess (200) {Object} line_item.product Product in cart
             @apiSuccess (200) {Object} line_item.order Open order for cart
             @apiSuccessExample {json} Success
                 {
                     "id": 14,
+                    "quantity": 1,
                     "product": {
                         "url": "http://localhost:8000/products/52",
                         "deleted": null,
@@ -239,21 +246,36 @@ class Profile(ViewSet):
                 }
 
             @apiError (404) {String} message  Not found message
+            @apiError (409) {String} message Not enough stock, nothing was added
+            @apiError (409) {Object[]} shortfalls Line items that do not fit
             """
 
+            quantity = line_item_quantity(request.data)
+            if quantity is None:
+                return Response(
+                    {"message": "quantity must be a whole number of at least 1"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
             try:
                 open_order = Order.objects.get(customer=current_user, payment_type=None)
-                print(open_order)
             except Order.DoesNotExist as ex:
                 open_order = Order()
                 open_order.created_date = datetime.datetime.now()
                 open_order.customer = current_user
                 open_order.save()
 
-            line_item = OrderProduct()
-            line_item.product = Product.objects.get(pk=request.data["product_id"])
-            line_item.order = open_order
-            line_item.save()
+            try:
+                line_item = OrderProduct.add(
+                    open_order,
+                    Product.objects.get(pk=request.data["product_id"]),
+                    quantity,
+                )
+            except OutOfStock as ex:
+                return Response(
+                    {"message": ex.args[0], "shortfalls": ex.shortfalls},
+                    status=status.HTTP_409_CONFLICT,
+                )
 
             line_item_json = LineItemSerializer(
                 line_item, many=False, context={"request": request}
@@ -312,7 +334,9 @@ class Profile(ViewSet):
             ]
         """
         customer = Customer.objects.get(user=request.auth.user)
-        favorites = Favorite.objects.filter(customer=customer)
+        favorites = Favorite.objects.filter(customer=customer).select_related(
+            "seller__user"
+        )
 
         serializer = FavoriteSerializer(
             favorites, many=True, context={"request": request}
@@ -331,7 +355,7 @@ class LineItemSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = OrderProduct
-        fields = ("id", "product")
+        fields = ("id", "quantity", "product")
         depth = 1
 
 
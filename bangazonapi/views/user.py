@@ -1,9 +1,12 @@
 from django.http import HttpResponseServerError
 from rest_framework.viewsets import ViewSet
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from django.contrib.auth.models import User
+from bangazonapi.streaming import StreamingJSONRenderer, serialized_chunks
+from bangazonapi.streaming import stream_json, wants_stream
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -35,6 +38,8 @@ class Users(ViewSet):
     Methods: GET PUT(id) POST
     """
 
+    renderer_classes = (JSONRenderer, StreamingJSONRenderer)
+
     def retrieve(self, request, pk=None):
         """Handle GET requests for single customer
         Purpose: Allow a user to communicate with the Bangazon database to retrieve  one user
@@ -50,7 +55,15 @@ class Users(ViewSet):
             return HttpResponseServerError(ex)
 
     def list(self, request):
-        """Handle GET requests to user resource"""
+        """Handle GET requests to user resource
+
+        Send ?stream=1 or Accept: application/stream+json to stream the array
+        """
         users = User.objects.all()
+        if wants_stream(request):
+            return stream_json(
+                serialized_chunks(users, UserSerializer, context={"request": request})
+            )
+
         serializer = UserSerializer(users, many=True, context={"request": request})
         return Response(serializer.data)
@@ -1,8 +1,6 @@
 #!/bin/bash
 
-rm -rf bangazonapi/migrations
-rm db.sqlite3
-python manage.py makemigrations bangazonapi
+rm -f db.sqlite3
 python manage.py migrate
 python manage.py loaddata users
 python manage.py loaddata tokens
@@ -14,3 +12,5 @@ python manage.py loaddata payment
 python manage.py loaddata order
 python manage.py loaddata order_product
 python manage.py loaddata favoritesellers
+python manage.py rebuild_product_stats
+python manage.py rebuild_cart_summaries --all
@@ -1,3 +1,9 @@
 from .product import ProductTests
-from .order import OrderTests
-from .payments import PaymentTests
\ No newline at end of file
+from .order import CheckoutStressTests, OrderTests
+from .payments import PaymentTests
+from .querybudget import QueryBudgetTests
+from .dataset import DatasetTests
+from .benchmark import BenchmarkTests
+from .profiling import ProfilingTests
+from .metrics import MetricsTests
+from .slowqueries import SlowQueryTests
@@ -0,0 +1,49 @@
+import io
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from bangazonapi import benchmark
+
+
+class BenchmarkTests(TransactionTestCase):
+    def setUp(self) -> None:
+        call_command(
+            "generate_dataset", users=10, products=30, orders=20, line_items=60,
+            ratings=10, favorites=5, recommendations=5, stdout=io.StringIO()
+        )
+
+    def test_scenarios_run_in_process(self):
+        """
+        Ensure every scenario step resolves and reports latency and queries per route
+        """
+        # One worker, the in-memory test database locks whole tables under concurrent writes
+        runner = benchmark.Benchmark(
+            benchmark.InProcessTarget(), concurrency=1, iterations=15, seed=1
+        )
+        results = runner.run()
+
+        self.assertGreater(results["total"]["requests"], 15)
+        for endpoint, stats in results["endpoints"].items():
+            self.assertTrue(all(key.startswith(("2", "3", "409")) for key in stats["statuses"]),
+                            f"{endpoint} answered {stats['statuses']}")
+            self.assertIsNotNone(stats["p95_ms"])
+            self.assertGreater(stats["queries_max"], 0)
+        self.assertIn("GET /products/:id", results["endpoints"])
+
+        slower = {"endpoints": {
+            endpoint: dict(stats, p95_ms=stats["p95_ms"] * 2, queries_max=stats["queries_max"] + 1)
+            for endpoint, stats in results["endpoints"].items()
+        }}
+        rows = benchmark.compare(slower, results)
+        self.assertTrue(all(row["regression"] for row in rows if row["metric"] in ("p95_ms", "queries_max")))
+        self.assertFalse(any(row["regression"] for row in benchmark.compare(results, results)))
+
+    def test_percentile_is_nearest_rank(self):
+        """
+        Ensure percentiles pick the smallest value with at least pct percent of samples at or below it
+        """
+        self.assertEqual(benchmark.percentile(list(range(1, 21)), 95), 19)
+        self.assertEqual(benchmark.percentile(list(range(1, 101)), 95), 95)
+        self.assertEqual(benchmark.percentile(list(range(1, 101)), 7), 7)
+        self.assertEqual(benchmark.percentile(list(range(1, 11)), 50), 5)
+        self.assertEqual(benchmark.percentile([3], 99), 3)
+        self.assertIsNone(benchmark.percentile([], 50))
@@ -0,0 +1,37 @@
+import io
+from django.core.management import call_command
+from django.test import TestCase
+from bangazonapi.models import Order, OrderProduct, Product, ProductStats
+
+
+class DatasetTests(TestCase):
+    def generate(self, **options):
+        call_command(
+            "generate_dataset", users=20, products=50, orders=40, line_items=120,
+            ratings=30, favorites=5, recommendations=5, stdout=io.StringIO(), **options
+        )
+
+    def test_generate_dataset(self):
+        """
+        Ensure generate_dataset writes consistent rows and rebuilds the derived data
+        """
+        self.generate()
+
+        self.assertEqual(Product.objects.count(), 50)
+        self.assertEqual(Order.objects.count(), 40)
+        self.assertEqual(Order.objects.filter(payment_type__isnull=True).count(), 2)
+        self.assertGreater(OrderProduct.objects.count(), 40)
+
+        # Summaries and counters are rebuilt after the inserts
+        cart = Order.objects.filter(payment_type__isnull=True).first()
+        self.assertEqual(cart.item_count, cart.size)
+        self.assertEqual(ProductStats.objects.count(), 50)
+
+        # A second dataset continues the primary keys
+        self.generate(prefix="more")
+        self.assertEqual(Product.objects.count(), 100)
+        self.assertEqual(Order.objects.count(), 80)
+        self.assertEqual(Product.objects.create(
+            name="Kite", price=10, description="It flies high", quantity=1, location="Pittsburgh",
+            customer=Product.objects.first().customer, category=Product.objects.first().category
+        ).pk, 101)
@@ -0,0 +1,185 @@
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from bangazonapi import metrics
+from bangazonapi.models import Customer, Product, ProductCategory
+
+
+def record_in_child(directory):
+    with override_settings(METRICS_DIR=directory):
+        metrics.REQUESTS.inc(route="product-list", method="GET", status=200)
+        metrics.DURATION.observe(0.3, route="product-list", method="GET")
+
+
+class MetricsTests(APITestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # No requests here, the client builds its middleware chain on the first request
+        settings = override_settings(METRICS=True, METRICS_DIR=self.directory, METRICS_TOKEN="sesame")
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        user = User.objects.create(username="steve")
+        customer = Customer.objects.create(user=user, phone_number="555-1212", address="100 Infinity Way")
+        category = ProductCategory.objects.create(name="Sporting Goods")
+        self.product = Product.objects.create(
+            name="Kite", price=14.99, description="It flies high", quantity=60, location="Pittsburgh",
+            category=category, customer=customer)
+
+    def scrape(self):
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer sesame")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith("#"):
+                sample, value = line.rsplit(" ", 1)
+                samples[sample] = float(value)
+        return samples
+
+    def test_request_metrics(self):
+        """
+        Ensure requests are counted with their latency, queries, size and errors
+        """
+        self.client.get(f"/products/{self.product.id}")
+        self.client.get(f"/products/{self.product.id}")
+        self.client.get("/cachestats")
+        samples = self.scrape()
+
+        labels = 'route="product-detail",method="GET"'
+        self.assertEqual(samples[f'bangazon_http_requests_total{{{labels},status="200"}}'], 2)
+        self.assertEqual(samples[f'bangazon_http_request_duration_seconds_count{{{labels}}}'], 2)
+        self.assertEqual(samples[f'bangazon_http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'], 2)
+        self.assertGreater(samples[f'bangazon_http_db_queries_sum{{{labels}}}'], 0)
+        self.assertGreater(samples[f'bangazon_http_response_size_bytes_sum{{{labels}}}'], 0)
+
+        # Anonymous users may not read the cache counters
+        self.assertEqual(
+            samples['bangazon_http_errors_total{route="cachestats",method="GET",status_class="4xx"}'], 1)
+        self.assertNotIn('bangazon_http_errors_total{route="product-detail",method="GET",status_class="4xx"}',
+                         samples)
+
+        # Buckets are cumulative
+        buckets = [value for sample, value in samples.items()
+                   if sample.startswith(f"bangazon_http_request_duration_seconds_bucket{{{labels}")]
+        self.assertEqual(buckets, sorted(buckets))
+
+    def test_unmatched_routes_share_a_label(self):
+        """
+        Ensure unknown urls do not create a series per path
+        """
+        self.client.get("/no/such/page")
+        self.client.get("/nor/this/one")
+        samples = self.scrape()
+
+        self.assertEqual(
+            samples['bangazon_http_requests_total{route="unmatched",method="GET",status="404"}'], 2)
+        self.assertFalse([sample for sample in samples if "such" in sample])
+
+    def test_cache_hit_ratio(self):
+        """
+        Ensure anonymous catalog reads report response cache hits and misses
+        """
+        self.client.get("/productcategories")
+        self.client.get("/productcategories")
+        samples = self.scrape()
+
+        self.assertEqual(samples['bangazon_response_cache_total{result="miss"}'], 1)
+        self.assertEqual(samples['bangazon_response_cache_total{result="hit"}'], 1)
+        self.assertEqual(samples["bangazon_response_cache_hit_ratio"], 0.5)
+
+    def test_samples_of_all_processes_are_summed(self):
+        """
+        Ensure a scrape reports what other worker processes recorded
+        """
+        metrics.REQUESTS.inc(route="product-list", method="GET", status=200)
+        metrics.DURATION.observe(0.02, route="product-list", method="GET")
+        child = multiprocessing.get_context("fork").Process(target=record_in_child, args=(self.directory,))
+        child.start()
+        child.join()
+        self.assertEqual(child.exitcode, 0)
+
+        samples = self.scrape()
+        labels = 'route="product-list",method="GET"'
+        self.assertEqual(samples[f'bangazon_http_requests_total{{{labels},status="200"}}'], 2)
+        self.assertEqual(samples[f'bangazon_http_request_duration_seconds_bucket{{{labels},le="0.025"}}'], 1)
+        self.assertEqual(samples[f'bangazon_http_request_duration_seconds_bucket{{{labels},le="0.5"}}'], 2)
+        self.assertAlmostEqual(samples[f'bangazon_http_request_duration_seconds_sum{{{labels}}}'], 0.32)
+
+    def test_dead_processes_are_merged(self):
+        """
+        Ensure the file of an exited worker is folded into the archive and removed
+        """
+        metrics.REQUESTS.inc(route="product-list", method="GET", status=200)
+        for _ in range(2):
+            child = multiprocessing.get_context("fork").Process(target=record_in_child, args=(self.directory,))
+            child.start()
+            child.join()
+            self.assertIn(f"{child.pid}.db", os.listdir(self.directory))
+
+            samples = self.scrape()
+            self.assertNotIn(f"{child.pid}.db", os.listdir(self.directory))
+
+        self.assertEqual(sorted(name for name in os.listdir(self.directory) if name.endswith(".db")),
+                         sorted(["archive.db", f"{os.getpid()}.db"]))
+        labels = 'route="product-list",method="GET"'
+        self.assertEqual(samples[f'bangazon_http_requests_total{{{labels},status="200"}}'], 3)
+        self.assertEqual(samples[f'bangazon_http_request_duration_seconds_count{{{labels}}}'], 2)
+        # Merged samples are counted once
+        self.assertEqual(self.scrape()[f'bangazon_http_requests_total{{{labels},status="200"}}'], 3)
+
+    def test_metrics_require_staff_or_token(self):
+        """
+        Ensure /metrics answers staff users and the bearer token, and nobody else
+        """
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 401)
+        with self.settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 401)
+
+        customer = User.objects.create(username="shopper")
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.create(user=customer).key)
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+        staff = User.objects.create(username="admin", is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.create(user=staff).key)
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+
+        self.client.credentials()
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer sesame")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(re.search(r"^# TYPE bangazon_http_requests_total counter$",
+                                  response.content.decode(), re.M))
+
+    def test_streamed_response_is_recorded_when_closed(self):
+        """
+        Ensure a streamed list counts the queries and bytes of its whole body once it is closed
+        """
+        labels = 'route="product-list",method="GET"'
+        # Counted before the next request resets the query log
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/products?stream=1")
+        view_queries = len(queries)
+        self.assertNotIn(f'bangazon_http_requests_total{{{labels},status="200"}}', self.scrape())
+
+        with CaptureQueriesContext(connection) as queries:
+            body = b"".join(response.streaming_content)
+            response.close()
+        body_queries = len(queries)
+        samples = self.scrape()
+
+        self.assertEqual(samples[f'bangazon_http_requests_total{{{labels},status="200"}}'], 1)
+        self.assertEqual(samples[f'bangazon_http_response_size_bytes_sum{{{labels}}}'], len(body))
+        # The rows are read while the body is sent
+        self.assertGreater(body_queries, 0)
+        self.assertEqual(samples[f'bangazon_http_db_queries_sum{{{labels}}}'], view_queries + body_queries)
@@ -1,6 +1,20 @@
+import datetime
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
+from bangazonapi.checkout import checkout
+from bangazonapi.models import Customer, Order, OrderProduct, OutOfStock, Payment, Product
+from bangazonapi.models import AbandonedCart, ProductCategory, ProductStats, Reservation
+from bangazonapi.reservations import sweep
 
 
 class OrderTests(APITestCase):
@@ -79,6 +93,341 @@ class OrderTests(APITestCase):
         self.assertEqual(json_response["size"], 0)
         self.assertEqual(len(json_response["lineitems"]), 0)
 
+    def test_add_product_again_increments_quantity(self):
+        """
+        Ensure adding a product already in the cart increments one line item.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post("/cart", {"product_id": 1}, format='json')
+        self.client.post("/cart", {"product_id": 1, "quantity": 3}, format='json')
+        response = self.client.post("/profile/cart", {"product_id": 1}, format='json')
+        self.assertEqual(json.loads(response.content)["quantity"], 5)
+
+        response = self.client.post("/cart", {"product_id": 1, "quantity": 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get("/cart")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["size"], 5)
+        self.assertEqual(len(json_response["lineitems"]), 1)
+        self.assertEqual(json_response["lineitems"][0]["quantity"], 5)
+
+        # Removing takes off one unit at a time
+        self.client.delete("/cart/1")
+        response = self.client.get("/profile/cart")
+        self.assertEqual(json.loads(response.content)["size"], 4)
+
+    def test_set_many_cart_items(self):
+        """
+        Ensure a list of items is validated up front and written in one request.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        data = {"name": "Sled", "price": 49.99, "quantity": 5, "description": "Downhill",
+                "category_id": 1, "location": "Duluth"}
+        self.client.post("/products", data, format='json')
+        self.client.post("/cart", {"product_id": 1, "quantity": 3}, format='json')
+
+        response = self.client.post("/cart/items", [{"product_id": 2, "quantity": 2}, {"product_id": 99}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content)["errors"][0]["row"], 1)
+
+        items = [{"product_id": 2, "quantity": 2}, {"product_id": 1, "quantity": 1}, {"product_id": 2, "quantity": 1}]
+        response = self.client.post("/cart/items", items, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response["size"], 4)
+        quantities = {item["product"]["id"]: item["quantity"] for item in json_response["lineitems"]}
+        self.assertEqual(quantities, {1: 1, 2: 3})
+
+        response = self.client.post("/cart/items", [{"product_id": 1, "quantity": 0}], format='json')
+        self.assertEqual(json.loads(response.content)["size"], 3)
+
+    def test_cart_summary(self):
+        """
+        Ensure the stored cart summary follows every add, remove and price change.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.get("/cart/summary")
+        self.assertEqual(json.loads(response.content)["item_count"], 0)
+
+        data = {"name": "Sled", "price": 50, "quantity": 5, "description": "Downhill",
+                "category_id": 1, "location": "Duluth"}
+        self.client.post("/products", data, format='json')
+        self.client.post("/cart", {"product_id": 1, "quantity": 2}, format='json')
+        self.client.post("/profile/cart", {"product_id": 2}, format='json')
+        self.client.delete("/cart/1")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/cart/summary")
+        summary = json.loads(response.content)
+        self.assertEqual(
+            (summary["item_count"], summary["product_count"], summary["subtotal"]), (2, 2, 64.99)
+        )
+        self.assertEqual(len([query for query in queries if "bangazonapi_order" in query["sql"]]), 1)
+
+        self.client.post("/cart/items", [{"product_id": 2, "quantity": 3}], format='json')
+        data.update(price=40, created_date="2019-10-23")
+        self.client.put("/products/2", data, format='json')
+        summary = json.loads(self.client.get("/cart/summary").content)
+        self.assertEqual((summary["item_count"], summary["subtotal"]), (4, 134.99))
+
+    def test_checkout_reports_shortfalls(self):
+        """
+        Ensure checkout takes stock and refuses orders it cannot fill without charging them.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post("/paymenttypes", {"merchant_name": "Visa", "account_number": "1234",
+                                    "expiration_date": "2030-01-01", "create_date": "2024-01-01"}, format='json')
+        payment_id = json.loads(response.content)["id"]
+
+        self.client.post("/cart", {"product_id": 1, "quantity": 60}, format='json')
+        # The seller sold one elsewhere after it went in the cart
+        Product.objects.filter(pk=1).update(quantity=59)
+        response = self.client.put("/orders/1", {"payment_type": payment_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(
+            json.loads(response.content)["shortfalls"],
+            [{"product_id": 1, "requested": 60, "available": 59}],
+        )
+        self.assertIsNone(Order.objects.get(pk=1).payment_type_id)
+
+        self.client.delete("/cart/1")
+        response = self.client.put("/orders/1", {"payment_type": payment_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Product.objects.get(pk=1).quantity, 0)
+        self.assertEqual(json.loads(self.client.get("/products/1").content)["number_sold"], 59)
+
+    def test_cart_holds_expire_and_release(self):
+        """
+        Ensure cart items hold stock until they expire, are removed or are bought.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        etag = self.client.get("/products/1")["ETag"]
+        self.client.post("/cart", {"product_id": 1, "quantity": 10}, format='json')
+        self.client.delete("/cart/1")
+        response = self.client.get("/products/availability?ids=1,999")
+        self.assertEqual(json.loads(response.content), [{"id": 1, "available_quantity": 51}])
+        self.assertEqual(self.client.get("/products/availability?ids=x").status_code, 400)
+
+        # Holds are not part of the cached product body, which stays valid
+        response = self.client.get("/products/1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Reservation.objects.update(expires_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(Product.objects.with_availability().get(pk=1).available, 60)
+        self.assertEqual(sweep(batch_size=1), 1)
+        self.assertFalse(Reservation.objects.exists())
+
+        # Adding again renews the hold for the whole line
+        self.client.post("/profile/cart", {"product_id": 1}, format='json')
+        self.assertEqual(Product.objects.with_availability().get(pk=1).available, 50)
+        self.client.delete("/profile/cart")
+        self.assertFalse(Reservation.objects.exists())
+
+        self.client.post("/cart/items", [{"product_id": 1, "quantity": 4}], format='json')
+        self.assertEqual(Reservation.held(1), 4)
+        response = self.client.post("/paymenttypes", {"merchant_name": "Visa", "account_number": "1234",
+                                    "expiration_date": "2030-01-01", "create_date": "2024-01-01"}, format='json')
+        order = Order.objects.get(payment_type__isnull=True)
+        self.client.put(f"/orders/{order.id}", {"payment_type": json.loads(response.content)["id"]}, format='json')
+        self.assertFalse(Reservation.objects.exists())
+        self.assertEqual(Product.objects.with_availability().get(pk=1).available, 56)
+
+    def test_holds_reserve_stock(self):
+        """
+        Ensure stock held in one cart cannot be put in another cart or bought by another customer.
+        """
+        response = self.client.post("/register", {
+            "username": "linda", "password": "Admin8*", "email": "linda@example.com",
+            "address": "1 Loop", "phone_number": "555-1212", "first_name": "Linda", "last_name": "Lee"},
+            format='json')
+        linda = 'Token ' + json.loads(response.content)["token"]
+        self.client.credentials(HTTP_AUTHORIZATION=linda)
+        response = self.client.post("/paymenttypes", {"merchant_name": "Visa", "account_number": "1234",
+                                    "expiration_date": "2030-01-01", "create_date": "2024-01-01"}, format='json')
+        payment_id = json.loads(response.content)["id"]
+
+        # Linda's hold runs out, then steve holds most of the stock
+        self.client.post("/cart", {"product_id": 1, "quantity": 20}, format='json')
+        Reservation.objects.update(expires_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post("/cart/items", [{"product_id": 1, "quantity": 50}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.credentials(HTTP_AUTHORIZATION=linda)
+        order = Order.objects.get(customer__user__username="linda")
+        response = self.client.put(f"/orders/{order.id}", {"payment_type": payment_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(json.loads(response.content)["shortfalls"],
+                         [{"product_id": 1, "requested": 20, "available": 10}])
+        self.assertEqual(Product.objects.get(pk=1).quantity, 60)
+
+        # Renewing her hold is refused too, and leaves the line as it was
+        response = self.client.post("/profile/cart", {"product_id": 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(json.loads(response.content)["shortfalls"],
+                         [{"product_id": 1, "requested": 21, "available": 10}])
+        self.assertEqual(order.lineitems.get().quantity, 20)
+        response = self.client.post("/cart/items", [{"product_id": 1, "quantity": 11}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.client.post("/cart/items", [{"product_id": 1, "quantity": 10}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.put(f"/orders/{order.id}", {"payment_type": payment_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Product.objects.with_availability().get(pk=1).available, 0)
+
+    def test_sweep_abandoned_carts(self):
+        """
+        Ensure idle carts are archived and removed in batches while active carts stay.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post("/cart", {"product_id": 1, "quantity": 2}, format='json')
+        customer = Customer.objects.get(user__username="steve")
+        for _ in range(4):
+            idle = Order.objects.create(customer=customer)
+            OrderProduct.add(idle, Product.objects.get(pk=1))
+        long_ago = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        Order.objects.exclude(pk=1).update(updated_at=long_ago)
+
+        output = StringIO()
+        call_command("sweep_abandoned_carts", "--dry-run", stdout=output)
+        self.assertIn("4 carts", output.getvalue())
+
+        output = StringIO()
+        call_command("sweep_abandoned_carts", "--archive", "--batch-size", "3", stdout=output)
+        self.assertIn("Removed 4 carts and 4 line items in 2 batches", output.getvalue())
+        self.assertIn("rows/s", output.getvalue())
+
+        self.assertEqual(list(Order.objects.values_list("id", flat=True)), [1])
+        self.assertEqual(Reservation.held(1), 2)
+        archived = AbandonedCart.objects.first()
+        self.assertEqual((AbandonedCart.objects.count(), archived.lines), (4, [{"product_id": 1, "quantity": 1}]))
+
+    ORDER_LIST_QUERY_CEILING = 6
+    ORDER_DETAIL_QUERY_CEILING = 6
+
+    def test_order_history_query_ceiling(self):
+        """
+        Ensure order history costs a fixed number of queries however many orders and items it holds.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        customer = Customer.objects.get(user__username="steve")
+        payment = Payment.objects.create(
+            merchant_name="Visa", account_number="1234", customer=customer,
+            expiration_date="2030-01-01", create_date=datetime.date.today()
+        )
+        data = {"name": "Sled", "price": 50, "quantity": 500, "description": "Downhill",
+                "category_id": 1, "location": "Duluth"}
+
+        def place_orders(count):
+            for _ in range(count):
+                self.client.post("/products", data, format='json')
+                self.client.post("/cart/items", [{"product_id": product_id, "quantity": 2}
+                                                 for product_id in Product.objects.values_list("id", flat=True)], format='json')
+                order = Order.objects.get(payment_type__isnull=True)
+                self.client.put(f"/orders/{order.id}", {"payment_type": payment.id}, format='json')
+
+        def measure(url):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries), json.loads(response.content)
+
+        place_orders(1)
+        few, _ = measure("/orders")
+        place_orders(6)
+        many, orders = measure("/orders")
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, self.ORDER_LIST_QUERY_CEILING)
+        self.assertEqual(len(orders), 7)
+        self.assertEqual(orders[-1]["lineitems"][0]["product"]["number_sold"], 14)
+        self.assertEqual(orders[-1]["payment_type_info"]["id"], payment.id)
+
+        detail, order = measure(f"/orders/{orders[-1]['id']}")
+        self.assertLessEqual(detail, self.ORDER_DETAIL_QUERY_CEILING)
+        self.assertEqual(len(order["lineitems"]), 8)
+
+        many, _ = measure(f"/orders?payment_id={payment.id}")
+        self.assertLessEqual(many, self.ORDER_LIST_QUERY_CEILING)
+
     # TODO: Complete order by adding payment type
 
-    # TODO: New line item is not added to closed order
\ No newline at end of file
+    # TODO: New line item is not added to closed order
+
+
+class CheckoutStressTests(TransactionTestCase):
+    """Concurrent checkouts against one product, each thread on its own connection"""
+
+    STOCK = 25
+    BUYERS = 60
+    THREADS = 8
+
+    def setUp(self) -> None:
+        category = ProductCategory.objects.create(name="Sporting Goods")
+        seller = Customer.objects.create(
+            user=User.objects.create(username="seller"),
+            phone_number="555-1212", address="100 Infinity Way",
+        )
+        self.product = Product.objects.create(
+            name="Kite", price=14.99, description="It flies high", quantity=self.STOCK,
+            location="Pittsburgh", category=category, customer=seller,
+        )
+
+        self.carts = []
+        for number in range(self.BUYERS):
+            buyer = Customer.objects.create(
+                user=User.objects.create(username=f"buyer{number}"),
+                phone_number="555-1212", address="100 Infinity Way",
+            )
+            payment = Payment.objects.create(
+                merchant_name="Visa", account_number="1234", customer=buyer,
+                expiration_date="2030-01-01", create_date=datetime.date.today(),
+            )
+            # More buyers than stock, so the lines skip the cart's stock check and hold
+            order = Order.objects.create(customer=buyer)
+            OrderProduct.objects.create(order=order, product=self.product)
+            self.carts.append((order, payment.id))
+
+    def test_concurrent_checkouts_never_oversell(self):
+        """
+        Ensure many threads buying the same product sell exactly the stock on hand.
+        """
+        lock = threading.Lock()
+        outcomes = {"sold": 0, "short": 0}
+
+        def buy(cart):
+            order, payment_id = cart
+            try:
+                while True:
+                    try:
+                        checkout(order, payment_id)
+                        outcome = "sold"
+                    except OutOfStock:
+                        outcome = "short"
+                    except OperationalError as ex:
+                        # SQLite refuses a second writer instead of queueing it
+                        if "locked" not in str(ex):
+                            raise
+                        time.sleep(0.001)
+                        continue
+                    break
+                with lock:
+                    outcomes[outcome] += 1
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            list(pool.map(buy, self.carts))
+        elapsed = time.perf_counter() - started
+
+        rate = f"{self.BUYERS / elapsed:.0f} checkouts/s with {self.THREADS} threads"
+
+        self.product.refresh_from_db()
+        self.assertEqual(outcomes, {"sold": self.STOCK, "short": self.BUYERS - self.STOCK}, rate)
+        self.assertEqual(self.product.quantity, 0)
+        self.assertEqual(
+            Order.objects.filter(payment_type__isnull=False).count(), self.STOCK
+        )
+        self.assertEqual(ProductStats.objects.get(product=self.product).sold_count, self.STOCK)
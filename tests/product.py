@@ -1,7 +1,27 @@
+import base64
 import json
 import datetime
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from bangazonapi.models import Customer, Order, OrderProduct, Payment, Product, ProductRating
+from bangazonapi.models import ModelVersion, ProductStats
+from bangazonapi import cache
+from bangazonapi.views.product import ProductRowSerializer, ProductSerializer
 
 
 class ProductTests(APITestCase):
@@ -95,6 +115,398 @@ class ProductTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(json_response), 3)
 
+    def test_list_products_query_count_is_constant(self):
+        """
+        Ensure listing products does not run extra queries per product.
+        """
+        self.test_create_product()
+
+        with CaptureQueriesContext(connection) as single:
+            response = self.client.get("/products", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for _ in range(4):
+            self.test_create_product()
+
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get("/products", None, format='json')
+        self.assertEqual(len(json.loads(response.content)), 5)
+        self.assertEqual(len(single), len(many))
+
+    def test_product_average_rating(self):
+        """
+        Ensure the list and detail views report the same rating as the model.
+        """
+        self.test_create_product()
+        product = Product.objects.get(pk=1)
+        customer = Customer.objects.get(user__username="steve")
+        ProductRating.objects.create(product=product, customer=customer, rating=4)
+        ProductRating.objects.create(product=product, customer=customer, rating=1)
+
+        response = self.client.get("/products", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response[0]["average_rating"], product.average_rating)
+        self.assertEqual(json_response[0]["number_sold"], 0)
+
+        response = self.client.get("/products/1", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["average_rating"], 2.5)
+
+    def test_filter_products_by_number_sold(self):
+        """
+        Ensure sales filters only count completed orders and compose with other filters.
+        """
+        self.test_create_product()
+        self.test_create_product()
+        customer = Customer.objects.get(user__username="steve")
+        payment = Payment.objects.create(
+            merchant_name="Visa", account_number="1234", customer=customer,
+            expiration_date="2030-01-01", create_date=datetime.date.today()
+        )
+        paid = Order.objects.create(customer=customer)
+        OrderProduct.objects.create(order=paid, product_id=1, quantity=2)
+        response = self.client.put(f"/orders/{paid.id}", {"payment_type": payment.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        open_order = Order.objects.create(customer=customer)
+        OrderProduct.objects.create(order=open_order, product_id=2)
+
+        response = self.client.get("/products?number_sold=2&min_price=10", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["id"] for p in json_response], [1])
+        self.assertEqual(json_response[0]["number_sold"], 2)
+
+        response = self.client.get("/products?max_sold=0", None, format='json')
+        self.assertEqual([p["id"] for p in json.loads(response.content)], [2])
+
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        response = self.client.get(f"/products?number_sold=1&sold_since={tomorrow}", None, format='json')
+        self.assertEqual(json.loads(response.content), [])
+
+        response = self.client.get("/products?number_sold=lots", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_paginate_products_with_cursor(self):
+        """
+        Ensure cursor pages cover every product once, in both directions.
+        """
+        for _ in range(5):
+            self.test_create_product()
+
+        url = "/products?page_size=2&order_by=price&direction=desc"
+        seen = []
+        pages = []
+        while url is not None:
+            response = self.client.get(url, None, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            json_response = json.loads(response.content)
+            pages.append(json_response)
+            seen.extend(p["id"] for p in json_response["results"])
+            url = json_response["next"]
+
+        self.assertEqual(seen, [5, 4, 3, 2, 1])
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]["previous"])
+
+        response = self.client.get(pages[2]["previous"], None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual([p["id"] for p in json_response["results"]], [3, 2])
+
+        response = self.client.get("/products?cursor=garbage", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rebuild_product_stats(self):
+        """
+        Ensure the rebuild command repairs counters that drifted from the source rows.
+        """
+        self.test_create_product()
+        customer = Customer.objects.get(user__username="steve")
+        ProductRating.objects.create(product_id=1, customer=customer, rating=5)
+        ProductStats.objects.filter(product_id=1).update(rating_sum=0, sold_count=7)
+
+        out = StringIO()
+        call_command("rebuild_product_stats", stdout=out)
+        self.assertIn("1 of 1 products drifted", out.getvalue())
+
+        stats = ProductStats.objects.get(product_id=1)
+        self.assertEqual((stats.sold_count, stats.rating_sum, stats.rating_count), (0, 5, 1))
+
+    def test_search_products(self):
+        """
+        Ensure ?q= does ranked prefix search and skips deleted products.
+        """
+        self.test_create_product()
+        url = "/products"
+        data = {
+            "name": "Kayak",
+            "price": 499.99,
+            "quantity": 3,
+            "description": "Sit-on-top kayak with a kite mount",
+            "category_id": 1,
+            "location": "Pittsburgh"
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post(url, data, format='json')
+
+        response = self.client.get("/products?q=kit", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["id"] for p in json_response], [1, 2])
+
+        response = self.client.get("/products?q=fli hig", None, format='json')
+        self.assertEqual([p["id"] for p in json.loads(response.content)], [1])
+
+        response = self.client.get("/products?name=kit", None, format='json')
+        self.assertEqual([p["id"] for p in json.loads(response.content)], [1])
+
+        self.client.delete("/products/1")
+        response = self.client.get("/products?q=kit", None, format='json')
+        self.assertEqual([p["id"] for p in json.loads(response.content)], [2])
+
+    def test_anonymous_product_reads_are_cached(self):
+        """
+        Ensure anonymous reads are cached until a product changes.
+        """
+        caches["responses"].clear()
+        cache.reset_stats()
+        self.test_create_product()
+        self.client.credentials()
+
+        response = self.client.get("/products/1?b=2&a=1")
+        self.assertEqual(response["X-Cache"], "MISS")
+        response = self.client.get("/products/1?a=1&b=2")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(json.loads(response.content)["name"], "Kite")
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.delete("/products/1")
+        self.client.credentials()
+
+        response = self.client.get("/products/1?a=1&b=2")
+        self.assertNotEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_conditional_get_products(self):
+        """
+        Ensure unchanged products answer 304 to matching validators.
+        """
+        self.test_create_product()
+
+        response = self.client.get("/products/1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        last_modified = response["Last-Modified"]
+
+        response = self.client.get("/products/1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+        response = self.client.get("/products", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get("/productcategories")
+        response = self.client.get("/productcategories", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.test_update_product()
+        response = self.client.get("/products/1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_last_modified_follows_the_version(self):
+        """
+        Ensure every version bump moves Last-Modified.
+        """
+        self.test_create_product()
+        last_modified = self.client.get("/products/1")["Last-Modified"]
+
+        # New image variants or sales counters bump the version only
+        later = timezone.now() + datetime.timedelta(minutes=5)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            ModelVersion.bump("product")
+
+        response = self.client.get("/products/1", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Last-Modified"], http_date(later.timestamp()))
+
+    def test_row_serializer_matches_product_serializer(self):
+        """
+        Ensure the fast list serializer renders byte for byte what ProductSerializer does.
+        """
+        for _ in range(3):
+            self.test_create_product()
+        customer = Customer.objects.get(user__username="steve")
+        Product.objects.filter(pk=2).update(image_path="products/2-Kite.png", price=10)
+        ProductRating.objects.create(product_id=1, customer=customer, rating=4)
+        ProductRating.objects.create(product_id=1, customer=customer, rating=3)
+        ProductStats.objects.filter(product_id=1).update(sold_count=12)
+
+        request = Request(APIRequestFactory().get("/products"))
+        products = Product.objects.with_stats().order_by("id")
+        renderer = JSONRenderer()
+
+        expected = renderer.render(
+            ProductSerializer(products, many=True, context={"request": request}).data
+        )
+        actual = renderer.render(ProductRowSerializer(products, context={"request": request}).data)
+        self.assertEqual(actual, expected)
+
+        expected = renderer.render(ProductSerializer(products, many=True).data)
+        actual = renderer.render(ProductRowSerializer(products).data)
+        self.assertEqual(actual, expected)
+
+    def test_stream_products(self):
+        """
+        Ensure a streamed list has the same body as the buffered one.
+        """
+        for _ in range(3):
+            self.test_create_product()
+
+        buffered = self.client.get("/products")
+        streamed = self.client.get("/products?stream=1")
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(b"".join(streamed.streaming_content), buffered.content)
+
+        streamed = self.client.get("/products", HTTP_ACCEPT="application/stream+json")
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(len(json.loads(b"".join(streamed.streaming_content))), 3)
+
+        streamed = self.client.get("/users?stream=1")
+        users = json.loads(b"".join(streamed.streaming_content))
+        self.assertEqual([user["username"] for user in users], ["steve"])
+
+    def test_upload_product_image(self):
+        """
+        Ensure images upload as multipart, validate, and are stored once per content.
+        """
+        self.test_create_product()
+        self.test_create_product()
+        png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 200
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            upload = SimpleUploadedFile("kite.png", png, content_type="image/png")
+            response = self.client.post("/products/1/image", {"image_path": upload}, format="multipart")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            first_path = json.loads(response.content)["image_path"]
+
+            upload = SimpleUploadedFile("copy.png", png, content_type="image/png")
+            response = self.client.post("/products/2/image", {"image_path": upload}, format="multipart")
+            self.assertEqual(json.loads(response.content)["image_path"], first_path)
+            stored = [name for _, _, names in os.walk(media_root) for name in names]
+            self.assertEqual(len(stored), 1)
+
+            upload = SimpleUploadedFile("kite.png", b"not really a png", content_type="image/png")
+            response = self.client.post("/products/1/image", {"image_path": upload}, format="multipart")
+            self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+            with self.settings(PRODUCT_IMAGE_MAX_BYTES=100):
+                upload = SimpleUploadedFile("kite.png", png, content_type="image/png")
+                response = self.client.post("/products/1/image", {"image_path": upload}, format="multipart")
+                self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_create_product_with_inline_image(self):
+        """
+        Ensure base64 images on POST /products are validated like uploads.
+        """
+        data = {"name": "Kite", "price": 14.99, "quantity": 60, "description": "It flies high",
+                "category_id": 1, "location": "Pittsburgh"}
+        png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 200
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            image_path = "data:image/png;base64," + base64.b64encode(png).decode()
+            response = self.client.post("/products", dict(data, image_path=image_path), format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertTrue(json.loads(response.content)["image_path"].endswith(".png"))
+
+            rejected = (
+                ("not a data uri", status.HTTP_400_BAD_REQUEST),
+                ("data:image/png;base64,@@@", status.HTTP_400_BAD_REQUEST),
+                ("data:image/png;base64," + base64.b64encode(b"not an image").decode(),
+                 status.HTTP_415_UNSUPPORTED_MEDIA_TYPE),
+            )
+            for image_path, expected in rejected:
+                response = self.client.post("/products", dict(data, image_path=image_path), format="json")
+                self.assertEqual(response.status_code, expected, image_path)
+
+            with self.settings(PRODUCT_IMAGE_MAX_BYTES=100):
+                image_path = "data:image/png;base64," + base64.b64encode(png).decode()
+                response = self.client.post("/products", dict(data, image_path=image_path), format="json")
+                self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        # Rejected images create no product
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_product_image_variants(self):
+        """
+        Ensure uploads schedule resizing and products list variant URLs once rendered.
+        """
+        self.test_create_product()
+        photo = BytesIO()
+        Image.new("RGB", (1600, 900), (200, 40, 40)).save(photo, "JPEG")
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(
+            MEDIA_ROOT=media_root, IMAGE_DERIVATIVE_WORKERS=0
+        ):
+            upload = SimpleUploadedFile("kite.jpg", photo.getvalue(), content_type="image/jpeg")
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                response = self.client.post("/products/1/image", {"image_path": upload}, format="multipart")
+            self.assertEqual(len(callbacks), 1)
+            self.assertIsNone(json.loads(response.content)["image_variants"])
+
+            call_command("generate_image_derivatives", workers=0, stdout=StringIO())
+
+            response = self.client.get("/products/1")
+            variants = json.loads(response.content)["image_variants"]
+            self.assertEqual(set(variants), {"thumb", "card", "full"})
+            self.assertTrue(variants["thumb"]["webp"].endswith("/thumb.webp"))
+
+            path = os.path.join(media_root, variants["card"]["jpeg"].split("/media/", 1)[1])
+            with Image.open(path) as card:
+                self.assertEqual(card.size, (480, 270))
+
+            # Readiness is read from the row, serializing never stats storage
+            with mock.patch.object(default_storage, "exists", side_effect=AssertionError("storage stat")):
+                response = self.client.get("/products?stream=1")
+                streamed = json.loads(b"".join(response.streaming_content))
+                self.assertEqual(streamed[0]["image_variants"], variants)
+                self.assertEqual(json.loads(self.client.get("/products").content)[0]["image_variants"], variants)
+
+    def test_bulk_create_products(self):
+        """
+        Ensure catalogs import in batches and bad rows are reported without stopping the rest.
+        """
+        row = {"name": "Kite", "price": 14.99, "description": "It flies high",
+               "quantity": 60, "location": "Pittsburgh", "category_id": 1}
+        data = [row, dict(row, price=99999), dict(row, category_id=42), dict(row, name="Sled")]
+        response = self.client.post("/products/bulk", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["created"], 2)
+        self.assertEqual([error["row"] for error in json_response["errors"]], [1, 2])
+        self.assertIn("price", json_response["errors"][0]["errors"])
+        self.assertIn("category_id", json_response["errors"][1]["errors"])
+        self.assertEqual(Product.objects.get(pk=json_response["ids"][1]).name, "Sled")
+
+        response = self.client.get("/products?q=sled")
+        self.assertEqual([product["name"] for product in json.loads(response.content)], ["Sled"])
+
+        lines = [json.dumps(dict(row, name=f"Kite {number}")) for number in range(250)]
+        lines.insert(5, "{not json")
+        with self.settings(PRODUCT_BULK_BATCH_SIZE=100):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    "/products/bulk", "\n".join(lines), content_type="application/x-ndjson"
+                )
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["created"], 250)
+        self.assertEqual(json_response["errors"][0]["row"], 5)
+        self.assertLess(len(queries), 40)
+
+        response = self.client.post("/products/bulk", [dict(row, price=-1)], format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     # TODO: Delete product
 
     # TODO: Product can be rated. Assert average rating exists.
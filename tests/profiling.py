@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APITestCase
+from bangazonapi import profiling
+from bangazonapi.models import Customer, Product, ProductCategory
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self) -> None:
+        # No requests here, the client builds its middleware chain on the first
+        # request and each test changes the settings it reads
+        user = User.objects.create(username="steve")
+        self.token = Token.objects.create(user=user).key
+        customer = Customer.objects.create(user=user, phone_number="555-1212", address="100 Infinity Way")
+        category = ProductCategory.objects.create(name="Sporting Goods")
+        self.product = Product.objects.create(
+            name="Kite", price=14.99, description="It flies high", quantity=60, location="Pittsburgh",
+            category=category, customer=customer)
+        self.profiles = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profiles)
+
+    def timings(self, response):
+        entries = {}
+        for entry in response["Server-Timing"].split(", "):
+            name, *params = entry.split(";")
+            entries[name] = dict(param.split("=", 1) for param in params)
+        return entries
+
+    def test_no_server_timing_by_default(self):
+        """
+        Ensure responses carry no Server-Timing header while profiling is off
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.get(f"/products/{self.product.id}")
+
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_phases(self):
+        """
+        Ensure Server-Timing reports the auth, view, db, serializer and render phases
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.get("/profile")
+
+        timings = self.timings(response)
+        for phase in ("auth", "view", "db", "serialize", "render", "total"):
+            self.assertIn(phase, timings)
+            self.assertGreaterEqual(float(timings[phase]["dur"]), 0)
+        self.assertRegex(timings["db"]["desc"], r'^"[1-9]\d* queries"$')
+        self.assertNotIn("profile", timings)
+
+    def test_profile_with_token(self):
+        """
+        Ensure a request carrying the profiling token is profiled and the others are not
+        """
+        with self.settings(PROFILE_TOKEN="sesame", PROFILE_DIR=self.profiles):
+            self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+            response = self.client.get("/products", HTTP_X_PROFILE="wrong")
+            self.assertNotIn("Server-Timing", response)
+
+            response = self.client.get("/products", HTTP_X_PROFILE="sesame")
+
+        name = self.timings(response)["profile"]["desc"].strip('"')
+        self.assertTrue(name.endswith("-GET-products.prof"))
+        self.assertEqual(os.listdir(self.profiles), [name])
+
+    def test_one_profile_at_a_time(self):
+        """
+        Ensure a request is not profiled while another request holds the profiler
+        """
+        with self.settings(PROFILE_TOKEN="sesame", PROFILE_DIR=self.profiles):
+            self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+            with profiling._profiler_lock, self.assertLogs("bangazonapi.profiling", "INFO"):
+                response = self.client.get("/products", HTTP_X_PROFILE="sesame")
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("Server-Timing", response)
+            self.assertEqual(os.listdir(self.profiles), [])
+
+            response = self.client.get("/products", HTTP_X_PROFILE="sesame")
+            self.assertIn("profile", self.timings(response))
+        self.assertFalse(profiling._profiler_lock.locked())
+
+    def test_instrumented_only_while_enabled(self):
+        """
+        Ensure DRF is only wrapped while profiling or Server-Timing is turned on
+        """
+        with self.settings(SERVER_TIMING=True):
+            self.client.get(f"/products/{self.product.id}")
+        original = profiling._originals[(BaseSerializer, "data")]
+        self.assertIsNot(BaseSerializer.data, original)
+
+        # A new client loads the middleware again, with the settings now off
+        self.client = self.client_class()
+        self.client.get(f"/products/{self.product.id}")
+        self.assertIs(BaseSerializer.data, original)
+        self.assertEqual(profiling._originals, {})
+
+    def test_streamed_response_is_timed_until_closed(self):
+        """
+        Ensure a streamed body's queries and serialization are timed and profiled when it is closed
+        """
+        wrappers = list(connection.execute_wrappers)
+        with self.settings(SERVER_TIMING=True, PROFILE_TOKEN="sesame", PROFILE_DIR=self.profiles):
+            self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+            response = self.client.get("/products?stream=1", HTTP_X_PROFILE="sesame")
+            name = self.timings(response)["profile"]["desc"].strip('"')
+            self.assertEqual(os.listdir(self.profiles), [])
+
+            with self.assertLogs("bangazonapi.profiling", "INFO") as logs:
+                body = b"".join(response.streaming_content)
+                response.close()
+
+        self.assertIn(b'"Kite"', body)
+        self.assertEqual(os.listdir(self.profiles), [name])
+        self.assertEqual(connection.execute_wrappers, wrappers)
+        self.assertFalse(profiling._profiler_lock.locked())
+
+        logged = logs.records[0].getMessage()
+        self.assertTrue(logged.startswith("Server-Timing of streamed GET /products: "))
+        streamed = self.timings({"Server-Timing": logged.split(": ", 1)[1]})
+        self.assertIn("serialize", streamed)
+        self.assertGreater(int(streamed["db"]["desc"].strip('"').split()[0]),
+                           int(self.timings(response)["db"]["desc"].strip('"').split()[0]))
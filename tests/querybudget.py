@@ -0,0 +1,185 @@
+import datetime
+import json
+import tempfile
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from bangazonapi.models import Customer, Favorite, Order, OrderProduct, Payment, Product
+from bangazonapi.models import ProductCategory, ProductRating, Recommendation
+
+
+class QueryBudgetTests(APITestCase):
+    """Every endpoint in bangazon/urls.py stays within a fixed number of queries
+
+    The dataset is grown between measurements. A budget that is exceeded,
+    or a query count that changes with the number of rows, fails with the
+    captured SQL so the N+1 can be found.
+    """
+
+    # Rows of every kind added before each measurement
+    DATASET_SIZES = (2, 10, 40)
+
+    CUSTOMER = {"phone_number": "555-1212", "address": "1 Loop", "first_name": "Steve",
+                "last_name": "Brownlee", "email": "steve@stevebrownlee.com"}
+    PRODUCT = {"name": "Kite", "price": 14.99, "description": "It flies high", "quantity": 60,
+               "location": "Pittsburgh", "category_id": "{category}"}
+    PAYMENT = {"merchant_name": "Amex", "account_number": "5678",
+               "expiration_date": "2030-01-01", "create_date": "2024-01-01"}
+    PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 200
+
+    # (method, url, body, query budget[, format]). Urls and bodies are formatted
+    # with ids from seed(), a body value of exactly "{name}" is replaced by that id.
+    # Writes run in order: the cart is changed, checked out, then recreated and dropped.
+    BUDGETS = (
+        ("get", "/products", None, 4),
+        ("get", "/products/{product}", None, 4),
+        ("get", "/products?q=kite&order_by=price", None, 4),
+        ("get", "/products/availability?ids={product}", None, 2),
+        ("get", "/productcategories", None, 4),
+        ("get", "/productcategories/{category}", None, 4),
+        ("get", "/lineitems/{line_item}", None, 3),
+        ("get", "/users", None, 2),
+        ("get", "/users/{user}", None, 2),
+        ("get", "/orders", None, 5),
+        ("get", "/orders/{order}", None, 5),
+        ("get", "/cart", None, 6),
+        ("get", "/cart/summary", None, 2),
+        ("get", "/paymenttypes", None, 2),
+        ("get", "/paymenttypes/{payment}", None, 2),
+        ("get", "/profile", None, 4),
+        ("get", "/profile/cart", None, 6),
+        ("get", "/profile/favoritesellers", None, 3),
+        ("post", "/cart", {"product_id": "{product}"}, 12),
+        ("post", "/cart/items", [{"product_id": "{product}", "quantity": 2}], 15),
+        ("put", "/customers/{customer}", CUSTOMER, 5),
+        ("post", "/products", PRODUCT, 10),
+        ("post", "/products/bulk", "{rows}", 10),
+        ("put", "/products/{own_product}", dict(PRODUCT, created_date="2024-01-01"), 10),
+        ("post", "/products/{own_product}/image", {"image_path": "{image}"}, 9, "multipart"),
+        ("post", "/products/{product}/recommend", {"recipient": "{recipient}"}, 5),
+        ("delete", "/products/{own_product}", None, 7),
+        ("post", "/paymenttypes", PAYMENT, 3),
+        ("delete", "/paymenttypes/{spare_payment}", None, 3),
+        ("post", "/productcategories", {"name": "Kites"}, 4),
+        ("delete", "/cart/{product}", None, 9),
+        ("delete", "/lineitems/{line_item}", None, 3),
+        ("put", "/orders/{cart}", {"payment_type": "{payment}"}, 17),
+        ("post", "/profile/cart", {"product_id": "{product}", "quantity": 1}, 15),
+        ("delete", "/profile/cart", None, 7),
+        ("post", "/register", dict(CUSTOMER, username="{username}", password="Admin8*"), 4),
+        ("post", "/login", {"username": "steve", "password": "Admin8*"}, 2),
+    )
+
+    def setUp(self) -> None:
+        response = self.client.post("/register", {
+            "username": "steve", "password": "Admin8*", "email": "steve@stevebrownlee.com",
+            "address": "100 Infinity Way", "phone_number": "555-1212",
+            "first_name": "Steve", "last_name": "Brownlee"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + json.loads(response.content)["token"])
+        self.customer = Customer.objects.get(user__username="steve")
+        self.category = ProductCategory.objects.create(name="Sporting Goods")
+        self.payment = Payment.objects.create(
+            merchant_name="Visa", account_number="1234", customer=self.customer,
+            expiration_date="2030-01-01", create_date=datetime.date.today())
+        self.seeded = 0
+
+    def seed(self, size):
+        """Add `size` sellers, each with products, ratings and a paid order from steve"""
+        for number in range(self.seeded, self.seeded + size):
+            seller = Customer.objects.create(
+                user=User.objects.create(username=f"seller{number}"),
+                phone_number="555-1212", address="100 Infinity Way")
+            products = [
+                Product.objects.create(
+                    name=f"Kite {number}-{item}", price=10 + item, description="It flies high",
+                    quantity=100, location="Pittsburgh", category=self.category, customer=seller)
+                for item in range(3)
+            ]
+            order = Order.objects.create(customer=self.customer)
+            for product in products:
+                OrderProduct.add(order, product, 2)
+                ProductRating.objects.create(product=product, customer=self.customer, rating=4)
+            Order.objects.filter(pk=order.pk).update(payment_type=self.payment)
+
+            cart, _ = Order.objects.get_or_create(customer=self.customer, payment_type__isnull=True)
+            OrderProduct.add(cart, products[0])
+            Favorite.objects.create(customer=self.customer, seller=seller)
+            Recommendation.objects.create(customer=seller, product=products[1], recommender=self.customer)
+        self.seeded += size
+
+        # Targets the writes change or delete, fresh for every measurement. The
+        # cart was checked out by the last measurement, so it gets the product again.
+        cart = Order.objects.get(customer=self.customer, payment_type__isnull=True)
+        OrderProduct.add(cart, Product.objects.first())
+        own_product = Product.objects.create(
+            name="Own kite", price=12, description="It flies high", quantity=100,
+            location="Pittsburgh", category=self.category, customer=self.customer)
+        spare_payment = Payment.objects.create(
+            merchant_name="Visa", account_number="9999", customer=self.customer,
+            expiration_date="2030-01-01", create_date=datetime.date.today())
+        rows = [dict(self.PRODUCT, name=f"Bulk kite {item}", category_id=self.category.pk)
+                for item in range(size)]
+
+        return {
+            "cart": cart.pk,
+            "own_product": own_product.pk,
+            "spare_payment": spare_payment.pk,
+            "recipient": seller.user_id,
+            "rows": rows,
+            "image": SimpleUploadedFile("kite.png", self.PNG, content_type="image/png"),
+            "username": f"shopper{self.seeded}",
+            "product": Product.objects.first().pk,
+            "category": self.category.pk,
+            "line_item": cart.lineitems.first().pk,
+            "user": self.customer.user_id,
+            "order": Order.objects.filter(payment_type__isnull=False).first().pk,
+            "payment": self.payment.pk,
+            "customer": self.customer.pk,
+        }
+
+    def fill(self, value, ids):
+        if isinstance(value, str):
+            if value.startswith("{") and value.endswith("}") and value[1:-1] in ids:
+                return ids[value[1:-1]]
+            return value.format(**ids)
+        if isinstance(value, dict):
+            return {key: self.fill(item, ids) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.fill(item, ids) for item in value]
+        return value
+
+    def measure(self, ids):
+        counts = {}
+        for method, url, body, budget, *options in self.BUDGETS:
+            path = url.format(**ids)
+            body_format = options[0] if options else 'json'
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(path, self.fill(body, ids), format=body_format)
+            self.assertLess(response.status_code, 400, f"{method.upper()} {path} failed")
+
+            sql = "\n".join(query["sql"] for query in queries.captured_queries)
+            self.assertLessEqual(
+                len(queries), budget,
+                f"{method.upper()} {path} ran {len(queries)} queries, budget {budget}:\n{sql}")
+            counts[(method, url)] = (len(queries), sql)
+        return counts
+
+    def test_query_budgets_do_not_grow_with_data(self):
+        """
+        Ensure each endpoint meets its budget at every dataset size.
+        """
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root, IMAGE_DERIVATIVE_WORKERS=0):
+            measurements = [self.measure(self.seed(size)) for size in self.DATASET_SIZES]
+
+        for (method, url), (first, _) in measurements[0].items():
+            for size, counts in zip(self.DATASET_SIZES[1:], measurements[1:]):
+                count, sql = counts[(method, url)]
+                self.assertEqual(
+                    first, count,
+                    f"{method.upper()} {url} went from {first} to {count} queries "
+                    f"with {size} rows:\n{sql}")
@@ -0,0 +1,141 @@
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from bangazonapi import slowqueries
+from bangazonapi.models import Customer, Product, ProductCategory
+
+
+class SlowQueryTests(APITestCase):
+    def setUp(self) -> None:
+        user = User.objects.create(username="steve")
+        self.token = Token.objects.create(user=user).key
+        customer = Customer.objects.create(user=user, phone_number="555-1212", address="100 Infinity Way")
+        category = ProductCategory.objects.create(name="Sporting Goods")
+        for price in (5, 15, 25):
+            Product.objects.create(
+                name=f"Kite {price}", price=price, description="It flies high", quantity=60,
+                location="Pittsburgh", category=category, customer=customer)
+        slowqueries._explained.clear()  # pylint: disable=protected-access
+
+    def slow_queries(self, run):
+        # Every statement is slower than a nanosecond
+        with self.settings(SLOW_QUERY_MS=1e-6), self.assertLogs("bangazonapi.slowqueries", "WARNING") as logs:
+            run()
+        return [record.slow_query for record in logs.records]
+
+    def test_slow_query_is_logged_with_plan(self):
+        """
+        Ensure a slow statement is logged with its params, caller and query plan
+        """
+        entries = self.slow_queries(lambda: list(Product.objects.filter(price__gte=10)))
+
+        entry = entries[0]
+        self.assertIn("bangazonapi_product", entry["sql"])
+        self.assertIn(10, entry["params"])
+        self.assertNotIn("10", entry["statement"])
+        self.assertGreater(entry["duration_ms"], 0)
+        self.assertEqual(entry["caller"]["file"], os.path.join("tests", "slowqueries.py"))
+        self.assertIn("test_slow_query_is_logged_with_plan", entry["caller"]["function"])
+        self.assertTrue(entry["plan"])
+        self.assertRegex(" ".join(entry["plan"]), r"SCAN|SEARCH")
+
+    def test_explain_is_not_seen_by_other_wrappers(self):
+        """
+        Ensure the EXPLAIN is not counted by other execute wrappers, and a failed one leaves the transaction usable
+        """
+        seen = []
+
+        def counter(execute, sql, params, many, context):
+            seen.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(counter):
+            entries = self.slow_queries(lambda: list(Product.objects.filter(price__gte=10)))
+        self.assertTrue(entries[0]["plan"])
+        self.assertEqual(len(seen), 1)
+        self.assertFalse([sql for sql in seen if "EXPLAIN" in sql])
+
+        with self.assertRaises(DatabaseError):
+            slowqueries.explain(connection, "SELECT * FROM no_such_table", None)
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_wrapper_added_inside_another_survives_it(self):
+        """
+        Ensure a connection opened while a middleware's execute wrapper is active keeps only the logger
+        """
+        def timer(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        connection.execute_wrappers.remove(slowqueries._wrapper)  # pylint: disable=protected-access
+        with connection.execute_wrapper(timer):
+            # As when the connection is first used halfway through a request
+            slowqueries.install(sender=None, connection=connection)
+
+        self.assertEqual(connection.execute_wrappers, [slowqueries._wrapper])  # pylint: disable=protected-access
+
+    def test_repeated_statements_share_a_fingerprint(self):
+        """
+        Ensure statements differing only in params group together and are explained once
+        """
+        def run():
+            for price in (1, 10, 20):
+                list(Product.objects.filter(price__gte=price, id__in=range(price)))
+
+        entries = self.slow_queries(run)
+
+        self.assertEqual(len({entry["fingerprint"] for entry in entries}), 1)
+        self.assertIn("plan", entries[0])
+        self.assertNotIn("plan", entries[1])
+        self.assertNotIn("plan", entries[2])
+
+    def test_caller_is_the_view(self):
+        """
+        Ensure statements run by a request name the view that ran them
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        entries = self.slow_queries(lambda: self.client.get("/products?min_price=10"))
+
+        self.assertIn("ProductRowSerializer.data", {entry["caller"]["function"] for entry in entries})
+        self.assertTrue([entry for entry in entries
+                         if any(frame.startswith("Products.list (bangazonapi/views/product.py:")
+                                for frame in entry["stack"])])
+
+    def test_log_is_summarized_by_fingerprint(self):
+        """
+        Ensure the slow_queries command groups the JSON log by fingerprint
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "slow_queries.log")
+        handler = slowqueries.LogFileHandler(path, maxBytes=1024 * 1024, backupCount=2)
+        handler.setFormatter(slowqueries.JSONFormatter())
+        logger = logging.getLogger("bangazonapi.slowqueries")
+        handlers = logger.handlers
+        logger.handlers = [handler]
+        try:
+            with self.settings(SLOW_QUERY_MS=1e-6):
+                for price in (1, 10, 20):
+                    list(Product.objects.filter(price__gte=price))
+                list(ProductCategory.objects.all())
+        finally:
+            logger.handlers = handlers
+            handler.close()
+
+        groups = slowqueries.summarize(slowqueries.log_files(path))
+        products = [group for group in groups if "bangazonapi_product" in group["statement"]
+                    and "bangazonapi_productcategory" not in group["statement"]]
+        self.assertEqual(len(products), 1)
+        self.assertEqual(products[0]["count"], 3)
+        self.assertTrue(products[0]["plan"])
+
+        output = io.StringIO()
+        call_command("slow_queries", log=path, json=True, stdout=output)
+        self.assertEqual(len(json.loads(output.getvalue())), len(groups))